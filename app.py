@@ -1,190 +1,90 @@
 import streamlit as st
 import os
-import re
 import json
-import cv2
-import numpy as np
-import google.generativeai as genai
-from PIL import Image
-import pymupdf  # Replaced pdf2image
-import io       # Needed for pymupdf with PIL
 from dotenv import load_dotenv
-import shutil
+from pipeline import (
+    PipelineError, configure_model, extract_official_answers, generate_text_report, grade_student, summarize_results
+)
+from result_cache import DEFAULT_CACHE_DIR, ResultCache, make_key
+from tracing import Tracer
+from page_windows import DEFAULT_WINDOW_OVERLAP, DEFAULT_WINDOW_PAGES, check_window_overlap
+from rendering import DEFAULT_MEMORY_BUDGET_MB, DEFAULT_RENDER_PROFILE, RENDER_PROFILES
+from run_limiter import RunLimiter
+from uploads import UploadManager
 
 # Load environment variables from .env file
 load_dotenv()
 
-# --- IMPROVED Prompts for higher accuracy ---
-MASTER_QNA_PROMPT_STUDENT = """
-You are an expert examination evaluator AI, specialized in accurately transcribing handwritten answers. Your critical task is to match questions from a provided question paper with their corresponding handwritten answers from a set of images and generate a single, structured JSON output.
+# Session uploads (question paper, answer key) nobody has used for this long are deleted and re-uploaded on demand.
+UPLOAD_IDLE_SECONDS = 2 * 3600
 
-You will be given:
-1.  A PDF file containing all the exam questions (`question_paper.pdf`).
-2.  A series of images (`answer_page_X.png`) containing the student's handwritten answers.
 
-**CRITICAL RULES FOR TRANSCRIPTION:**
-
-1.  **Systematic Processing:** You MUST process the question paper systematically, from the first question to the last. For each question (e.g., "Question 6"), locate the corresponding answer in the provided images using question numbers (e.g., "Ans-6", "Question-6") as your primary guide.
-
-2.  **Verbatim Transcription with Self-Correction:** Transcribe the handwritten answer text *exactly* as it appears, preserving all original wording, spelling, and grammar. You MUST double-check your transcription for common character confusion (e.g., 'u' vs 'v', 'a' vs 'o'), especially for critical single-word answers where a small mistake changes the entire meaning. Do not correct any of the student's mistakes.
-
-3.  **Handling Special Cases:**
-    * **Unanswered Questions:** If you cannot find an answer for a question, you MUST set the `answer_text` to the string "Not Answered" and the `status` to "Not Answered".
-    * **Crossed-Out Text:** If any text is visibly struck through or crossed out, you MUST ignore it completely.
-    * **Matching Questions:** For "Match the columns" questions (e.g., Question 4), you MUST break down the answer into sub-parts. Create separate JSON objects for "4 (i)", "4 (ii)", etc. The `question_text` should be the item from the first column (e.g., "Demand schedule"), and the `answer_text` must be the full text of the matched item.
-
-**MANDATORY OUTPUT FORMAT:**
-
--   Your final output must be a single, well-formed JSON array `[...]`.
--   Each element in the array must be a JSON object `{...}` representing one question.
--   Each object must contain these four keys:
-    -   `"question_number"`: The specific number of the question (e.g., "1 (i)", "4 (i)", "12").
-    -   `"question_text"`: The full text of the question.
-    -   `"answer_text"`: The student's transcribed answer. If not answered, this must be the string "Not Answered".
-    -   `"status"`: A status string, either "Answered" or "Not Answered".
-
-**Example JSON Object:**
-{
-    "question_number": "12",
-    "question_text": "What is Barter System?",
-    "answer_text": "Bartering is the direct exchange of one goods with another goods without the use of money For eg for the services of Carpenter or blacksmith of he is given quintal of wheat then it is bartering.",
-    "status": "Answered"
-}
-
-**Final Instruction:** Your entire response must ONLY be the single, raw JSON array. Do not include any introductory text, explanations, notes, or markdown formatting like ` ```json ` in your final output.
-"""
-
-MASTER_QNA_PROMPT_OFFICIAL = """
-You are a meticulous and highly precise data extraction AI. Your primary directive is to create a **COMPLETE** and **VERBATIM** JSON representation of the provided question paper and its official answers.
-
-You will be given:
-1.  `question_paper.pdf`: Contains exam questions.
-2.  `official_answer_key.pdf`: Contains the official answers.
-
-**CRITICAL RULES FOR EXECUTION:**
-
-1.  ***ABSOLUTE COMPLETENESS & VERIFICATION***:
-    -   You **MUST** process **ALL 23 questions** from the `question_paper.pdf`.
-    -   Before finishing, you must perform a final self-check to ensure all 23 questions and their sub-parts are present in your final JSON output.
-
-2.  ***VERBATIM (EXACT) EXTRACTION***:
-    -   All extracted text must be a *character-for-character copy*. Do not translate, summarize, or alter any text.
-
-3.  ***"OR" (अथवा) QUESTION HANDLING***:
-    -   For questions with an 'OR' option, the `question_text` **MUST** include the text for **BOTH** the main question and the 'OR' question.
-
-4.  ***Special Instruction for Matching Questions***:
-    -   For "Match the columns" questions (like Question 4), you **MUST** break it down into sub-parts. Create a separate JSON object for each matched pair, using question numbers like `4 (i)`, `4 (ii)`, etc. The `question_text` for each object should be the full item from the first column of the question paper (e.g., "(i) Demand schedule"), and the `official_answer_text` should be the corresponding matched pair's text from the answer key.
-
-**MANDATORY OUTPUT FORMAT:**
-
--   Your final output must be a single, well-formed JSON array `[...]`.
--   Each object must contain these three keys:
-    -   `"question_number"`: The specific number (e.g., "1 (i)", "4 (i)", "23").
-    -   `"question_text"`: The full English text of the question (and its 'OR' part, if present), copied verbatim.
-    -   `"official_answer_text"`: The full text of the corresponding answer from the answer key, copied verbatim.
-
-Do not add any text, notes, or explanations outside of the final JSON array.
-"""
-
-EVALUATION_PROMPT_TEMPLATE = """
-You are an expert, impartial examiner. Your task is to evaluate a student's answer against the official model answer and provide a score based on semantic correctness.
-
-**Context:**
-- The student's answer and the official answer may be in different languages (e.g., English and Hindi).
-- Your evaluation must be based on the *meaning and core concepts*, not just keyword matching.
-
-**Official Answer:**
----
-{official_answer}
----
-
-**Student's Answer:**
----
-{student_answer}
----
-
-**Your Task:**
-1.  Compare the student's answer to the official answer.
-2.  Provide a numerical score from 0 to 100.
-3.  Provide a brief, one-sentence justification for your score.
+# --- All Helper Functions ---
+@st.cache_resource
+def get_result_cache():
+    return ResultCache()
 
-**Mandatory Output Format:**
-You MUST return your response in a single line with the format: `score|justification`
-**Example:** `90|The student correctly explained the concept but missed one minor detail mentioned in the official answer.`
-"""
 
-
-# --- All Helper Functions ---
-def preprocess_image(image, is_handwritten=True):
-    if len(image.shape) == 3:
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = image
-    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-    adaptive = cv2.adaptiveThreshold(
-        blurred, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 35, 15
-    )
-    adaptive = cv2.bitwise_not(adaptive)
-    if is_handwritten:
-        kernel = np.ones((1, 1), np.uint8)
-        processed = cv2.morphologyEx(adaptive, cv2.MORPH_CLOSE, kernel)
-        return processed
-    return adaptive
-
-def safe_json_loads(text, step_name):
-    match = re.search(r"```json\s*([\s\S]*?)\s*```", text)
-    content_to_parse = match.group(1) if match else text
-    try:
-        start_index = content_to_parse.find('[')
-        end_index = content_to_parse.rfind(']')
-        if start_index != -1 and end_index != -1:
-            json_str = content_to_parse[start_index : end_index + 1]
-            return json.loads(json_str)
-        else:
-            raise json.JSONDecodeError("Could not find JSON array brackets.", content_to_parse, 0)
-    except json.JSONDecodeError:
-        st.error(f"Error during '{step_name}': The AI returned a response that could not be parsed as JSON, even after cleaning.")
-        st.text_area("Malformed AI Response that caused the error:", value=text, height=200)
-        return None
-
-def generate_text_report(results, summary):
-    report_lines = []
-    report_lines.append("======================================================")
-    report_lines.append("         AUTOMATED ANSWER EVALUATION REPORT")
-    report_lines.append("======================================================")
-    report_lines.append("\n--- FINAL SUMMARY ---\n")
-    report_lines.append(f"Total Questions: {summary['total_questions']}")
-    report_lines.append(f"Items Attempted: {summary['answered_count']}")
-    report_lines.append(f"Average Score on Attempted Items: {summary['average_score']:.2f}%\n")
-    report_lines.append("======================================================")
-
-    for item in results:
-        report_lines.append(f"\n\n--- Question {item.get('question_number', 'N/A')} ---")
-        report_lines.append(f"Status: {item.get('status', 'N/A')}")
-        report_lines.append(f"Score: {item.get('score', 'N/A')}%")
-        report_lines.append(f"Justification: {item.get('justification', 'N/A')}\n")
-        report_lines.append("👤 Student's Answer:")
-        report_lines.append(f"{item.get('student_answer', 'Not Answered')}\n")
-        report_lines.append("📚 Official Answer:")
-        report_lines.append(f"{item.get('official_answer', 'N/A')}")
-        report_lines.append("------------------------------------------------------")
-    return "\n".join(report_lines)
+@st.cache_resource
+def get_run_limiter():
+    # Shared by every session on this server: extra grading runs queue instead of competing for memory.
+    return RunLimiter()
 
 
 # --- Main App Logic ---
+# GRADER_BACKEND=replay runs the whole app offline against the recorded outputs.
+replay_backend = os.getenv("GRADER_BACKEND", "gemini") == "replay"
 st.set_page_config(layout="wide", page_title="AI Paper Grader")
 st.title("📄 Automated Examination Paper Grader")
 st.markdown("This app automates the entire paper grading workflow. Upload the required files to begin.")
 
 with st.sidebar:
     st.header("⚙️ Configuration")
-    if os.getenv("GEMINI_API_KEY"):
+    if replay_backend:
+        st.warning("🧪 Replay backend: answers and grades are replayed from the bundled recordings (no API calls).")
+    elif os.getenv("GEMINI_API_KEY"):
         st.success("✅ Gemini API Key loaded from .env file.")
     else:
         st.error("❗️ Gemini API Key not found. Please create a .env file.")
     st.markdown("---")
-    st.info("Files are processed in memory and are not stored on any server.")
+    st.subheader("⚡ Evaluation Speed")
+    eval_workers = st.slider("Parallel evaluation requests", min_value=1, max_value=16, value=4)
+    eval_rpm = st.number_input("Max model requests per minute (0 = unlimited)", min_value=0, max_value=1000, value=60)
+    eval_batch_size = st.number_input("Answers per grading call (1 = one call per answer)", min_value=1, max_value=25, value=1)
+    render_profile = st.selectbox(
+        "Page render profile", options=list(RENDER_PROFILES), index=list(RENDER_PROFILES).index(DEFAULT_RENDER_PROFILE),
+        help="Resolution, colour mode and image encoding of the answer-sheet pages. 'auto' crops blank margins and sends binarised pages as 1-bit PNG."
+    )
+    window_pages = st.number_input(
+        "Answer pages per transcription call (0 = whole sheet)", min_value=0, max_value=100, value=DEFAULT_WINDOW_PAGES,
+        help="Longer answer sheets are split into overlapping page windows that are transcribed in parallel."
+    )
+    window_overlap = st.number_input(
+        "Pages shared by neighbouring windows", min_value=0, max_value=99, value=DEFAULT_WINDOW_OVERLAP,
+        help="Must be smaller than the pages per transcription call."
+    )
+    try:
+        check_window_overlap(window_pages, window_overlap)
+        window_overlap_error = None
+    except ValueError as e:
+        window_overlap_error = str(e)
+        st.error(f"❗️ {window_overlap_error}")
+    use_prescoring = st.checkbox("Auto-score obvious answers locally", value=True, help="Blank answers, true/false and option-letter answers, numbers and exact or near matches of the official answer are scored without a model call; only the rest go to the AI.")
+    use_text_layer = st.checkbox("Read typed answer keys locally", value=True, help="Uses the text layer of born-digital question papers and answer keys; only unreadable pages are sent to the AI.")
+    memory_budget_mb = st.number_input(
+        "Memory budget per grading run (MB)", min_value=256, max_value=16384, value=DEFAULT_MEMORY_BUDGET_MB, step=256,
+        help="Caps the number of page-rendering workers; pages are rendered, uploaded and released one at a time."
+    )
+    use_cache = st.checkbox("Reuse cached AI results", value=True, help="Skips model calls for PDFs, prompts and answers that were already processed.")
+    st.markdown("---")
+    if use_cache:
+        st.info(
+            "Files are processed in memory. AI results for them (transcribed answers, official answers and grades) "
+            f"are saved on this server in `{DEFAULT_CACHE_DIR}/` so later runs can reuse them. "
+            "Untick **Reuse cached AI results** to keep nothing, or use **Clear cache** to delete them."
+        )
+    else:
+        st.info("Files are processed in memory and are not stored on any server.")
 
 st.header("1. Upload Required PDFs")
 col1, col2, col3 = st.columns(3)
@@ -195,132 +95,137 @@ answer_key_pdf_file = col3.file_uploader("Upload Official Answer Key", type="pdf
 if st.button("🚀 Grade Paper", type="primary"):
     if not all([student_pdf_file, question_pdf_file, answer_key_pdf_file]):
         st.warning("Please upload all three PDF files.")
-    elif not os.getenv("GEMINI_API_KEY"):
+    elif not replay_backend and not os.getenv("GEMINI_API_KEY"):
         st.error("Cannot proceed without a Gemini API Key in the .env file.")
+    elif window_overlap_error:
+        st.error(f"Cannot grade with these page windows: {window_overlap_error}")
     else:
         # Clear previous results before starting a new run
-        for key in ['final_results', 'student_qna_data', 'official_qna_data']:
+        for key in ['final_results', 'student_qna_data', 'official_qna_data', 'timings', 'trace']:
             if key in st.session_state:
                 del st.session_state[key]
 
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-        model = genai.GenerativeModel("gemini-1.5-pro-latest")
-        temp_dir = "temp_processing"
-        if os.path.exists(temp_dir): shutil.rmtree(temp_dir)
-        os.makedirs(temp_dir)
+        model = configure_model()
+        cache = get_result_cache() if use_cache else None
+        # One upload manager per browser session: the question paper and answer key are uploaded once and reused
+        # for every student of the same exam. A different exam releases the previous one's files.
+        if 'upload_manager' not in st.session_state:
+            st.session_state.upload_manager = UploadManager(upload_file=model.upload_file, delete_file=model.delete_file)
+        uploads = st.session_state.upload_manager
+        exam_key = make_key(question_pdf_file.getvalue(), answer_key_pdf_file.getvalue())
+        if st.session_state.get('upload_exam_key') not in (None, exam_key):
+            uploads.release_kept()
+        st.session_state.upload_exam_key = exam_key
+        uploads.cleanup(idle_seconds=UPLOAD_IDLE_SECONDS)
+        timings = {}
+        tracer = Tracer("grading")
+        st.session_state.trace = tracer
+
+        queue_notice = st.empty()
+
+        def show_queue_position(position):
+            queue_notice.info(f"⏳ The server is busy with other grading runs. Waiting for a free slot ({position} run(s) ahead of you)...")
 
         try:
-            with st.spinner("Grading in progress... This may take several minutes."):
-                # Step 1: Preprocess Student's PDF
-                st.info("Step 1/5: Converting and cleaning student's answer sheet...")
-
-                # --- UPGRADED PDF CONVERSION USING PYMUPDF ---
-                pdf_bytes = student_pdf_file.getvalue()
-                doc = pymupdf.open(stream=pdf_bytes, filetype="pdf")
-                student_images_pil = []
-                for page in doc:
-                    pix = page.get_pixmap()
-                    img_data = pix.tobytes("png")
-                    pil_image = Image.open(io.BytesIO(img_data))
-                    student_images_pil.append(pil_image)
-                doc.close()
-                # --- END OF UPGRADE ---
-
-                preprocessed_paths = [os.path.join(temp_dir, f"page_{i+1}.png") for i in range(len(student_images_pil))]
-                for i, pil_image in enumerate(student_images_pil):
-                    cv_img = np.array(pil_image)[:, :, ::-1].copy()
-                    processed_cv_img = preprocess_image(cv_img)
-                    Image.fromarray(processed_cv_img).save(preprocessed_paths[i])
-
-                # Step 2: Extract Student's Answers
-                st.info("Step 2/5: Reading student's answers using AI...")
-                temp_question_path = os.path.join(temp_dir, "question.pdf")
-                with open(temp_question_path, "wb") as f: f.write(question_pdf_file.getvalue())
-
-                parts = [MASTER_QNA_PROMPT_STUDENT, genai.upload_file(path=temp_question_path)]
-                for path in preprocessed_paths: parts.append(genai.upload_file(path=path))
-
-                response = model.generate_content(parts)
-                student_qna_data = safe_json_loads(response.text, "Student Answer Extraction")
-                if not student_qna_data: st.stop()
-                st.session_state.student_qna_data = student_qna_data
-
-                # Step 3: Extract Official Answers
-                st.info("Step 3/5: Reading official answers using AI...")
-                temp_answer_key_path = os.path.join(temp_dir, "answer_key.pdf")
-                with open(temp_answer_key_path, "wb") as f: f.write(answer_key_pdf_file.getvalue())
-
-                parts = [MASTER_QNA_PROMPT_OFFICIAL, genai.upload_file(path=temp_question_path), genai.upload_file(path=temp_answer_key_path)]
-                response = model.generate_content(parts)
-                official_qna_data = safe_json_loads(response.text, "Official Answer Extraction")
-                if not official_qna_data: st.stop()
+            with get_run_limiter().slot(on_wait=show_queue_position), \
+                    st.spinner("Grading in progress... This may take several minutes."):
+                queue_notice.empty()
+                question_pdf_bytes = question_pdf_file.getvalue()
+                # Official answers first, so each student answer can be graded as soon as it is transcribed.
+                official_qna_data = extract_official_answers(
+                    model, question_pdf_bytes, answer_key_pdf_file.getvalue(), cache=cache, uploads=uploads,
+                    on_step=st.info, timings=timings, use_text_layer=use_text_layer, tracer=tracer
+                )
                 st.session_state.official_qna_data = official_qna_data
 
-                # Step 4: Evaluate Answers
-                st.info("Step 4/5: Evaluating answers one by one...")
-                official_map = {item['question_number']: item for item in official_qna_data}
-                merged_data = []
-                for s_item in student_qna_data:
-                    q_num = s_item['question_number']
-                    if q_num in official_map:
-                        merged_data.append({
-                            "question_number": q_num,
-                            "question_text": official_map[q_num].get("question_text", "N/A"),
-                            "official_answer": official_map[q_num].get("official_answer_text", ""),
-                            "student_answer": s_item.get("answer_text", ""),
-                            "status": s_item.get("status", "Not Answered")
-                        })
-
-                evaluated_results = []
-                progress_bar = st.progress(0, text="Starting evaluation...")
-                for i, item in enumerate(merged_data):
-                    progress_bar.progress((i + 1) / len(merged_data), text=f"Evaluating Question {item['question_number']}...")
-                    if item["status"] != "Answered" or not item["student_answer"] or item["student_answer"] == "Not Answered":
-                        item["score"], item["justification"] = 0, "Question was not answered by the student."
-                    else:
-                        prompt = EVALUATION_PROMPT_TEMPLATE.format(official_answer=item["official_answer"], student_answer=item["student_answer"])
-                        try:
-                            response = model.generate_content(prompt)
-                            parts = response.text.strip().split('|')
-                            if len(parts) == 2:
-                                item["score"] = int(re.sub(r'[^0-9]', '', parts[0]))
-                                item["justification"] = parts[1].strip()
-                            else:
-                                item["score"], item["justification"] = -1, "AI response was not in the expected 'score|justification' format."
-                        except Exception as e:
-                            item["score"], item["justification"] = -1, f"AI evaluation failed: {e}"
-                    evaluated_results.append(item)
-
-                # Step 5: Finalize and Store Results
-                st.info("Step 5/5: Compiling the final report...")
+                progress_bar = st.progress(0, text="Waiting for the first answers...")
+
+                def update_progress(done, total, item):
+                    progress_bar.progress(done / total, text=f"Evaluated Question {item['question_number']} ({done}/{total})...")
+
+                graded = grade_student(
+                    model, student_pdf_file.getvalue(), question_pdf_bytes, official_qna_data, cache=cache,
+                    uploads=uploads, max_workers=eval_workers, requests_per_minute=eval_rpm,
+                    batch_size=eval_batch_size, render_profile=render_profile, on_step=st.info,
+                    on_progress=update_progress, window_pages=window_pages, window_overlap=window_overlap, memory_budget_mb=memory_budget_mb,
+                    prescore=use_prescoring, tracer=tracer
+                )
+                st.session_state.student_qna_data = graded["student_qna_data"]
+                evaluated_results, batch_stats = graded["results"], graded["batch_stats"]
+                for stage, seconds in graded["timings"].items():
+                    timings[stage] = timings.get(stage, 0.0) + seconds
+                prescore_stats = graded["prescore_stats"]
+                if prescore_stats and prescore_stats["checked"]:
+                    st.info(
+                        f"Local pre-scoring graded {prescore_stats['auto_scored']} of {prescore_stats['checked']} answers "
+                        f"({prescore_stats['matched']} matches, {prescore_stats['mismatched']} clear mismatches, "
+                        f"{prescore_stats['blank']} blank), avoiding {prescore_stats['auto_scored']} model calls; "
+                        f"{prescore_stats['sent_to_model']} answers were graded by the AI."
+                    )
+                if batch_stats:
+                    st.info(
+                        f"Batch grading used {batch_stats['calls']} model calls instead of {batch_stats['per_item_calls']} "
+                        f"(saved {batch_stats['calls_saved']} calls and ~{batch_stats['prompt_tokens_saved']} prompt tokens; "
+                        f"{batch_stats['regraded_individually']} answers re-graded individually)."
+                    )
+
                 st.session_state.final_results = evaluated_results
+                st.session_state.timings = timings
 
             st.success("✅ Grading complete! View and download the report below.")
+        except PipelineError as e:
+            st.error(f"{e}")
+            if e.raw_response:
+                st.text_area("Malformed AI Response that caused the error:", value=e.raw_response, height=200)
         except Exception as e:
             st.error(f"An unexpected error occurred during the workflow: {e}")
-        finally:
-            if os.path.exists(temp_dir): shutil.rmtree(temp_dir)
+
+# --- Cache Statistics (rendered after grading so the counters are current) ---
+with st.sidebar:
+    st.markdown("---")
+    st.subheader("🗄️ Result Cache")
+    cache_stats = get_result_cache().stats()
+    c1, c2 = st.columns(2)
+    c1.metric("Hits", cache_stats["hits"])
+    c2.metric("Misses", cache_stats["misses"])
+    st.caption(
+        f"Saved ~{cache_stats['bytes_saved'] / 1024:.1f} KB of model input · "
+        f"{cache_stats['entries']} entries ({cache_stats['size_bytes'] / 1024:.1f} KB on disk)"
+    )
+    if st.button("Clear cache"):
+        get_result_cache().clear()
+        st.rerun()
+    run_status = get_run_limiter().status()
+    st.caption(f"Grading runs on this server: {run_status['running']}/{run_status['max_runs']} running, {run_status['waiting']} queued")
+
+    # --- Per-stage timing of the last run (also shown for failed runs) ---
+    if 'trace' in st.session_state:
+        st.markdown("---")
+        st.subheader("⏱️ Last Run Timing")
+        trace = st.session_state.trace
+        stages = trace.summarize()
+        st.dataframe([
+            {
+                "Stage": stage,
+                "Calls": totals["count"],
+                "Seconds": round(totals["seconds"], 2),
+                "KB sent": round(totals.get("bytes_sent", 0) / 1024, 1),
+                "Tokens in/out": f"{totals.get('prompt_tokens', 0)}/{totals.get('response_tokens', 0)}",
+                "Retries": totals.get("retries", 0),
+                "Cache hits": totals.get("cache_hit", 0),
+            }
+            for stage, totals in stages.items()
+        ], hide_index=True)
+        st.caption("Stages overlap (pages upload while others render, answers are graded while the rest are read), so seconds are summed per stage, not end to end.")
+        d1, d2 = st.columns(2)
+        d1.download_button("Spans (.jsonl)", data=trace.to_jsonl(), file_name="grading_trace.jsonl", mime="application/json")
+        d2.download_button("Chrome trace", data=trace.to_chrome_trace(), file_name="grading_trace.trace.json", mime="application/json")
 
 # --- Display Results ---
 if 'final_results' in st.session_state:
     results = st.session_state.final_results
 
-    unique_question_numbers = set()
-    for item in results:
-        q_num = item.get('question_number', 'N/A')
-        base_q_num = q_num.split(' ')[0].split('(')[0]
-        if base_q_num:
-            unique_question_numbers.add(base_q_num)
-    total_unique_questions = len(unique_question_numbers)
-
-    answered_count = sum(1 for item in results if item['status'] == 'Answered' and item.get('score', -1) >= 0)
-    total_score = sum(item.get('score', 0) for item in results if item['status'] == 'Answered' and item.get('score', -1) >= 0)
-    average_score = (total_score / answered_count) if answered_count > 0 else 0
-    summary = {
-        "total_questions": total_unique_questions,
-        "answered_count": answered_count,
-        "average_score": average_score
-    }
+    summary = summarize_results(results)
 
     st.header("2. Evaluation Report")
     st.markdown("---")
@@ -331,6 +236,12 @@ if 'final_results' in st.session_state:
     m2.metric("Items Attempted", f"{summary['answered_count']}")
     m3.metric("Average Score (on attempted)", f"{summary['average_score']:.2f}%", delta_color="off")
 
+    timings = st.session_state.get('timings')
+    if timings:
+        st.caption("⏱️ Time spent per stage (stages skipped thanks to the cache are omitted): " + " · ".join(
+            f"{stage.capitalize()}: {seconds:.1f}s" for stage, seconds in timings.items()
+        ))
+
      # --- NEW: Interactive Q&A Section ---
     st.markdown("---")
     st.header("3. 💬 Ask About a Specific Question")
@@ -0,0 +1,203 @@
+"""Model backends: what the pipeline needs from a model provider.
+
+A backend exposes ``model_name``, ``generate_content(contents, stream=False)``
+returning an object with ``.text`` (or an iterator of such chunks when
+streaming), and ``upload_file`` / ``delete_file`` for the ``UploadManager``.
+
+- ``GeminiBackend`` calls the Gemini API.
+- ``ReplayBackend`` serves recorded responses locally with configurable
+  latency, injected errors and truncated streams, so the whole pipeline can
+  be run and benchmarked without spending API quota.
+"""
+import hashlib
+import io
+import json
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+# Mean simulated seconds per call kind; "transcribe" also adds per_page for every uploaded page.
+DEFAULT_REPLAY_LATENCY = {
+    "transcribe": 4.0,
+    "per_page": 0.25,
+    "official": 3.0,
+    "evaluate": 0.5,
+    "evaluate_batch": 1.0,
+    "upload": 0.05,
+}
+REPLAY_CHUNK_CHARS = 400    # size of each streamed chunk
+TIME_TO_FIRST_CHUNK = 0.3   # share of a streamed call's latency spent before the first chunk
+TOKENS_PER_FILE = 258       # Gemini's prompt-token count for one image, used for the replayed usage metadata
+
+
+class ModelBackend:
+    """Interface shared by all backends."""
+
+    model_name = ""
+
+    def generate_content(self, contents, stream=False):
+        raise NotImplementedError
+
+    def upload_file(self, path, mime_type, display_name):
+        raise NotImplementedError
+
+    def delete_file(self, name):
+        raise NotImplementedError
+
+
+class GeminiBackend(ModelBackend):
+    def __init__(self, model_name, api_key=None):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.genai = genai
+        self.model = genai.GenerativeModel(model_name)
+        self.model_name = self.model.model_name
+
+    def generate_content(self, contents, stream=False):
+        if stream:
+            return self.model.generate_content(contents, stream=True)
+        return self.model.generate_content(contents)
+
+    def upload_file(self, path, mime_type, display_name):
+        return self.genai.upload_file(path=path, mime_type=mime_type, display_name=display_name)
+
+    def delete_file(self, name):
+        self.genai.delete_file(name)
+
+
+class ReplayError(Exception):
+    """An injected API error; ``code`` makes it look like a retryable HTTP error."""
+
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class ReplayBackend(ModelBackend):
+    """Offline backend answering from recorded pipeline outputs.
+
+    - Student transcription prompts get ``student_answers`` (only the
+      requested question numbers for a follow-up request).
+    - Official answer prompts get ``official_answers``.
+    - Grading prompts get ``grades[question_number]`` (``(score,
+      justification)``) when the official answer can be traced back to a
+      question, otherwise a score derived from a hash of the prompt, so
+      replies are deterministic.
+
+    Every call sleeps for its ``latency`` (scaled by ``latency_scale``, with
+    +/- ``jitter``), raises a retryable ``ReplayError`` with probability
+    ``error_rate`` and, when streaming, breaks off mid-reply with probability
+    ``truncate_rate``.
+    """
+
+    def __init__(self, student_answers, official_answers, grades=None, model_name="replay",
+                 latency=None, latency_scale=1.0, jitter=0.2, error_rate=0.0, error_code=503,
+                 truncate_rate=0.0, seed=None):
+        self.model_name = model_name
+        self.student_answers = student_answers
+        self.official_answers = official_answers
+        self.grades = grades or {}
+        self.question_of_answer = {
+            item["official_answer_text"].strip(): item["question_number"] for item in official_answers
+        }
+        self.latency = {**DEFAULT_REPLAY_LATENCY, **(latency or {})}
+        self.latency_scale = latency_scale
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.truncate_rate = truncate_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.uploaded = 0
+        self.stats = {"calls": 0, "errors": 0, "truncated": 0, "uploads": 0}
+
+    def _roll(self):
+        with self.lock:
+            return self.random.random()
+
+    def _delay(self, kind, extra=0.0):
+        seconds = (self.latency[kind] + extra) * self.latency_scale
+        return max(0.0, seconds * (1 + self.jitter * (2 * self._roll() - 1)))
+
+    def _count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    # --- Requests ---
+    def _classify(self, contents):
+        prompt = "\n".join(part for part in (contents if isinstance(contents, list) else [contents]) if isinstance(part, str))
+        files = sum(1 for part in (contents if isinstance(contents, list) else []) if not isinstance(part, str))
+        if "Items to Evaluate" in prompt:
+            return "evaluate_batch", prompt, files
+        if "Official Answer:" in prompt:
+            return "evaluate", prompt, files
+        if "official_answer_key.pdf" in prompt:
+            return "official", prompt, files
+        return "transcribe", prompt, files
+
+    def _grade(self, official_answer, prompt):
+        q_num = self.question_of_answer.get(official_answer.strip())
+        if q_num in self.grades:
+            return self.grades[q_num]
+        score = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest(), 16) % 101
+        return score, "Replayed grade (no recording for this answer)."
+
+    def _reply(self, kind, prompt):
+        if kind == "evaluate":
+            official = re.search(r"\*\*Official Answer:\*\*\s*---\n(.*?)\n---", prompt, re.S)
+            score, justification = self._grade(official.group(1) if official else "", prompt)
+            return f"{score}|{justification}"
+        if kind == "evaluate_batch":
+            graded = []
+            for item in json.loads(re.search(r"---\n(\[.*\])\n---", prompt, re.S).group(1)):
+                score, justification = self._grade(item["official_answer"], json.dumps(item, ensure_ascii=False))
+                graded.append({"question_number": item["question_number"], "score": score, "justification": justification})
+            return json.dumps(graded, ensure_ascii=False)
+        answers = self.official_answers if kind == "official" else self.student_answers
+        requested = re.search(r"these question numbers: (.+)", prompt)
+        if requested:
+            wanted = {q.strip() for q in requested.group(1).split(",")}
+            answers = [item for item in answers if item["question_number"] in wanted]
+        return json.dumps(answers, indent=4, ensure_ascii=False)
+
+    def generate_content(self, contents, stream=False):
+        kind, prompt, files = self._classify(contents)
+        self._count("calls")
+        delay = self._delay(kind, self.latency["per_page"] * files if kind == "transcribe" else 0.0)
+        if self._roll() < self.error_rate:
+            time.sleep(delay * TIME_TO_FIRST_CHUNK)
+            self._count("errors")
+            raise ReplayError(self.error_code, "Injected replay backend error.")
+        text = self._reply(kind, prompt)
+        usage = SimpleNamespace(prompt_token_count=max(1, len(prompt) // 4) + TOKENS_PER_FILE * files,
+                                candidates_token_count=max(1, len(text) // 4))
+        if not stream:
+            time.sleep(delay)
+            return SimpleNamespace(text=text, usage_metadata=usage)
+        time.sleep(delay * TIME_TO_FIRST_CHUNK)
+        return self._stream(text, delay * (1 - TIME_TO_FIRST_CHUNK), usage, self._roll() < self.truncate_rate)
+
+    def _stream(self, text, seconds, usage, truncate):
+        chunks = [text[i:i + REPLAY_CHUNK_CHARS] for i in range(0, len(text), REPLAY_CHUNK_CHARS)] or [""]
+        cut = len(chunks) // 2 if truncate else None
+        for i, chunk in enumerate(chunks):
+            if i == cut:
+                self._count("truncated")
+                raise ReplayError(self.error_code, "Injected stream interruption.")
+            time.sleep(seconds / len(chunks))
+            yield SimpleNamespace(text=chunk, usage_metadata=usage if i == len(chunks) - 1 else None)
+
+    # --- Files ---
+    def upload_file(self, path, mime_type, display_name):
+        size = len(path.getvalue()) if isinstance(path, io.BytesIO) else 0
+        time.sleep(self._delay("upload"))
+        with self.lock:
+            self.uploaded += 1
+            self.stats["uploads"] += 1
+            name = f"files/replay-{self.uploaded}"
+        return SimpleNamespace(name=name, display_name=display_name, mime_type=mime_type, size_bytes=size)
+
+    def delete_file(self, name):
+        pass
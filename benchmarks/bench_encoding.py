@@ -0,0 +1,91 @@
+"""Benchmark page-image payload size and encode time for each render profile.
+
+Usage:
+    python benchmarks/bench_encoding.py                  # bundled pdf_pages/ and preprocessed_pages/
+    python benchmarks/bench_encoding.py --pdf 2.pdf      # also render a PDF through each profile
+
+Sample sets:
+- pdf_pages:          raw page renders; each profile's colour mode, size cap and crop are applied.
+- preprocessed_pages: already binarised pages; only cropping and encoding are applied.
+Skipped blank pages count towards the per-page averages with zero bytes.
+- <pdf>:              pages rendered from the PDF at each profile's resolution.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cv2  # noqa: E402
+import pymupdf  # noqa: E402
+
+from rendering import RENDER_PROFILES, crop_to_content, encode_image, prepare_image, render_page  # noqa: E402
+
+
+def load_samples(folder):
+    paths = sorted(glob.glob(os.path.join(ROOT, folder, "*")))
+    images = []
+    for path in paths:
+        image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if image is not None:
+            images.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB) if image.ndim == 3 else image)
+    return images
+
+
+def cap_size(image, profile):
+    """Apply the profile's pixel cap to an already rasterised sample (its DPI cannot be changed)."""
+    max_long_side = profile.get("max_long_side")
+    if not max_long_side or max(image.shape[:2]) <= max_long_side:
+        return image
+    scale = max_long_side / max(image.shape[:2])
+    return cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+def measure(pages, profile, prepare):
+    total_bytes, encode_seconds, prepare_seconds = 0, 0.0, 0.0
+    for page in pages:
+        start = time.perf_counter()
+        image, blank = prepare(page, profile)
+        prepared = time.perf_counter()
+        prepare_seconds += prepared - start
+        if blank and profile.get("skip_blank"):
+            continue  # never encoded or uploaded
+        data, _ = encode_image(image, profile)
+        encode_seconds += time.perf_counter() - prepared
+        total_bytes += len(data)
+    count = max(1, len(pages))
+    return total_bytes / count, 1000 * prepare_seconds / count, 1000 * encode_seconds / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pdf", help="Also render this PDF through every profile.")
+    parser.add_argument("--profile", action="append", choices=list(RENDER_PROFILES), help="Profiles to test (default: all).")
+    args = parser.parse_args()
+    profiles = args.profile or list(RENDER_PROFILES)
+
+    sample_sets = {
+        "pdf_pages": (load_samples("pdf_pages"), lambda image, profile: prepare_image(cap_size(image, profile), profile)),
+        "preprocessed_pages": (
+            load_samples("preprocessed_pages"),
+            lambda image, profile: (crop_to_content(cap_size(image, profile)) if profile.get("crop") else cap_size(image, profile), False),
+        ),
+    }
+    if args.pdf:
+        doc = pymupdf.open(args.pdf)
+        sample_sets[os.path.basename(args.pdf)] = (
+            list(doc), lambda page, profile: prepare_image(render_page(page, profile), profile)
+        )
+
+    print(f"{'sample set':<20}{'profile':<14}{'pages':>6}{'KB/page':>10}{'prepare ms':>12}{'encode ms':>11}")
+    for set_name, (pages, prepare) in sample_sets.items():
+        for name in profiles:
+            kb_per_page, prepare_ms, encode_ms = measure(pages, RENDER_PROFILES[name], prepare)
+            print(f"{set_name:<20}{name:<14}{len(pages):>6}{kb_per_page / 1024:>10.1f}{prepare_ms:>12.1f}{encode_ms:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Check that peak memory of Steps 1-2 stays flat as the answer sheet grows.
+
+Usage:
+    python benchmarks/bench_memory.py                        # 8, 32 and 128 pages built from 2.pdf
+    python benchmarks/bench_memory.py --pages 16 --pages 256 --render-workers 4
+    python benchmarks/bench_memory.py --memory-budget-mb 512 --tolerance 0.1
+
+Each page count runs in a fresh subprocess that renders, preprocesses,
+encodes and uploads every page of a synthetic answer sheet (the pages of
+2.pdf repeated, each stamped with its number so no upload is de-duplicated)
+and transcribes it with the offline ``ReplayBackend``. Peak RSS is the
+parent's peak plus the largest render worker's peak.
+
+Exits with 1 if the peak for the largest sheet exceeds the peak for the
+smallest by more than ``--tolerance``. ``tests/test_memory.py`` runs the
+same check on shorter sheets as part of the test suite.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_PAGES = [8, 32, 128]
+
+
+def synthetic_sheet(pdf_bytes, pages):
+    """An answer sheet of ``pages`` pages: the pages of ``pdf_bytes`` repeated and numbered."""
+    import pymupdf
+
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as source, pymupdf.open() as doc:
+        while doc.page_count < pages:
+            doc.insert_pdf(source, to_page=min(source.page_count, pages - doc.page_count) - 1)
+        for page in doc:
+            page.insert_text((36, 36), f"Synthetic page {page.number + 1}", fontsize=14)
+        # garbage=4 merges the repeated page images, so the PDF itself barely grows with the page count.
+        return doc.tobytes(garbage=4, deflate=True)
+
+
+def peak_rss_mb():
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return (own + children) / scale
+
+
+def child_main(args, pages):
+    from pipeline import iter_student_answers, load_replay_backend
+
+    with open(args.student_pdf, "rb") as f:
+        sheet = synthetic_sheet(f.read(), pages)
+    with open(args.question_paper, "rb") as f:
+        question_pdf_bytes = f.read()
+    model = load_replay_backend(latency_scale=args.latency_scale, seed=0)
+    start = time.perf_counter()
+    answers = sum(1 for _ in iter_student_answers(
+        model, sheet, question_pdf_bytes, render_workers=args.render_workers, render_profile=args.render_profile,
+        memory_budget_mb=args.memory_budget_mb
+    ))
+    print(json.dumps({
+        "pages": pages,
+        "pdf_mb": len(sheet) / (1024 * 1024),
+        "answers": answers,
+        "uploads": model.stats["uploads"],
+        "seconds": time.perf_counter() - start,
+        "peak_rss_mb": peak_rss_mb(),
+    }))
+
+
+def measure(pages, child_args=()):
+    """Run Steps 1-2 on a ``pages``-page sheet in a fresh process; returns its results (incl. ``peak_rss_mb``)."""
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", str(pages), *child_args],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def rss_growth(results):
+    """Relative growth of peak RSS from the first (smallest) to the last (largest) result."""
+    return (results[-1]["peak_rss_mb"] - results[0]["peak_rss_mb"]) / results[0]["peak_rss_mb"]
+
+
+def main():
+    from rendering import DEFAULT_MEMORY_BUDGET_MB, DEFAULT_RENDER_PROFILE, RENDER_PROFILES
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, action="append", help=f"Sheet length to measure (repeatable, default: {DEFAULT_PAGES}).")
+    parser.add_argument("--student-pdf", default=os.path.join(ROOT, "2.pdf"))
+    parser.add_argument("--question-paper", default=os.path.join(ROOT, "2 - question.pdf"))
+    parser.add_argument("--render-workers", type=int, help="Render processes (default: one per CPU, within the memory budget).")
+    parser.add_argument("--render-profile", choices=list(RENDER_PROFILES), default=DEFAULT_RENDER_PROFILE)
+    parser.add_argument("--memory-budget-mb", type=int, default=DEFAULT_MEMORY_BUDGET_MB)
+    parser.add_argument("--latency-scale", type=float, default=0.05, help="Multiplier for the simulated model latency.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative growth of peak RSS (default: 0.2).")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child_main(args, args.child)
+        return
+
+    child_args = [
+        "--student-pdf", args.student_pdf, "--question-paper", args.question_paper,
+        "--render-profile", args.render_profile, "--memory-budget-mb", str(args.memory_budget_mb),
+        "--latency-scale", str(args.latency_scale),
+    ] + (["--render-workers", str(args.render_workers)] if args.render_workers else [])
+    results = []
+    print(f"{'pages':>6}{'pdf MB':>8}{'uploads':>9}{'total s':>10}{'peak RSS MB':>14}")
+    for pages in sorted(args.pages or DEFAULT_PAGES):
+        result = measure(pages, child_args)
+        results.append(result)
+        print(f"{result['pages']:>6}{result['pdf_mb']:>8.1f}{result['uploads']:>9}{result['seconds']:>10.2f}"
+              f"{result['peak_rss_mb']:>14.1f}")
+
+    smallest, largest = results[0], results[-1]
+    growth = rss_growth(results)
+    if growth > args.tolerance:
+        print(f"FAIL peak RSS grew {growth:+.0%} from {smallest['pages']} to {largest['pages']} pages "
+              f"(allowed {args.tolerance:+.0%})")
+        sys.exit(1)
+    print(f"OK peak RSS grew {growth:+.0%} from {smallest['pages']} to {largest['pages']} pages")
+
+
+if __name__ == "__main__":
+    main()
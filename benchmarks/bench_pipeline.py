@@ -0,0 +1,183 @@
+"""End-to-end grading benchmark against the offline replay backend.
+
+Usage:
+    python benchmarks/bench_pipeline.py                          # 8 synthetic students from 2.pdf
+    python benchmarks/bench_pipeline.py --students 40 --workers 8 --latency-scale 0.5
+    python benchmarks/bench_pipeline.py --error-rate 0.05 --truncate-rate 0.1
+    python benchmarks/bench_pipeline.py --save baseline.json     # record a baseline
+    python benchmarks/bench_pipeline.py --baseline baseline.json # regression gate (exit code 1 on regression)
+
+Every synthetic student is the sample answer sheet with a per-student stamp
+on each page, so pages really are rendered, preprocessed, encoded and
+uploaded for each student (nothing is de-duplicated or cached). Model calls
+go to ``ReplayBackend``: recorded answers and grades with simulated latency
+and optional injected errors, so no API quota is used.
+
+Reports papers/minute, p50/p95 per-paper latency, p50/p95 time per stage
+(summed per paper from the run's traces) and peak RSS.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pymupdf  # noqa: E402
+
+from evaluation import TokenBucket  # noqa: E402
+from pipeline import extract_official_answers, grade_student, load_replay_backend  # noqa: E402
+from rendering import DEFAULT_RENDER_PROFILE, RENDER_PROFILES  # noqa: E402
+from tracing import Tracer  # noqa: E402
+from uploads import UploadManager  # noqa: E402
+
+GATED_METRICS = {  # metric -> direction that counts as a regression
+    "papers_per_minute": "lower",
+    "paper_seconds_p95": "higher",
+    "peak_rss_mb": "higher",
+}
+
+
+def synthetic_students(pdf_bytes, count, max_pages=None):
+    """``count`` copies of the answer sheet, each page stamped with the student's number."""
+    students = []
+    for n in range(count):
+        with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+            if max_pages:
+                doc.select(list(range(min(max_pages, doc.page_count))))
+            for page in doc:
+                page.insert_text((36, 36), f"Synthetic student {n + 1}", fontsize=14)
+            students.append(doc.tobytes())
+    return students
+
+
+def percentile(values, share):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(share * (len(ordered) - 1)))]
+
+
+def peak_rss_mb():
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return (own + children) / scale
+
+
+def run(args):
+    with open(args.student_pdf, "rb") as f:
+        sheet = f.read()
+    with open(args.question_paper, "rb") as f:
+        question_pdf_bytes = f.read()
+    with open(args.answer_key, "rb") as f:
+        answer_key_pdf_bytes = f.read()
+    students = synthetic_students(sheet, args.students, args.pages)
+
+    model = load_replay_backend(latency_scale=args.latency_scale, error_rate=args.error_rate,
+                                truncate_rate=args.truncate_rate, seed=args.seed)
+    rate_limiter = TokenBucket(args.rpm, burst=args.eval_workers) if args.rpm else None
+    render_workers = args.render_workers or max(1, (os.cpu_count() or 1) // max(1, args.workers))
+
+    with UploadManager(upload_file=model.upload_file, delete_file=model.delete_file, max_workers=args.upload_workers) as uploads:
+        official_qna_data = extract_official_answers(
+            model, question_pdf_bytes, answer_key_pdf_bytes, uploads=uploads, rate_limiter=rate_limiter
+        )
+
+        def grade(student_pdf_bytes):
+            tracer = Tracer()
+            start = time.perf_counter()
+            graded = grade_student(
+                model, student_pdf_bytes, question_pdf_bytes, official_qna_data, uploads=uploads,
+                max_workers=args.eval_workers, batch_size=args.batch_size, rate_limiter=rate_limiter,
+                render_workers=render_workers, render_profile=args.render_profile, tracer=tracer
+            )
+            return time.perf_counter() - start, tracer.summarize(), len(graded["results"])
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            runs = list(pool.map(grade, students))
+        wall_seconds = time.perf_counter() - start
+
+    stage_seconds = {}
+    for _, stages, _ in runs:
+        for stage, totals in stages.items():
+            stage_seconds.setdefault(stage, []).append(totals["seconds"])
+    paper_seconds = [seconds for seconds, _, _ in runs]
+    return {
+        "students": args.students,
+        "graded_items": sum(items for _, _, items in runs),
+        "wall_seconds": wall_seconds,
+        "papers_per_minute": 60 * len(runs) / wall_seconds,
+        "paper_seconds_p50": percentile(paper_seconds, 0.5),
+        "paper_seconds_p95": percentile(paper_seconds, 0.95),
+        "stages": {
+            stage: {"p50": percentile(values, 0.5), "p95": percentile(values, 0.95)}
+            for stage, values in stage_seconds.items()
+        },
+        "backend": dict(model.stats),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def check_regressions(result, baseline, tolerance):
+    failures = []
+    for metric, direction in GATED_METRICS.items():
+        before, after = baseline.get(metric), result[metric]
+        if not before:
+            continue
+        change = (after - before) / before
+        if (direction == "lower" and change < -tolerance) or (direction == "higher" and change > tolerance):
+            failures.append(f"{metric}: {before:.2f} -> {after:.2f} ({change:+.0%})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=8, help="Synthetic students to grade (default: 8).")
+    parser.add_argument("--student-pdf", default=os.path.join(ROOT, "2.pdf"))
+    parser.add_argument("--question-paper", default=os.path.join(ROOT, "2 - question.pdf"))
+    parser.add_argument("--answer-key", default=os.path.join(ROOT, "2 - answer.pdf"))
+    parser.add_argument("--pages", type=int, help="Use only the first N pages of the answer sheet.")
+    parser.add_argument("--workers", type=int, default=4, help="Students graded at the same time (default: 4).")
+    parser.add_argument("--eval-workers", type=int, default=4)
+    parser.add_argument("--render-workers", type=int)
+    parser.add_argument("--upload-workers", type=int, default=8)
+    parser.add_argument("--render-profile", choices=list(RENDER_PROFILES), default=DEFAULT_RENDER_PROFILE)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--rpm", type=int, default=0, help="Shared requests-per-minute limit, 0 = unlimited (default: 0).")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplier for the simulated model latency.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of model calls failing with a retryable 503.")
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="Share of streamed replies cut off halfway.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="Write the results as JSON (e.g. to use as a baseline).")
+    parser.add_argument("--baseline", help="Compare with a saved result and exit with 1 on a regression.")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative regression (default: 0.15).")
+    args = parser.parse_args()
+
+    result = run(args)
+    print(f"{result['students']} papers in {result['wall_seconds']:.1f}s: {result['papers_per_minute']:.1f} papers/min, "
+          f"per paper p50 {result['paper_seconds_p50']:.1f}s / p95 {result['paper_seconds_p95']:.1f}s, "
+          f"peak RSS {result['peak_rss_mb']:.0f} MB")
+    print(f"backend: {result['backend']}")
+    print(f"{'stage':<14}{'p50 s':>10}{'p95 s':>10}")
+    for stage, values in result["stages"].items():
+        print(f"{stage:<14}{values['p50']:>10.2f}{values['p95']:>10.2f}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            failures = check_regressions(result, json.load(f), args.tolerance)
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
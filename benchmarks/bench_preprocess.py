@@ -0,0 +1,54 @@
+"""Micro-benchmark of the preprocessing presets on the bundled sample pages.
+
+Usage:
+    python benchmarks/bench_preprocess.py
+    python benchmarks/bench_preprocess.py --samples pdf_pages --repeat 3 --workers 4
+
+Reports pages/sec for one-page-at-a-time and batched processing, plus how
+many pages each preset flags as blank and the mean skew it corrected.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cv2  # noqa: E402
+
+from preprocessing import PREPROCESS_PRESETS, preprocess_batch, preprocess_page  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", default="pdf_pages", help="Folder of page images (default: pdf_pages).")
+    parser.add_argument("--repeat", type=int, default=1, help="Times to process the sample set per measurement.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Threads for batched processing.")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(ROOT, args.samples, "*")))
+    pages = [image for image in (cv2.imread(path, cv2.IMREAD_GRAYSCALE) for path in paths) if image is not None]
+    pages = pages * args.repeat
+    if not pages:
+        sys.exit(f"No images found in {args.samples}.")
+
+    print(f"{len(pages)} pages from {args.samples}, {args.workers} batch workers")
+    print(f"{'preset':<14}{'serial p/s':>12}{'batched p/s':>13}{'blank':>7}{'mean |skew|':>13}")
+    for name in PREPROCESS_PRESETS:
+        start = time.perf_counter()
+        results = [preprocess_page(page, name) for page in pages]
+        serial = len(pages) / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        preprocess_batch(pages, name, max_workers=args.workers)
+        batched = len(pages) / (time.perf_counter() - start)
+
+        blank = sum(1 for result in results if result["blank"])
+        skew = sum(abs(result["skew_angle"]) for result in results) / len(results)
+        print(f"{name:<14}{serial:>12.2f}{batched:>13.2f}{blank:>7}{skew:>12.2f}°")
+
+
+if __name__ == "__main__":
+    main()
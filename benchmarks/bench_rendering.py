@@ -0,0 +1,110 @@
+"""Benchmark Step 1 page rendering: legacy PNG round-trip loop vs in-memory pipeline.
+
+Usage:
+    python benchmarks/bench_rendering.py                 # 1.pdf and 2.pdf, all modes
+    python benchmarks/bench_rendering.py --pdf 2.pdf --workers 4
+
+Each mode runs in a fresh subprocess so that peak RSS is measured per mode.
+Peak RSS is the parent's peak plus the largest child/worker peak.
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = ["legacy", "streaming-serial", "streaming-pool"]
+
+
+def run_legacy(pdf_bytes):
+    """The original Step 1 loop from app.py, kept here as the baseline."""
+    import numpy as np
+    import pymupdf
+    from PIL import Image
+
+    from preprocessing import preprocess_image
+
+    temp_dir = tempfile.mkdtemp(prefix="bench_legacy_")
+    try:
+        doc = pymupdf.open(stream=pdf_bytes, filetype="pdf")
+        student_images_pil = []
+        for page in doc:
+            pix = page.get_pixmap()
+            img_data = pix.tobytes("png")
+            pil_image = Image.open(io.BytesIO(img_data))
+            student_images_pil.append(pil_image)
+        doc.close()
+
+        preprocessed_paths = [os.path.join(temp_dir, f"page_{i+1}.png") for i in range(len(student_images_pil))]
+        for i, pil_image in enumerate(student_images_pil):
+            cv_img = np.array(pil_image)[:, :, ::-1].copy()
+            processed_cv_img = preprocess_image(cv_img)
+            Image.fromarray(processed_cv_img).save(preprocessed_paths[i])
+        return len(preprocessed_paths)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def run_streaming(pdf_bytes, workers, profile):
+    from rendering import iter_preprocessed_pages
+
+    return sum(1 for _ in iter_preprocessed_pages(pdf_bytes, workers=workers, profile=profile))
+
+
+def peak_rss_mb():
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return (own + children) / scale
+
+
+def child_main(mode, pdf_path, workers, profile):
+    with open(pdf_path, "rb") as f:
+        pdf_bytes = f.read()
+    start = time.perf_counter()
+    if mode == "legacy":
+        pages = run_legacy(pdf_bytes)
+    else:
+        pages = run_streaming(pdf_bytes, 1 if mode == "streaming-serial" else workers, profile)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"pages": pages, "seconds": elapsed, "peak_rss_mb": peak_rss_mb()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pdf", action="append", help="PDF to render (repeatable). Defaults to 1.pdf and 2.pdf.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Pool size for streaming-pool.")
+    parser.add_argument("--profile", default="legacy",
+                        help="Render profile for the streaming modes (default: legacy, i.e. the same output as the old loop).")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    pdfs = args.pdf or [os.path.join(ROOT, "1.pdf"), os.path.join(ROOT, "2.pdf")]
+
+    if args.child:
+        child_main(args.child, pdfs[0], args.workers, args.profile)
+        return
+
+    print(f"{'pdf':<10}{'mode':<20}{'pages':>6}{'total s':>10}{'ms/page':>10}{'peak RSS MB':>14}")
+    for pdf_path in pdfs:
+        for mode in MODES:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", mode, "--pdf", pdf_path, "--workers", str(args.workers),
+                 "--profile", args.profile],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            per_page_ms = 1000 * result["seconds"] / max(1, result["pages"])
+            print(f"{os.path.basename(pdf_path):<10}{mode:<20}{result['pages']:>6}{result['seconds']:>10.2f}"
+                  f"{per_page_ms:>10.1f}{result['peak_rss_mb']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
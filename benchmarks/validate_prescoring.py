@@ -0,0 +1,111 @@
+"""Validate local pre-scoring against the model's grades in an evaluation report.
+
+Usage:
+    python benchmarks/validate_prescoring.py
+    python benchmarks/validate_prescoring.py --report Final_Evaluation/evaluation_report.txt --threshold 0.85 --show
+
+Every answered question of the report is pre-scored locally, exactly as
+``grade_student`` would before calling the model. Reports how many model
+calls pre-scoring avoids, and how often its scores agree with the model's
+scores in the report, then checks a fixed set of near-match cases (answers
+one spelling or one word away from the official answer, initials that
+look like option letters, and numbers written differently). Exits with 1 if agreement falls below
+``--min-agreement`` or any near-match case is decided wrongly.
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from evaluation import is_answered  # noqa: E402
+from pipeline import parse_text_report  # noqa: E402
+from prescoring import MATCH_THRESHOLD, PreScorer  # noqa: E402
+
+# (student answer, official answer, expected local score or None if it must go to the model)
+NEAR_MATCH_CASES = [
+    ("Microeconomics", "Macroeconomics", None),
+    ("Relatively elastic demand", "Relatively inelastic demand", None),
+    ("Unlimited wants", "Limited wants", None),
+    ("When the price of a good rises, the quantity demanded of that good falls, other things remaining the same",
+     "When the price of a good rises, the quantity demanded of that good does not fall, other things remaining the same", None),
+    ("मांग में वृद्धि नहीं होती", "मांग में वृद्धि होती", None),
+    ("A. Smith", "A. Marshall", None),
+    ("J. M. Keynes", "A. Keynes", None),
+    ("c. Monopoly market", "C. Both (A and B)", None),
+    ("1,000", "1000", 100),
+    ("2.5", "2.50", 100),
+    ("1,00,000", "100000", 100),
+    ("१२", "12", 100),
+    ("12", "13", None),
+    ("Oportunity cost", "Opportunity cost", 100),
+    ("Relativly inelastic demand", "Relatively inelastic demand", 100),
+    ("Organisation", "Organization", 100),
+    ("माँग", "मांग", 100),
+]
+
+
+def check_near_matches(threshold):
+    """Decide every near-match case; returns the cases decided wrongly as ``(case, local score)``."""
+    prescorer = PreScorer([official for _, official, _ in NEAR_MATCH_CASES], match_threshold=threshold)
+    failures = []
+    for student, official, expected in NEAR_MATCH_CASES:
+        decision = prescorer.decide(student, official)
+        score = decision[0] if decision else None
+        if score != expected:
+            failures.append(((student, official, expected), score))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--report", default=os.path.join(ROOT, "Final_Evaluation", "evaluation_report.txt"))
+    parser.add_argument("--threshold", type=float, default=MATCH_THRESHOLD, help=f"Match threshold (default: {MATCH_THRESHOLD}).")
+    parser.add_argument("--points", type=int, default=0, help="Score difference still counted as agreement (default: 0).")
+    parser.add_argument("--min-agreement", type=float, default=0.95, help="Required agreement on auto-scored answers (default: 0.95).")
+    parser.add_argument("--show", action="store_true", help="Print every auto-scored answer next to the report's grade.")
+    args = parser.parse_args()
+
+    with open(args.report, encoding="utf-8") as f:
+        items = parse_text_report(f.read())
+    graded = [item for item in items if item["score"] is not None]
+    answered = [item for item in graded if is_answered(item)]
+
+    start = time.perf_counter()
+    prescorer = PreScorer((item["official_answer"] for item in items), match_threshold=args.threshold)
+    decisions = [(item, prescorer.score(item)) for item in answered]
+    elapsed_ms = 1000 * (time.perf_counter() - start)
+
+    scored = [(item, decision) for item, decision in decisions if decision is not None]
+    agreeing = [item for item, (score, _) in scored if abs(score - item["score"]) <= args.points]
+    stats = prescorer.stats
+    print(f"Report: {len(graded)} graded questions, {len(answered)} answered (each a model call without pre-scoring)")
+    print(f"Pre-scoring: {elapsed_ms:.1f} ms, {stats['auto_scored']} answered questions scored locally "
+          f"({stats['matched']} matches, {stats['mismatched']} clear mismatches, {stats['blank']} blank), "
+          f"{stats['sent_to_model']} left for the model")
+    print(f"Model calls avoided: {stats['auto_scored']}/{len(answered)} ({stats['auto_scored'] / max(1, len(answered)):.0%})")
+
+    agreement = len(agreeing) / len(scored) if scored else 1.0
+    print(f"Agreement with the report: {len(agreeing)}/{len(scored)} ({agreement:.0%})")
+    for item, (score, justification) in scored:
+        if args.show or item not in agreeing:
+            marker = "ok  " if item in agreeing else "DIFF"
+            print(f"{marker} {item['question_number']:<8} local {score:>3} report {item['score']:>3}  "
+                  f"{item['student_answer'][:40]!r} vs {item['official_answer'][:40]!r}")
+
+    failures = check_near_matches(args.threshold)
+    print(f"Near-match cases: {len(NEAR_MATCH_CASES) - len(failures)}/{len(NEAR_MATCH_CASES)} decided as expected")
+    for (student, official, expected), score in failures:
+        print(f"DIFF local {score!s:>4} expected {expected!s:>4}  {student[:40]!r} vs {official[:40]!r}")
+    if agreement < args.min_agreement:
+        print(f"FAIL agreement {agreement:.0%} is below {args.min_agreement:.0%}")
+        sys.exit(1)
+    if failures:
+        print(f"FAIL {len(failures)} near-match cases decided wrongly")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
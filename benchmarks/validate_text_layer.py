@@ -0,0 +1,80 @@
+"""Validate the local text-layer extractor against the model's reference output.
+
+Usage:
+    python benchmarks/validate_text_layer.py
+    python benchmarks/validate_text_layer.py --question "2 - question.pdf" --answer "2 - answer.pdf" \
+        --reference Original_Answer/original_answer.json
+
+Reports extraction time, which answer-key pages would still go to the model,
+question-number recall/precision against the reference, and the mean text
+similarity of the locally extracted questions and answers.
+"""
+import argparse
+import difflib
+import json
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from text_layer import extract_official_answers_locally  # noqa: E402
+
+
+def normalise(text):
+    return re.sub(r"\s+", " ", text or "").strip().lower()
+
+
+def similarity(a, b):
+    return difflib.SequenceMatcher(None, normalise(a), normalise(b)).ratio()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--question", default=os.path.join(ROOT, "2 - question.pdf"))
+    parser.add_argument("--answer", default=os.path.join(ROOT, "2 - answer.pdf"))
+    parser.add_argument("--reference", default=os.path.join(ROOT, "Original_Answer", "original_answer.json"))
+    parser.add_argument("--show", action="store_true", help="Print every local item next to the reference.")
+    args = parser.parse_args()
+
+    with open(args.question, "rb") as f:
+        question_pdf_bytes = f.read()
+    with open(args.answer, "rb") as f:
+        answer_key_pdf_bytes = f.read()
+    with open(args.reference, encoding="utf-8") as f:
+        reference = {item["question_number"]: item for item in json.load(f)}
+
+    start = time.perf_counter()
+    local = extract_official_answers_locally(question_pdf_bytes, answer_key_pdf_bytes)
+    elapsed_ms = 1000 * (time.perf_counter() - start)
+
+    found = set(local["question_numbers"])
+    expected = set(reference)
+    print(f"Local extraction: {elapsed_ms:.1f} ms")
+    print(f"Question paper readable: {local['question_paper_ok']} "
+          f"(total questions printed: {local['total_questions'] or 'not found'}, "
+          f"top-level numbers found: {len({q.split(' ')[0] for q in found})})")
+    print(f"Answer-key pages needing the model: {[p + 1 for p in local['low_confidence_pages']] or 'none'}")
+    print(f"Question numbers: {len(found & expected)}/{len(expected)} reference numbers found "
+          f"(recall {len(found & expected) / max(1, len(expected)):.0%}, "
+          f"precision {len(found & expected) / max(1, len(found)):.0%})")
+    print(f"Answered locally: {len(local['qna'])}, left for the model: {len(local['missing'])}")
+
+    compared = [item for item in local["qna"] if item["question_number"] in reference]
+    if compared:
+        q_sim = sum(similarity(i["question_text"], reference[i["question_number"]]["question_text"]) for i in compared)
+        a_sim = sum(similarity(i["official_answer_text"], reference[i["question_number"]]["official_answer_text"]) for i in compared)
+        print(f"Mean similarity on {len(compared)} local items: question_text {q_sim / len(compared):.2f}, "
+              f"official_answer_text {a_sim / len(compared):.2f}")
+    if args.show:
+        for item in compared:
+            ref = reference[item["question_number"]]
+            print(f"\n--- {item['question_number']} ---\nlocal:     {normalise(item['official_answer_text'])[:100]}"
+                  f"\nreference: {normalise(ref['official_answer_text'])[:100]}")
+    print(f"Missing from local output: {sorted(expected - found) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+"""Step 4 evaluation engine: grades merged items concurrently, one per call or in batches.
+
+The engine only needs a model object exposing ``generate_content(prompt)``
+that returns something with a ``.text`` attribute, so it can be driven by
+``genai.GenerativeModel`` or by a local fake model.
+"""
+import json
+import random
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from json_parsing import extract_json_array
+from result_cache import make_key
+from tracing import record_usage, span
+
+NOT_ANSWERED_JUSTIFICATION = "Question was not answered by the student."
+BAD_FORMAT_JUSTIFICATION = "AI response was not in the expected 'score|justification' format."
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+SCORE_RE = re.compile(r"\s*(?:score\s*[:=]?\s*)?(\d+)(?:\.0+)?\s*%?\s*", re.I)  # "90", "Score: 90", "90%"
+
+
+class TokenBucket:
+    """Thread-safe token bucket limiting requests to ``rate_per_minute``."""
+
+    def __init__(self, rate_per_minute, burst=1):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, float(burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+def base_question_number(q_num):
+    """Return the top-level question number, e.g. ``"4"`` for ``"4 (ii)"``."""
+    return q_num.split(' ')[0].split('(')[0]
+
+
+def estimate_tokens(text):
+    """Rough prompt-size estimate (about four characters per token)."""
+    return max(1, len(text) // 4)
+
+
+def is_answered(item):
+    return item["status"] == "Answered" and item["student_answer"] and item["student_answer"] != "Not Answered"
+
+
+def is_retryable_error(exc):
+    """True for rate-limit (429) and server-side (5xx) errors."""
+    code = getattr(exc, "code", None)
+    if callable(code):
+        try:
+            code = code()
+        except Exception:
+            code = None
+    code = getattr(code, "value", code)
+    if isinstance(code, tuple):
+        code = code[0]
+    if isinstance(code, int) and code in RETRYABLE_STATUS_CODES:
+        return True
+    match = re.match(r"\s*(\d{3})\b", str(exc))
+    return bool(match) and int(match.group(1)) in RETRYABLE_STATUS_CODES
+
+
+def call_with_retry(fn, max_retries=4, base_delay=1.0, max_delay=30.0, rate_limiter=None, trace=None):
+    """Call ``fn`` retrying 429/5xx errors with full-jitter exponential backoff.
+
+    Retries are counted in ``trace["retries"]`` when a span attribute dict is given.
+    """
+    attempt = 0
+    while True:
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable_error(e):
+                raise
+            time.sleep(random.uniform(0, min(max_delay, base_delay * (2 ** attempt))))
+            attempt += 1
+            if trace is not None:
+                trace["retries"] = attempt
+
+
+def parse_score(value):
+    """Return ``value`` as an integer score from 0 to 100, or ``None`` if it is anything else.
+
+    ``87.5``, ``"8/10"``, ``-10`` and ``150`` are rejected rather than read as 875, 810, 10 or 150.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, str):
+        match = SCORE_RE.fullmatch(value)
+        value = int(match.group(1)) if match else None
+    return value if isinstance(value, int) and 0 <= value <= 100 else None
+
+
+def parse_evaluation_response(text):
+    """Parse a ``score|justification`` reply into ``(score, justification)``."""
+    parts = text.strip().split('|')
+    score = parse_score(parts[0]) if len(parts) == 2 else None
+    if score is None:
+        return -1, BAD_FORMAT_JUSTIFICATION
+    return score, parts[1].strip()
+
+
+def evaluation_cache_key(model, prompt):
+    return make_key("evaluation", getattr(model, "model_name", ""), prompt)
+
+
+def prescore_item(prescorer, item, tracer=None):
+    """Score ``item`` locally with ``prescorer``; returns the graded copy, or ``None`` if the model must grade it."""
+    if prescorer is None:
+        return None
+    with span(tracer, "prescore", question_number=item["question_number"], auto_scored=False) as trace:
+        local = prescorer.score(item)
+        if local is None:
+            return None
+        trace["auto_scored"] = True
+    result = dict(item)
+    result["score"], result["justification"] = local
+    return result
+
+
+def grade_item(model, item, prompt_template, max_retries=4, rate_limiter=None, cache=None, tracer=None,
+               prescorer=None):
+    """Grade a single merged item, returning a new dict with score and justification.
+
+    With a ``prescorer`` (see ``prescoring.PreScorer``), clear-cut answers
+    are scored locally without a model call.
+    """
+    result = dict(item)
+    if not is_answered(item):
+        result["score"], result["justification"] = 0, NOT_ANSWERED_JUSTIFICATION
+        return result
+    local = prescore_item(prescorer, item, tracer)
+    if local is not None:
+        return local
+    prompt = prompt_template.format(official_answer=item["official_answer"], student_answer=item["student_answer"])
+    with span(tracer, "evaluate", question_number=item["question_number"], cache_hit=False) as trace:
+        key = evaluation_cache_key(model, prompt) if cache is not None else None
+        cached = cache.get(key, bytes_saved=len(prompt.encode("utf-8"))) if key else None
+        if cached is not None:
+            trace["cache_hit"] = True
+            result["score"], result["justification"] = parse_evaluation_response(cached)
+            return result
+        trace["bytes_sent"] = len(prompt.encode("utf-8"))
+        try:
+            response = call_with_retry(lambda: model.generate_content(prompt), max_retries=max_retries,
+                                       rate_limiter=rate_limiter, trace=trace)
+            record_usage(trace, response)
+            result["score"], result["justification"] = parse_evaluation_response(response.text)
+            if key and result["score"] >= 0:
+                cache.put(key, response.text.strip())
+        except Exception as e:
+            trace["error"] = str(e)
+            result["score"], result["justification"] = -1, f"AI evaluation failed: {e}"
+    return result
+
+
+def evaluate_items(model, items, prompt_template, max_workers=4, requests_per_minute=None,
+                   max_retries=4, on_progress=None, cache=None, rate_limiter=None, tracer=None, prescorer=None):
+    """Grade ``items`` with up to ``max_workers`` concurrent model calls.
+
+    Results are returned in the same order as ``items``. ``on_progress`` is
+    called from the calling thread as ``on_progress(done, total, result)``
+    each time an item finishes, in completion order. When a ``cache`` is
+    given, previously seen prompts are answered from it without a model call.
+    A shared ``rate_limiter`` overrides ``requests_per_minute``, and answers
+    settled by ``prescorer`` never reach the model.
+
+    ``items`` may also be an iterator, e.g. answers still streaming in from
+    Step 2: each item is submitted as soon as it is produced, and ``total``
+    counts the items seen so far until the iterator is exhausted.
+    """
+    if rate_limiter is None and requests_per_minute:
+        rate_limiter = TokenBucket(requests_per_minute, burst=max_workers)
+    known_total = len(items) if hasattr(items, "__len__") else None
+    results, futures, done = [], {}, 0
+
+    def collect(finished):
+        nonlocal done
+        for future in finished:
+            index = futures.pop(future)
+            results[index] = future.result()
+            done += 1
+            if on_progress:
+                on_progress(done, known_total or len(results), results[index])
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        for item in items:
+            future = pool.submit(grade_item, model, item, prompt_template, max_retries, rate_limiter, cache, tracer,
+                                 prescorer)
+            futures[future] = len(results)
+            results.append(None)
+            collect([future for future in futures if future.done()])
+        while futures:
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            collect(finished)
+    return results
+
+
+def group_into_batches(items, batch_size):
+    """Split ``items`` into batches of at most ``batch_size`` items.
+
+    Sub-parts sharing a base question number are kept in the same batch
+    unless the question alone has more than ``batch_size`` sub-parts.
+    """
+    groups = []
+    for item in items:
+        base = base_question_number(item["question_number"])
+        if groups and groups[-1][0] == base:
+            groups[-1][1].append(item)
+        else:
+            groups.append((base, [item]))
+
+    batches, current = [], []
+    for _, group in groups:
+        if current and len(current) + len(group) > batch_size:
+            batches.append(current)
+            current = []
+        for item in group:
+            current.append(item)
+            if len(current) == batch_size:
+                batches.append(current)
+                current = []
+    if current:
+        batches.append(current)
+    return batches
+
+
+def build_batch_prompt(batch, batch_prompt_template):
+    payload = [
+        {
+            "question_number": item["question_number"],
+            "official_answer": item["official_answer"],
+            "student_answer": item["student_answer"],
+        }
+        for item in batch
+    ]
+    return batch_prompt_template.format(items_json=json.dumps(payload, indent=2, ensure_ascii=False))
+
+
+def grade_batch(model, batch, batch_prompt_template, max_retries=4, rate_limiter=None, tracer=None):
+    """Grade several items in one call.
+
+    Returns a dict mapping ``question_number`` to a graded copy of the item.
+    Items the model skipped, returned in an unusable shape or scored with
+    anything but an integer from 0 to 100 are left out so the caller can
+    re-grade them individually.
+    """
+    prompt = build_batch_prompt(batch, batch_prompt_template)
+    with span(tracer, "evaluate_batch", items=len(batch), bytes_sent=len(prompt.encode("utf-8"))) as trace:
+        try:
+            response = call_with_retry(lambda: model.generate_content(prompt), max_retries=max_retries,
+                                       rate_limiter=rate_limiter, trace=trace)
+            record_usage(trace, response)
+        except Exception as e:
+            trace["error"] = str(e)
+            return {}
+    try:
+        with span(tracer, "json_parse", items=len(batch)):
+            entries = extract_json_array(response.text)
+    except Exception:
+        return {}
+
+    by_number = {item["question_number"]: item for item in batch}
+    graded = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        q_num = str(entry.get("question_number", "")).strip()
+        if q_num not in by_number or q_num in graded:
+            continue
+        score = parse_score(entry.get("score"))
+        if score is None:
+            continue
+        result = dict(by_number[q_num])
+        result["score"], result["justification"] = score, str(entry.get("justification", "")).strip()
+        graded[q_num] = result
+    return graded
+
+
+def evaluate_items_batched(model, items, prompt_template, batch_prompt_template, batch_size=5,
+                           max_workers=4, requests_per_minute=None, max_retries=4, on_progress=None,
+                           cache=None, rate_limiter=None, tracer=None, prescorer=None):
+    """Grade answered items ``batch_size`` at a time.
+
+    Items missing from a batch response are re-graded on their own with
+    ``prompt_template``. Returns ``(results, stats)`` where ``results`` keeps
+    the order of ``items`` and ``stats`` compares model calls and estimated
+    prompt tokens against grading every item individually. Cached grades
+    are reused per item, and batch grades are stored under the same keys as
+    per-item grades. Answers settled by ``prescorer`` are not batched.
+    """
+    if rate_limiter is None and requests_per_minute:
+        rate_limiter = TokenBucket(requests_per_minute, burst=max_workers)
+    results = [None] * len(items)
+    index_of = {id(item): i for i, item in enumerate(items)}
+    done = 0
+
+    def finish(index, result):
+        nonlocal done
+        results[index] = result
+        done += 1
+        if on_progress:
+            on_progress(done, len(items), result)
+
+    def single_prompt(item):
+        return prompt_template.format(official_answer=item["official_answer"], student_answer=item["student_answer"])
+
+    answered = []
+    for i, item in enumerate(items):
+        if not is_answered(item):
+            finish(i, grade_item(model, item, prompt_template))
+            continue
+        local = prescore_item(prescorer, item, tracer)
+        if local is not None:
+            finish(i, local)
+            continue
+        cached = None
+        if cache is not None:
+            prompt = single_prompt(item)
+            start = time.time()
+            cached = cache.get(evaluation_cache_key(model, prompt), bytes_saved=len(prompt.encode("utf-8")))
+            if cached is not None and tracer is not None:
+                tracer.add("evaluate", start, time.time(), question_number=item["question_number"], cache_hit=True)
+        if cached is not None:
+            result = dict(item)
+            result["score"], result["justification"] = parse_evaluation_response(cached)
+            finish(i, result)
+        else:
+            answered.append(item)
+
+    stats = {
+        "per_item_calls": len(answered),
+        "per_item_prompt_tokens": sum(estimate_tokens(single_prompt(item)) for item in answered),
+        "calls": 0,
+        "prompt_tokens": 0,
+        "regraded_individually": 0,
+    }
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        pending = {}
+        for batch in group_into_batches(answered, max(1, batch_size)):
+            stats["calls"] += 1
+            stats["prompt_tokens"] += estimate_tokens(build_batch_prompt(batch, batch_prompt_template))
+            future = pool.submit(grade_batch, model, batch, batch_prompt_template, max_retries, rate_limiter, tracer)
+            pending[future] = ("batch", batch)
+
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                kind, payload = pending.pop(future)
+                if kind == "single":
+                    finish(index_of[id(payload)], future.result())
+                    continue
+                graded = future.result()
+                for item in payload:
+                    result = graded.get(item["question_number"])
+                    if result is not None:
+                        if cache is not None:
+                            justification = result["justification"].replace('|', '/')
+                            cache.put(evaluation_cache_key(model, single_prompt(item)), f"{result['score']}|{justification}")
+                        finish(index_of[id(item)], result)
+                        continue
+                    stats["calls"] += 1
+                    stats["regraded_individually"] += 1
+                    stats["prompt_tokens"] += estimate_tokens(single_prompt(item))
+                    retry = pool.submit(grade_item, model, item, prompt_template, max_retries, rate_limiter, cache, tracer)
+                    pending[retry] = ("single", item)
+
+    stats["calls_saved"] = stats["per_item_calls"] - stats["calls"]
+    stats["prompt_tokens_saved"] = stats["per_item_prompt_tokens"] - stats["prompt_tokens"]
+    return results, stats
@@ -0,0 +1,249 @@
+"""Headless batch grading for a whole class of answer sheets.
+
+Usage:
+    python grade_class.py --students answer_sheets/ --question-paper "2 - question.pdf" \
+        --answer-key "2 - answer.pdf" --output class_results/
+
+The official answer key is extracted once, students are graded concurrently
+and each finished student is written to ``<output>/students/``. Re-running
+the same command skips students that already have results for the same
+question paper and answer key, so a crashed run continues where it stopped;
+changing either PDF re-extracts the official answers and regrades everyone. Per-stage traces of every run (JSON Lines and
+Chrome trace) are written to ``<output>/traces/``.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from evaluation import TokenBucket
+from page_windows import DEFAULT_WINDOW_OVERLAP, DEFAULT_WINDOW_PAGES, check_window_overlap
+from pipeline import configure_model, extract_official_answers, grade_student
+from rendering import DEFAULT_MEMORY_BUDGET_MB, DEFAULT_RENDER_PROFILE, RENDER_PROFILES
+from result_cache import ResultCache, make_key
+from tracing import Tracer
+from uploads import UploadManager
+
+SUMMARY_FIELDS = ["student", "total_questions", "answered_count", "average_score", "status", "error"]
+print_lock = threading.Lock()
+
+
+def log(message):
+    with print_lock:
+        print(message, file=sys.stderr, flush=True)
+
+
+def write_atomic(path, text):
+    """Write ``text`` to ``path`` via a temporary file so a crash never leaves a partial file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def student_paths(output_dir, name):
+    base = os.path.join(output_dir, "students", name)
+    return base + "_results.json", base + "_report.txt"
+
+
+def load_results(output_dir, name, answer_key_id):
+    """The saved results of ``name``, or ``None`` if missing or graded against another answer key."""
+    results_path, _ = student_paths(output_dir, name)
+    if not os.path.exists(results_path):
+        return None
+    with open(results_path, encoding="utf-8") as f:
+        saved = json.load(f)
+    return saved if saved.get("answer_key_id") == answer_key_id else None
+
+
+def write_trace(args, tracer):
+    if not args.no_trace:
+        tracer.write(os.path.join(args.output, "traces", tracer.name))
+
+
+def load_official_answers(args, model, cache, uploads, rate_limiter, question_pdf_bytes, answer_key_pdf_bytes, answer_key_id):
+    """Extract the official answers, or reuse ``<output>/official_answers.json`` if it came from the same two PDFs.
+
+    ``answer_key_id`` (a hash of both PDFs) is saved next to the answers in
+    ``official_answers.key``; answers saved for other PDFs are re-extracted.
+    """
+    official_path = os.path.join(args.output, "official_answers.json")
+    key_path = os.path.join(args.output, "official_answers.key")
+    if os.path.exists(official_path):
+        saved_id = None
+        if os.path.exists(key_path):
+            with open(key_path, encoding="utf-8") as f:
+                saved_id = f.read().strip()
+        if saved_id == answer_key_id:
+            with open(official_path, encoding="utf-8") as f:
+                return json.load(f)
+        log("The saved official answers were extracted from a different question paper or answer key; extracting again.")
+
+    tracer = Tracer("official_answers")
+    try:
+        official_qna_data = extract_official_answers(
+            model, question_pdf_bytes, answer_key_pdf_bytes, cache=cache, uploads=uploads,
+            rate_limiter=rate_limiter, on_step=log, use_text_layer=not args.no_text_layer, tracer=tracer
+        )
+    finally:
+        write_trace(args, tracer)
+    write_atomic(official_path, json.dumps(official_qna_data, indent=4, ensure_ascii=False))
+    write_atomic(key_path, answer_key_id)
+    return official_qna_data
+
+
+def grade_one(args, model, cache, uploads, rate_limiter, question_pdf_bytes, official_qna_data, answer_key_id, pdf_path):
+    name = os.path.splitext(os.path.basename(pdf_path))[0]
+    results_path, report_path = student_paths(args.output, name)
+    with open(pdf_path, "rb") as f:
+        student_pdf_bytes = f.read()
+
+    tracer = Tracer(name)
+    try:
+        graded = grade_student(
+            model, student_pdf_bytes, question_pdf_bytes, official_qna_data, cache=cache, uploads=uploads,
+            max_workers=args.eval_workers, batch_size=args.batch_size, rate_limiter=rate_limiter,
+            render_workers=args.render_workers or max(1, (os.cpu_count() or 1) // max(1, args.workers)),
+            render_profile=args.render_profile, on_step=lambda message: log(f"[{name}] {message}"),
+            window_pages=args.window_pages, window_overlap=args.window_overlap,
+            memory_budget_mb=args.memory_budget_mb / max(1, args.workers), prescore=not args.no_prescore, tracer=tracer
+        )
+    finally:
+        write_trace(args, tracer)
+    prescore_stats = graded["prescore_stats"]
+    if prescore_stats and prescore_stats["checked"]:
+        log(f"[{name}] {prescore_stats['auto_scored']} of {prescore_stats['checked']} answers scored locally "
+            f"({prescore_stats['auto_scored']} model calls avoided).")
+
+    write_atomic(report_path, graded["report"])
+    # The results file is written last: its presence marks the student as done.
+    write_atomic(results_path, json.dumps({
+        "student": name,
+        "answer_key_id": answer_key_id,
+        "summary": graded["summary"],
+        "student_qna_data": graded["student_qna_data"],
+        "results": graded["results"],
+        "prescore_stats": prescore_stats,
+        "timings": graded["timings"],
+    }, indent=4, ensure_ascii=False))
+    return name, graded["timings"]
+
+
+def write_class_summary(output_dir, names, failures, answer_key_id):
+    rows = []
+    for name in names:
+        saved = load_results(output_dir, name, answer_key_id)
+        if saved is not None:
+            rows.append({"student": name, **saved["summary"], "status": "graded", "error": ""})
+        else:
+            rows.append({
+                "student": name, "total_questions": "", "answered_count": "", "average_score": "",
+                "status": "failed" if name in failures else "pending", "error": failures.get(name, ""),
+            })
+
+    with open(os.path.join(output_dir, "class_summary.jsonl"), "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    with open(os.path.join(output_dir, "class_summary.csv"), "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Grade a directory of student answer sheets against one answer key.")
+    parser.add_argument("--students", required=True, help="Directory containing one PDF per student.")
+    parser.add_argument("--question-paper", required=True, help="Question paper PDF.")
+    parser.add_argument("--answer-key", required=True, help="Official answer key PDF.")
+    parser.add_argument("--output", required=True, help="Directory for reports and the class summary.")
+    parser.add_argument("--workers", type=int, default=4, help="Students graded at the same time (default: 4).")
+    parser.add_argument("--eval-workers", type=int, default=4, help="Parallel evaluation requests per student (default: 4).")
+    parser.add_argument("--rpm", type=int, default=60, help="Model requests per minute across all workers, 0 = unlimited (default: 60).")
+    parser.add_argument("--render-workers", type=int, default=None, help="Processes used to render each student's pages (default: CPUs divided by --workers).")
+    parser.add_argument("--render-profile", choices=list(RENDER_PROFILES), default=DEFAULT_RENDER_PROFILE,
+                        help=f"Page render profile (default: {DEFAULT_RENDER_PROFILE}).")
+    parser.add_argument("--memory-budget-mb", type=int, default=DEFAULT_MEMORY_BUDGET_MB * 2,
+                        help=f"Memory for page rendering, shared by the students graded at the same time (default: {DEFAULT_MEMORY_BUDGET_MB * 2}).")
+    parser.add_argument("--upload-workers", type=int, default=8, help="Concurrent file uploads (default: 8).")
+    parser.add_argument("--window-pages", type=int, default=DEFAULT_WINDOW_PAGES,
+                        help=f"Answer pages per transcription call; longer sheets are split into overlapping windows, 0 = never split (default: {DEFAULT_WINDOW_PAGES}).")
+    parser.add_argument("--window-overlap", type=int, default=DEFAULT_WINDOW_OVERLAP,
+                        help=f"Pages shared by neighbouring windows (default: {DEFAULT_WINDOW_OVERLAP}).")
+    parser.add_argument("--batch-size", type=int, default=1, help="Answers per grading call (default: 1).")
+    parser.add_argument("--no-prescore", action="store_true", help="Send every answered question to the AI, even blank or exactly matching ones.")
+    parser.add_argument("--no-text-layer", action="store_true", help="Always read the answer key with the AI, even if it is typed.")
+    parser.add_argument("--backend", choices=["gemini", "replay"], default=os.getenv("GRADER_BACKEND", "gemini"),
+                        help="Model backend; 'replay' serves the bundled recordings offline (default: $GRADER_BACKEND or gemini).")
+    parser.add_argument("--no-trace", action="store_true", help="Do not write per-student trace files to <output>/traces/.")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the on-disk result cache.")
+    args = parser.parse_args(argv)
+    try:
+        check_window_overlap(args.window_pages, args.window_overlap)
+    except ValueError as e:
+        parser.error(f"--window-overlap: {e}")
+    return args
+
+
+def main(argv=None):
+    load_dotenv()
+    args = parse_args(argv)
+    if args.backend == "gemini" and not os.getenv("GEMINI_API_KEY"):
+        log("GEMINI_API_KEY is not set. Add it to your environment or .env file.")
+        return 2
+
+    os.makedirs(os.path.join(args.output, "students"), exist_ok=True)
+    os.makedirs(os.path.join(args.output, "traces"), exist_ok=True)
+    pdf_paths = sorted(
+        os.path.join(args.students, name) for name in os.listdir(args.students) if name.lower().endswith(".pdf")
+    )
+    names = [os.path.splitext(os.path.basename(path))[0] for path in pdf_paths]
+    with open(args.question_paper, "rb") as f:
+        question_pdf_bytes = f.read()
+    with open(args.answer_key, "rb") as f:
+        answer_key_pdf_bytes = f.read()
+    # Results are only reused for the same question paper and answer key.
+    answer_key_id = make_key(question_pdf_bytes, answer_key_pdf_bytes)
+    pending = [path for path, name in zip(pdf_paths, names) if load_results(args.output, name, answer_key_id) is None]
+    log(f"{len(pdf_paths)} answer sheets found, {len(pdf_paths) - len(pending)} already graded, {len(pending)} to grade.")
+
+    model = configure_model(backend=args.backend)
+    cache = None if args.no_cache else ResultCache()
+    rate_limiter = TokenBucket(args.rpm, burst=args.eval_workers) if args.rpm else None
+
+    failures = {}
+    # Shared by every student so the question paper is uploaded once; all remaining files are deleted on exit.
+    with UploadManager(upload_file=model.upload_file, delete_file=model.delete_file, max_workers=args.upload_workers) as uploads:
+        official_qna_data = load_official_answers(
+            args, model, cache, uploads, rate_limiter, question_pdf_bytes, answer_key_pdf_bytes, answer_key_id
+        )
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            futures = {
+                pool.submit(
+                    grade_one, args, model, cache, uploads, rate_limiter, question_pdf_bytes, official_qna_data, answer_key_id, path
+                ): path
+                for path in pending
+            }
+            for future in as_completed(futures):
+                name = os.path.splitext(os.path.basename(futures[future]))[0]
+                try:
+                    _, timings = future.result()
+                    breakdown = ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in timings.items())
+                    log(f"[{name}] graded ({breakdown or 'all steps cached'}).")
+                except Exception as e:
+                    failures[name] = str(e)
+                    log(f"[{name}] failed: {e}")
+
+    rows = write_class_summary(args.output, names, failures, answer_key_id)
+    graded_count = sum(1 for row in rows if row["status"] == "graded")
+    log(f"Done: {graded_count}/{len(rows)} students graded. Summary written to {args.output}.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""Tolerant parsing of JSON arrays returned by the model.
+
+``extract_json_array`` parses a complete reply. ``JsonArrayStream`` parses a
+reply while it is still streaming in, emitting each object of the array as
+soon as its closing brace arrives, so a truncated or malformed tail only
+loses the objects it contains.
+"""
+import json
+import re
+
+NEXT_CHAR_RE = re.compile(r"\s*(\S)")
+
+
+def extract_json_array(text):
+    """Return the JSON array embedded in ``text``.
+
+    Markdown code fences are stripped and everything outside the first ``[``
+    and the last ``]`` is ignored. Raises ``json.JSONDecodeError`` when no
+    array can be recovered.
+    """
+    match = re.search(r"```json\s*([\s\S]*?)\s*```", text)
+    content_to_parse = match.group(1) if match else text
+    start_index = content_to_parse.find('[')
+    end_index = content_to_parse.rfind(']')
+    if start_index == -1 or end_index == -1:
+        raise json.JSONDecodeError("Could not find JSON array brackets.", content_to_parse, 0)
+    return json.loads(content_to_parse[start_index : end_index + 1])
+
+
+class JsonArrayStream:
+    """Incremental parser for a JSON array of objects.
+
+    ``feed`` takes the next piece of text and returns the objects completed
+    by it. The array starts at the first ``[`` followed by ``{`` or ``]``
+    (whitespace aside); text before it, such as prose with brackets of its
+    own or a ```` ```json ```` fence, is ignored. Objects that do not parse
+    are skipped and counted in
+    ``malformed``, and ``complete`` becomes true once the closing ``]`` of the
+    array has been seen.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0      # next character of ``buffer`` to scan
+        self.started = False   # the opening ``[`` has been seen
+        self.complete = False
+        self.depth = 0         # nesting depth inside the current element
+        self.in_string = False
+        self.escaped = False
+        self.object_start = None
+        self.malformed = 0
+
+    def feed(self, text):
+        if self.complete or not text:
+            return []
+        self.buffer += text
+        items = []
+        buffer, i = self.buffer, self.position
+        while i < len(buffer) and not self.complete:
+            ch = buffer[i]
+            if not self.started:
+                if ch == "[":
+                    following = NEXT_CHAR_RE.match(buffer, i + 1)
+                    if not following:
+                        break  # wait for the character after the ``[``
+                    self.started = following.group(1) in "{]"
+            elif self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                if self.depth == 0 and ch == "{":
+                    self.object_start = i
+                self.depth += 1
+            elif ch in "}]":
+                if self.depth == 0:
+                    self.complete = ch == "]"
+                else:
+                    self.depth -= 1
+                    if self.depth == 0 and self.object_start is not None:
+                        try:
+                            items.append(json.loads(buffer[self.object_start:i + 1]))
+                        except json.JSONDecodeError:
+                            self.malformed += 1
+                        self.object_start = None
+            i += 1
+
+        # Keep only the unfinished element, so memory does not grow with the reply.
+        keep_from = self.object_start if self.object_start is not None else i
+        self.buffer = buffer[keep_from:]
+        self.position = i - keep_from
+        if self.object_start is not None:
+            self.object_start = 0
+        return items
+
+
+def parse_json_array_prefix(text):
+    """Parse as much of a (possibly cut-off) JSON array as possible.
+
+    Returns ``(objects, complete)``: every object that was fully present,
+    and whether the array was properly closed.
+    """
+    stream = JsonArrayStream()
+    items = stream.feed(text)
+    return items, stream.complete
@@ -0,0 +1,107 @@
+"""Split long answer sheets into overlapping page windows and merge their transcriptions.
+
+Each window is transcribed on its own with ``MASTER_QNA_PROMPT_STUDENT`` and
+lists every question of the paper, so merging is a matter of picking, per
+``question_number``, the windows that actually found an answer. Windows
+overlap by a page, so an answer crossing a window boundary is seen by both
+windows; the two halves are joined on their common words instead of being
+repeated.
+"""
+import re
+from difflib import SequenceMatcher
+
+DEFAULT_WINDOW_PAGES = 12     # answer pages per transcription call; longer sheets are split (0 = never split)
+DEFAULT_WINDOW_OVERLAP = 1    # pages shared by neighbouring windows
+MIN_OVERLAP_WORDS = 3         # shortest run of common words accepted as the seam between two halves
+FUZZY_SEAM_RATIO = 0.8        # word similarity at which two differently read copies of the shared page still match
+
+PUNCTUATION_RE = re.compile(r"[^\w\u0900-\u097F]")
+
+
+def page_windows(count, window_pages=DEFAULT_WINDOW_PAGES, overlap=DEFAULT_WINDOW_OVERLAP):
+    """Return ``(start, end)`` page ranges covering ``count`` pages.
+
+    A sheet that fits in one window (or ``window_pages=0``) gives a single
+    range. Neighbouring windows share ``overlap`` pages, which must be fewer
+    than ``window_pages`` (raises ``ValueError`` otherwise).
+    """
+    check_window_overlap(window_pages, overlap)
+    if not window_pages or count <= window_pages:
+        return [(0, count)]
+    step = window_pages - overlap
+    windows, start = [], 0
+    while True:
+        end = min(count, start + window_pages)
+        windows.append((start, end))
+        if end == count:
+            return windows
+        start += step
+
+
+def check_window_overlap(window_pages, overlap):
+    """Raise ``ValueError`` unless neighbouring windows of ``window_pages`` pages can share ``overlap`` pages."""
+    if overlap < 0:
+        raise ValueError(f"Window overlap must not be negative (got {overlap}).")
+    if window_pages and overlap >= window_pages:
+        raise ValueError(f"Window overlap ({overlap} pages) must be smaller than the window ({window_pages} pages).")
+
+
+def _words(text):
+    """Normalised words of ``text`` with the offset where each one ends."""
+    words = []
+    for match in re.finditer(r"\S+", text):
+        word = PUNCTUATION_RE.sub("", match.group().lower())
+        if word:
+            words.append((word, match.end()))
+    return words
+
+
+def join_overlapping_text(first, second, min_overlap=MIN_OVERLAP_WORDS):
+    """Join two transcriptions of one answer that were read from neighbouring windows.
+
+    If one contains the other the longer is kept; if the end of ``first``
+    repeats the start of ``second`` (the shared page) they are joined once
+    at that seam. The seam may be read slightly differently by the two
+    windows: word runs at least ``FUZZY_SEAM_RATIO`` similar also match.
+    Without a seam both texts are kept, ``first`` then ``second``.
+    """
+    a, b = _words(first), _words(second)
+    a_text, b_text = " ".join(w for w, _ in a), " ".join(w for w, _ in b)
+    if not a or f" {b_text} " in f" {a_text} ":
+        return first if a else second
+    if f" {a_text} " in f" {b_text} ":
+        return second
+    a_words, b_words = [w for w, _ in a], [w for w, _ in b]
+    sizes = range(min(len(a), len(b)), min_overlap - 1, -1)
+    for size in sizes:
+        if a_words[-size:] == b_words[:size]:
+            return first.rstrip() + second[b[size - 1][1]:]
+    for size in sizes:
+        matcher = SequenceMatcher(None, a_words[-size:], b_words[:size], autojunk=False)
+        if matcher.quick_ratio() >= FUZZY_SEAM_RATIO and matcher.ratio() >= FUZZY_SEAM_RATIO:
+            return first.rstrip() + second[b[size - 1][1]:]
+    return first.rstrip() + "\n" + second.lstrip()
+
+
+def is_transcribed(item):
+    return item.get("status") == "Answered" and item.get("answer_text") not in (None, "", "Not Answered")
+
+
+def merge_window_answers(window_results):
+    """Merge per-window answer lists (in page order) into one item per ``question_number``.
+
+    Questions keep the order in which they first appear; a question is
+    "Not Answered" only if no window found an answer for it.
+    """
+    merged = {}
+    for items in window_results:
+        for item in items:
+            q_num = item.get("question_number")
+            if q_num is None:
+                continue
+            current = merged.get(q_num)
+            if current is None or (is_transcribed(item) and not is_transcribed(current)):
+                merged[q_num] = dict(item)
+            elif is_transcribed(item):
+                current["answer_text"] = join_overlapping_text(current["answer_text"], item["answer_text"])
+    return list(merged.values())
@@ -0,0 +1,726 @@
+"""UI-independent grading pipeline (Steps 1-5).
+
+Used by the Streamlit app (``app.py``) and the class grading CLI
+(``grade_class.py``). The model only needs ``generate_content``; uploads go
+through an ``UploadManager`` and are sent from memory, so nothing is written
+to disk.
+
+Steps 2 and 3 stream the model's reply and parse it incrementally, so
+``grade_student`` merges and grades each answer as soon as it has been
+transcribed.
+"""
+import json
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from backends import GeminiBackend, ReplayBackend
+from evaluation import base_question_number, call_with_retry, evaluate_items, evaluate_items_batched
+from json_parsing import JsonArrayStream
+from page_windows import DEFAULT_WINDOW_OVERLAP, DEFAULT_WINDOW_PAGES, merge_window_answers, page_windows
+from prescoring import PreScorer
+from rendering import DEFAULT_MEMORY_BUDGET_MB, DEFAULT_RENDER_PROFILE, get_profile, iter_preprocessed_pages, page_count
+from result_cache import make_key
+from text_layer import extract_official_answers_locally, extract_pages
+from tracing import record_usage, span
+from uploads import UploadManager
+
+MODEL_NAME = "gemini-1.5-pro-latest"
+
+# --- IMPROVED Prompts for higher accuracy ---
+MASTER_QNA_PROMPT_STUDENT = """
+You are an expert examination evaluator AI, specialized in accurately transcribing handwritten answers. Your critical task is to match questions from a provided question paper with their corresponding handwritten answers from a set of images and generate a single, structured JSON output.
+
+You will be given:
+1.  A PDF file containing all the exam questions (`question_paper.pdf`).
+2.  A series of images (`answer_page_X.png`) containing the student's handwritten answers.
+
+**CRITICAL RULES FOR TRANSCRIPTION:**
+
+1.  **Systematic Processing:** You MUST process the question paper systematically, from the first question to the last. For each question (e.g., "Question 6"), locate the corresponding answer in the provided images using question numbers (e.g., "Ans-6", "Question-6") as your primary guide.
+
+2.  **Verbatim Transcription with Self-Correction:** Transcribe the handwritten answer text *exactly* as it appears, preserving all original wording, spelling, and grammar. You MUST double-check your transcription for common character confusion (e.g., 'u' vs 'v', 'a' vs 'o'), especially for critical single-word answers where a small mistake changes the entire meaning. Do not correct any of the student's mistakes.
+
+3.  **Handling Special Cases:**
+    * **Unanswered Questions:** If you cannot find an answer for a question, you MUST set the `answer_text` to the string "Not Answered" and the `status` to "Not Answered".
+    * **Crossed-Out Text:** If any text is visibly struck through or crossed out, you MUST ignore it completely.
+    * **Matching Questions:** For "Match the columns" questions (e.g., Question 4), you MUST break down the answer into sub-parts. Create separate JSON objects for "4 (i)", "4 (ii)", etc. The `question_text` should be the item from the first column (e.g., "Demand schedule"), and the `answer_text` must be the full text of the matched item.
+
+**MANDATORY OUTPUT FORMAT:**
+
+-   Your final output must be a single, well-formed JSON array `[...]`.
+-   Each element in the array must be a JSON object `{...}` representing one question.
+-   Each object must contain these four keys:
+    -   `"question_number"`: The specific number of the question (e.g., "1 (i)", "4 (i)", "12").
+    -   `"question_text"`: The full text of the question.
+    -   `"answer_text"`: The student's transcribed answer. If not answered, this must be the string "Not Answered".
+    -   `"status"`: A status string, either "Answered" or "Not Answered".
+
+**Example JSON Object:**
+{
+    "question_number": "12",
+    "question_text": "What is Barter System?",
+    "answer_text": "Bartering is the direct exchange of one goods with another goods without the use of money For eg for the services of Carpenter or blacksmith of he is given quintal of wheat then it is bartering.",
+    "status": "Answered"
+}
+
+**Final Instruction:** Your entire response must ONLY be the single, raw JSON array. Do not include any introductory text, explanations, notes, or markdown formatting like ` ```json ` in your final output.
+"""
+
+MASTER_QNA_PROMPT_OFFICIAL = """
+You are a meticulous and highly precise data extraction AI. Your primary directive is to create a **COMPLETE** and **VERBATIM** JSON representation of the provided question paper and its official answers.
+
+You will be given:
+1.  `question_paper.pdf`: Contains exam questions.
+2.  `official_answer_key.pdf`: Contains the official answers.
+
+**CRITICAL RULES FOR EXECUTION:**
+
+1.  ***ABSOLUTE COMPLETENESS & VERIFICATION***:
+    -   You **MUST** process **ALL 23 questions** from the `question_paper.pdf`.
+    -   Before finishing, you must perform a final self-check to ensure all 23 questions and their sub-parts are present in your final JSON output.
+
+2.  ***VERBATIM (EXACT) EXTRACTION***:
+    -   All extracted text must be a *character-for-character copy*. Do not translate, summarize, or alter any text.
+
+3.  ***"OR" (अथवा) QUESTION HANDLING***:
+    -   For questions with an 'OR' option, the `question_text` **MUST** include the text for **BOTH** the main question and the 'OR' question.
+
+4.  ***Special Instruction for Matching Questions***:
+    -   For "Match the columns" questions (like Question 4), you **MUST** break it down into sub-parts. Create a separate JSON object for each matched pair, using question numbers like `4 (i)`, `4 (ii)`, etc. The `question_text` for each object should be the full item from the first column of the question paper (e.g., "(i) Demand schedule"), and the `official_answer_text` should be the corresponding matched pair's text from the answer key.
+
+**MANDATORY OUTPUT FORMAT:**
+
+-   Your final output must be a single, well-formed JSON array `[...]`.
+-   Each object must contain these three keys:
+    -   `"question_number"`: The specific number (e.g., "1 (i)", "4 (i)", "23").
+    -   `"question_text"`: The full English text of the question (and its 'OR' part, if present), copied verbatim.
+    -   `"official_answer_text"`: The full text of the corresponding answer from the answer key, copied verbatim.
+
+Do not add any text, notes, or explanations outside of the final JSON array.
+"""
+
+EVALUATION_PROMPT_TEMPLATE = """
+You are an expert, impartial examiner. Your task is to evaluate a student's answer against the official model answer and provide a score based on semantic correctness.
+
+**Context:**
+- The student's answer and the official answer may be in different languages (e.g., English and Hindi).
+- Your evaluation must be based on the *meaning and core concepts*, not just keyword matching.
+
+**Official Answer:**
+---
+{official_answer}
+---
+
+**Student's Answer:**
+---
+{student_answer}
+---
+
+**Your Task:**
+1.  Compare the student's answer to the official answer.
+2.  Provide a numerical score from 0 to 100.
+3.  Provide a brief, one-sentence justification for your score.
+
+**Mandatory Output Format:**
+You MUST return your response in a single line with the format: `score|justification`
+**Example:** `90|The student correctly explained the concept but missed one minor detail mentioned in the official answer.`
+"""
+
+BATCH_EVALUATION_PROMPT_TEMPLATE = """
+You are an expert, impartial examiner. Your task is to evaluate several of a student's answers against the official model answers and provide a score for each based on semantic correctness.
+
+**Context:**
+- The student's answers and the official answers may be in different languages (e.g., English and Hindi).
+- Your evaluation must be based on the *meaning and core concepts*, not just keyword matching.
+- Evaluate every item independently of the others.
+
+**Items to Evaluate (JSON):**
+---
+{items_json}
+---
+
+**Your Task:**
+1.  For each item, compare the `student_answer` to the `official_answer`.
+2.  Provide a numerical score from 0 to 100.
+3.  Provide a brief, one-sentence justification for the score.
+
+**Mandatory Output Format:**
+Return a single JSON array with exactly one object per item, each containing these three keys:
+-   `"question_number"`: Copied exactly from the item.
+-   `"score"`: An integer from 0 to 100.
+-   `"justification"`: The one-sentence justification.
+**Example:** `[{{"question_number": "4 (i)", "score": 90, "justification": "The student matched the correct item but misspelled it."}}]`
+
+Your entire response must ONLY be the raw JSON array, without markdown formatting.
+"""
+
+
+CONTINUATION_PROMPT = """
+Your previous response was cut off before the JSON array was complete. These question numbers were already received, so do NOT repeat them:
+{received}
+
+{remaining}
+Follow exactly the same rules and output format as before. Your entire response must ONLY be the raw JSON array of the missing objects.
+"""
+MISSING_NUMBERS_INSTRUCTION = "Return ONLY the objects for these question numbers: {missing}"
+CONTINUE_INSTRUCTION = "Return ONLY the objects for the questions that come after them, up to the last question of the paper."
+MAX_FOLLOW_UPS = 2  # extra requests for the missing tail of a cut-off reply
+REPLAY_RECORDINGS_DIR = os.path.dirname(os.path.abspath(__file__))  # holds the recorded outputs the replay backend serves
+
+WINDOW_INSTRUCTION = """
+**Page Window:** The answer images you have been given are only pages {first} to {last} of the student's answer sheet; the other pages are transcribed separately. Still list every question of the question paper. Transcribe every answer, or part of an answer, written on these pages. If an answer starts before page {first} or continues after page {last}, transcribe only the part visible on these pages. Questions whose answers are not on these pages are "Not Answered".
+"""
+WINDOW_ATTEMPTS = 3  # a failed page window is retried on its own this many times in total
+MAX_PENDING_PAGE_UPLOADS = 8  # encoded pages waiting for their upload before rendering pauses
+
+
+class PipelineError(Exception):
+    """Raised when a pipeline step cannot produce usable output."""
+
+    def __init__(self, step_name, message, raw_response=None):
+        super().__init__(f"Error during '{step_name}': {message}")
+        self.step_name = step_name
+        self.raw_response = raw_response
+
+
+# --- All Helper Functions ---
+def _generate_items(model, parts, rate_limiter, stream, raw_chunks, step_name, tracer):
+    """Yield the objects of one model reply as they complete, then return the parser.
+
+    The call is traced as a ``generate`` span and the time spent parsing as
+    a ``json_parse`` span (parsing is interleaved with the stream, so its
+    span covers only the summed parse time).
+    """
+    parser = JsonArrayStream()
+    prompt_bytes = sum(len(part.encode("utf-8")) for part in parts if isinstance(part, str))
+    parse_seconds, response_chars = 0.0, 0
+    with span(tracer, "generate", step=step_name, stream=stream, bytes_sent=prompt_bytes, retries=0) as trace:
+        if stream:
+            response = call_with_retry(lambda: model.generate_content(parts, stream=True),
+                                       rate_limiter=rate_limiter, trace=trace)
+        else:
+            response = call_with_retry(lambda: model.generate_content(parts), rate_limiter=rate_limiter, trace=trace)
+        try:
+            for chunk in (response if stream else [response]):
+                raw_chunks.append(chunk.text)
+                response_chars += len(raw_chunks[-1])
+                record_usage(trace, chunk)
+                start = time.time()
+                items = parser.feed(raw_chunks[-1])
+                parse_seconds += time.time() - start
+                yield from items
+        except Exception as e:
+            # A broken stream is a broken tail: keep what arrived and ask again for the rest.
+            trace["error"] = str(e)
+        trace["response_chars"] = response_chars
+    if tracer is not None:
+        end = time.time()
+        tracer.add("json_parse", end - parse_seconds, end, step=step_name, complete=parser.complete,
+                   malformed=parser.malformed)
+    return parser
+
+
+def stream_model_json(model, parts, step_name, rate_limiter=None, expected_numbers=None, stream=True,
+                      completed=None, tracer=None):
+    """Yield the question objects of the model's JSON array reply as soon as each one is complete.
+
+    If the reply is cut off, every object before the break is kept and the
+    model is asked again only for what is missing: the ``expected_numbers``
+    not yet received or, when those are unknown, the questions after the
+    last one received. Objects repeating a question number are dropped.
+    ``completed`` (a list) gets ``True`` appended when the result is known
+    to be whole, so callers only cache whole results. Raises
+    ``PipelineError`` when no object could be recovered.
+    """
+    received, raw_chunks, request, whole = [], [], parts, False
+    for _ in range(1 + MAX_FOLLOW_UPS):
+        generator = _generate_items(model, request, rate_limiter, stream, raw_chunks, step_name, tracer)
+        while True:
+            try:
+                item = next(generator)
+            except StopIteration as stop:
+                parser = stop.value
+                break
+            except Exception:
+                if request is parts:
+                    raise
+                parser = None  # a failed follow-up request: keep the partial result
+                break
+            if isinstance(item, dict) and item.get("question_number") not in received:
+                received.append(item.get("question_number"))
+                yield item
+        if parser is None:
+            break
+        missing = [q for q in expected_numbers or [] if q not in received]
+        if not received or (parser.complete and not (parser.malformed and missing)):
+            whole = parser.complete and not parser.malformed
+            break
+        if expected_numbers is not None and not missing:
+            whole = True
+            break
+        remaining = MISSING_NUMBERS_INSTRUCTION.format(missing=", ".join(missing)) if missing else CONTINUE_INSTRUCTION
+        request = list(parts) + [CONTINUATION_PROMPT.format(received=", ".join(map(str, received)), remaining=remaining)]
+
+    if not received:
+        message = ("The AI returned no answers." if whole else
+                   "The AI returned a response that could not be parsed as JSON, even after cleaning.")
+        raise PipelineError(step_name, message, "".join(raw_chunks))
+    if whole and completed is not None:
+        completed.append(True)
+
+
+def configure_model(api_key=None, model_name=MODEL_NAME, backend=None):
+    """Create the model backend named by ``backend`` or ``$GRADER_BACKEND``: ``gemini`` (default) or ``replay``."""
+    backend = backend or os.getenv("GRADER_BACKEND", "gemini")
+    if backend == "replay":
+        return load_replay_backend()
+    if backend != "gemini":
+        raise ValueError(f"Unknown model backend: {backend}")
+    return GeminiBackend(model_name, api_key=api_key or os.getenv("GEMINI_API_KEY"))
+
+
+def load_replay_backend(recordings_dir=REPLAY_RECORDINGS_DIR, **options):
+    """A ``ReplayBackend`` serving the recorded outputs bundled with the repository.
+
+    Step 2 replays ``Student_QNA/student_final_verified_qna.json``, Step 3
+    ``Original_Answer/original_answer.json`` and Step 4 the grades in
+    ``Final_Evaluation/evaluation_report.txt``. ``options`` are passed to
+    ``ReplayBackend`` (latency, error injection, ...).
+    """
+    with open(os.path.join(recordings_dir, "Student_QNA", "student_final_verified_qna.json"), encoding="utf-8") as f:
+        student_answers = json.load(f)
+    with open(os.path.join(recordings_dir, "Original_Answer", "original_answer.json"), encoding="utf-8") as f:
+        official_answers = json.load(f)
+    with open(os.path.join(recordings_dir, "Final_Evaluation", "evaluation_report.txt"), encoding="utf-8") as f:
+        grades = {
+            item["question_number"]: (item["score"], item["justification"])
+            for item in parse_text_report(f.read()) if item["score"] is not None
+        }
+    return ReplayBackend(student_answers, official_answers, grades=grades, **options)
+
+
+def _notify(on_step, message):
+    if on_step:
+        on_step(message)
+
+
+@contextmanager
+def _timed(timings, stage):
+    """Add the wall time of the block to ``timings[stage]`` (if ``timings`` is given)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+@contextmanager
+def _upload_session(uploads, model):
+    """Use the caller's ``UploadManager`` or a temporary one for ``model``'s backend, cleaned up afterwards."""
+    if uploads is not None:
+        yield uploads
+    else:
+        with UploadManager(upload_file=model.upload_file, delete_file=model.delete_file) as temporary:
+            yield temporary
+
+
+# --- Steps 1-2: Student's answers ---
+def _transcribe_windows(model, question_file, page_files, page_keys, page_numbers, windows, sheet_key, cache,
+                        rate_limiter, expected_numbers, stream, max_workers, tracer):
+    """Transcribe page ``windows`` concurrently. Returns ``(merged_answers, whole)``.
+
+    Each window is cached under the hashes of its own pages, so after a
+    failure only the windows that did not finish are sent again.
+    """
+    def transcribe(window):
+        start, end = window
+        first, last = page_numbers[start], page_numbers[end - 1]
+        prompt = MASTER_QNA_PROMPT_STUDENT + WINDOW_INSTRUCTION.format(first=first, last=last)
+        key = make_key("student_qna_window", sheet_key, prompt, *page_keys[start:end])
+        if cache is not None:
+            with span(tracer, "generate", step=f"pages {first}-{last}", cache_hit=False) as trace:
+                cached = cache.get_json(key)
+                trace["cache_hit"] = cached is not None
+            if cached is not None:
+                return cached, True
+        parts = [prompt, question_file] + page_files[start:end]
+        for attempt in range(WINDOW_ATTEMPTS):
+            completed = []
+            try:
+                items = list(stream_model_json(
+                    model, parts, f"Student Answer Extraction (pages {first}-{last})", rate_limiter=rate_limiter,
+                    expected_numbers=expected_numbers, stream=stream, completed=completed, tracer=tracer
+                ))
+            except Exception:
+                if attempt == WINDOW_ATTEMPTS - 1:
+                    raise
+                continue
+            if cache is not None and completed:
+                cache.put_json(key, items)
+            return items, bool(completed)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(windows)))) as pool:
+        results = list(pool.map(transcribe, windows))
+    with span(tracer, "merge", step="page windows", items=len(windows)):
+        merged = merge_window_answers(items for items, _ in results)
+    return merged, all(whole for _, whole in results)
+
+
+def iter_student_answers(model, student_pdf_bytes, question_pdf_bytes, cache=None, uploads=None,
+                         rate_limiter=None, render_workers=None, render_profile=DEFAULT_RENDER_PROFILE,
+                         on_step=None, timings=None, expected_numbers=None, stream=True,
+                         window_pages=DEFAULT_WINDOW_PAGES, window_overlap=DEFAULT_WINDOW_OVERLAP, window_workers=4,
+                         memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, tracer=None):
+    """Steps 1-2, yielding each transcribed answer as soon as the model has finished it.
+
+    Pages flow through one at a time: each is rendered, preprocessed and
+    encoded, then starts uploading and its bytes are dropped once the upload
+    finishes. Rendering pauses while ``MAX_PENDING_PAGE_UPLOADS`` pages are
+    still uploading, and ``memory_budget_mb`` caps the render workers, so
+    memory does not grow with the number of pages. Stage
+    wall times (``preprocess``, ``upload``, ``generate``) are added to
+    ``timings`` when a dict is passed. Page uploads are released once the
+    model has answered; the question paper is kept for reuse. If the reply
+    is cut off, only the missing questions (``expected_numbers`` when known)
+    are requested again.
+
+    Sheets with more than ``window_pages`` non-blank pages are transcribed
+    in overlapping windows, up to ``window_workers`` at a time, and merged
+    by question number; those answers are yielded once every window is done.
+    Every stage is recorded on ``tracer`` when one is given.
+    """
+    model_name = getattr(model, "model_name", MODEL_NAME)
+    render_settings = json.dumps(get_profile(render_profile), sort_keys=True)
+    key = make_key("student_qna", model_name, MASTER_QNA_PROMPT_STUDENT, render_settings, student_pdf_bytes, question_pdf_bytes)
+    if cache is not None:
+        with span(tracer, "generate", step="Student Answer Extraction", cache_hit=False) as trace:
+            cached = cache.get_json(key, bytes_saved=len(student_pdf_bytes) + len(question_pdf_bytes))
+            trace["cache_hit"] = cached is not None
+        if cached is not None:
+            _notify(on_step, "Steps 1-2/5: Student's answers loaded from cache.")
+            yield from cached
+            return
+
+    student_qna_data, completed = [], []
+    with _upload_session(uploads, model) as uploads:
+        _notify(on_step, "Step 1/5: Converting and cleaning student's answer sheet...")
+        question_key = uploads.submit(question_pdf_bytes, "application/pdf", "question_paper.pdf", keep=True, tracer=tracer)
+        page_keys, page_numbers, pending = [], [], deque()
+        try:
+            with _timed(timings, "preprocess"):
+                pages = iter_preprocessed_pages(student_pdf_bytes, workers=render_workers, profile=render_profile,
+                                                tracer=tracer, memory_budget_mb=memory_budget_mb)
+                blank_pages = 0
+                for i, image_bytes, mime_type in pages:
+                    if image_bytes is None:
+                        blank_pages += 1
+                        continue
+                    if len(pending) >= MAX_PENDING_PAGE_UPLOADS:
+                        uploads.result(pending.popleft())
+                    extension = mime_type.split("/")[1]
+                    page_keys.append(uploads.submit(image_bytes, mime_type, f"answer_page_{i+1}.{extension}", tracer=tracer))
+                    page_numbers.append(i + 1)
+                    pending.append(page_keys[-1])
+
+            if blank_pages:
+                _notify(on_step, f"Skipped {blank_pages} blank page(s); they will not be sent to the AI.")
+            _notify(on_step, "Step 2/5: Reading student's answers using AI...")
+            with _timed(timings, "upload"):
+                question_file = uploads.result(question_key)
+                page_files = [uploads.result(page_key) for page_key in page_keys]
+
+            windows = page_windows(len(page_keys), window_pages, window_overlap)
+            if len(windows) > 1:
+                _notify(on_step, f"Transcribing {len(page_keys)} pages in {len(windows)} overlapping windows...")
+                with _timed(timings, "generate"):
+                    student_qna_data, whole = _transcribe_windows(
+                        model, question_file, page_files, page_keys, page_numbers, windows, key, cache,
+                        rate_limiter, expected_numbers, stream, window_workers, tracer
+                    )
+                if whole:
+                    completed.append(True)
+                yield from student_qna_data
+            else:
+                parts = [MASTER_QNA_PROMPT_STUDENT, question_file] + page_files
+                with _timed(timings, "generate"):
+                    for item in stream_model_json(model, parts, "Student Answer Extraction", rate_limiter=rate_limiter,
+                                                  expected_numbers=expected_numbers, stream=stream, completed=completed,
+                                                  tracer=tracer):
+                        student_qna_data.append(item)
+                        yield item
+        finally:
+            uploads.release(page_keys + [question_key])
+
+    if cache is not None and completed:
+        cache.put_json(key, student_qna_data)
+
+
+def extract_student_answers(model, student_pdf_bytes, question_pdf_bytes, cache=None, uploads=None,
+                            rate_limiter=None, render_workers=None, render_profile=DEFAULT_RENDER_PROFILE,
+                            on_step=None, timings=None, expected_numbers=None, stream=True,
+                            window_pages=DEFAULT_WINDOW_PAGES, window_overlap=DEFAULT_WINDOW_OVERLAP, window_workers=4,
+                            memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, tracer=None):
+    """Steps 1-2. Returns the list of transcribed answers (see ``iter_student_answers``)."""
+    return list(iter_student_answers(
+        model, student_pdf_bytes, question_pdf_bytes, cache=cache, uploads=uploads, rate_limiter=rate_limiter,
+        render_workers=render_workers, render_profile=render_profile, on_step=on_step, timings=timings,
+        expected_numbers=expected_numbers, stream=stream, window_pages=window_pages,
+        window_overlap=window_overlap, window_workers=window_workers, memory_budget_mb=memory_budget_mb, tracer=tracer
+    ))
+
+
+# --- Step 3: Official answers (once per exam when a cache is used) ---
+def _read_official_answers_with_model(model, question_pdf_bytes, answer_key_pdf_bytes, cache, uploads,
+                                      rate_limiter, on_step, timings, message, expected_numbers=None,
+                                      answer_key_pages=None, tracer=None):
+    """Read the official answers with the model, or only ``answer_key_pages`` (0-based) of the key."""
+    model_name = getattr(model, "model_name", MODEL_NAME)
+    # Keyed on the original answer key and page numbers, not on the extracted subset PDF.
+    key = make_key("official_qna", model_name, MASTER_QNA_PROMPT_OFFICIAL, question_pdf_bytes, answer_key_pdf_bytes,
+                   *([json.dumps(answer_key_pages)] if answer_key_pages is not None else []))
+    if cache is not None:
+        with span(tracer, "generate", step="Official Answer Extraction", cache_hit=False) as trace:
+            cached = cache.get_json(key, bytes_saved=len(question_pdf_bytes) + len(answer_key_pdf_bytes))
+            trace["cache_hit"] = cached is not None
+        if cached is not None:
+            _notify(on_step, "Step 3/5: Official answers loaded from cache.")
+            return cached
+
+    _notify(on_step, message)
+    if answer_key_pages is not None:
+        answer_key_pdf_bytes = extract_pages(answer_key_pdf_bytes, answer_key_pages)
+    with _upload_session(uploads, model) as uploads:
+        keys = [
+            uploads.submit(question_pdf_bytes, "application/pdf", "question_paper.pdf", keep=True, tracer=tracer),
+            uploads.submit(answer_key_pdf_bytes, "application/pdf", "official_answer_key.pdf", keep=True, tracer=tracer),
+        ]
+        try:
+            with _timed(timings, "upload"):
+                parts = [MASTER_QNA_PROMPT_OFFICIAL] + [uploads.result(k) for k in keys]
+            completed = []
+            with _timed(timings, "generate"):
+                official_qna_data = list(stream_model_json(
+                    model, parts, "Official Answer Extraction", rate_limiter=rate_limiter,
+                    expected_numbers=expected_numbers, completed=completed, tracer=tracer
+                ))
+        finally:
+            uploads.release(keys)
+    if cache is not None and completed:
+        cache.put_json(key, official_qna_data)
+    return official_qna_data
+
+
+def extract_official_answers(model, question_pdf_bytes, answer_key_pdf_bytes, cache=None, uploads=None,
+                             rate_limiter=None, on_step=None, timings=None, use_text_layer=True, tracer=None):
+    """Step 3. Typed PDFs are read from their text layer; the model only reads what that cannot cover.
+
+    When the question paper is readable but some answers are not (scanned
+    pages, legacy-font Hindi), only the unreadable answer-key pages are sent
+    to the model and its answers fill the gaps.
+    """
+    if use_text_layer:
+        with _timed(timings, "text_layer"), span(tracer, "text_layer") as trace:
+            local = extract_official_answers_locally(question_pdf_bytes, answer_key_pdf_bytes)
+            trace["items"] = len(local["qna"])
+        if local["qna"] and local["question_paper_ok"] and not local["missing"]:
+            _notify(on_step, "Step 3/5: Official answers read from the PDFs' text layer (no AI call needed).")
+            return local["qna"]
+        if local["qna"] and local["question_paper_ok"]:
+            pages = local["low_confidence_pages"] or list(range(page_count(answer_key_pdf_bytes)))
+            model_qna = _read_official_answers_with_model(
+                model, question_pdf_bytes, answer_key_pdf_bytes, cache, uploads, rate_limiter, on_step, timings,
+                f"Step 3/5: {len(local['qna'])} official answers read locally; reading {len(local['missing'])} "
+                f"more from {len(pages)} answer-key page(s) using AI...",
+                expected_numbers=local["missing"], answer_key_pages=pages, tracer=tracer
+            )
+            with span(tracer, "merge", step="Official Answer Extraction", items=len(model_qna)):
+                found = {item["question_number"]: item for item in local["qna"]}
+                for item in model_qna:
+                    found.setdefault(item.get("question_number"), item)
+                ordered = [found[q_num] for q_num in local["question_numbers"] if q_num in found]
+                extra = [item for item in model_qna if item.get("question_number") not in local["question_numbers"]]
+            return ordered + extra
+
+    return _read_official_answers_with_model(
+        model, question_pdf_bytes, answer_key_pdf_bytes, cache, uploads, rate_limiter, on_step, timings,
+        "Step 3/5: Reading official answers using AI...", tracer=tracer
+    )
+
+
+# --- Step 4: Merge and evaluate ---
+def iter_merged_answers(student_qna_data, official_qna_data, tracer=None):
+    """Pair each student answer with its official answer as the student answers arrive.
+
+    The summed merge time (not the wait for answers) is recorded on ``tracer``.
+    """
+    official_map = {item['question_number']: item for item in official_qna_data}
+    merged_count, merge_seconds = 0, 0.0
+    for s_item in student_qna_data:
+        start = time.time()
+        q_num = s_item['question_number']
+        merged = None
+        if q_num in official_map:
+            merged = {
+                "question_number": q_num,
+                "question_text": official_map[q_num].get("question_text", "N/A"),
+                "official_answer": official_map[q_num].get("official_answer_text", ""),
+                "student_answer": s_item.get("answer_text", ""),
+                "status": s_item.get("status", "Not Answered")
+            }
+            merged_count += 1
+        merge_seconds += time.time() - start
+        if merged is not None:
+            yield merged
+    if tracer is not None:
+        end = time.time()
+        tracer.add("merge", end - merge_seconds, end, items=merged_count)
+
+
+def merge_answers(student_qna_data, official_qna_data):
+    return list(iter_merged_answers(student_qna_data, official_qna_data))
+
+
+def evaluate_answers(model, merged_data, max_workers=4, requests_per_minute=None, batch_size=1,
+                     cache=None, rate_limiter=None, on_progress=None, tracer=None, prescorer=None):
+    """Grade merged items. Returns ``(results, batch_stats)``; ``batch_stats`` is ``None`` for per-item grading.
+
+    ``merged_data`` may be an iterator of items still arriving; per-item
+    grading starts on each one immediately, batch grading waits for all.
+    Answers a ``prescorer`` can settle locally are not sent to the model.
+    """
+    if batch_size > 1:
+        return evaluate_items_batched(
+            model, list(merged_data), EVALUATION_PROMPT_TEMPLATE, BATCH_EVALUATION_PROMPT_TEMPLATE,
+            batch_size=batch_size, max_workers=max_workers, requests_per_minute=requests_per_minute,
+            on_progress=on_progress, cache=cache, rate_limiter=rate_limiter, tracer=tracer, prescorer=prescorer
+        )
+    results = evaluate_items(
+        model, merged_data, EVALUATION_PROMPT_TEMPLATE, max_workers=max_workers,
+        requests_per_minute=requests_per_minute, on_progress=on_progress, cache=cache, rate_limiter=rate_limiter,
+        tracer=tracer, prescorer=prescorer
+    )
+    return results, None
+
+
+# --- Step 5: Summary and report ---
+def summarize_results(results):
+    unique_question_numbers = set()
+    for item in results:
+        base_q_num = base_question_number(item.get('question_number', 'N/A'))
+        if base_q_num:
+            unique_question_numbers.add(base_q_num)
+
+    answered_count = sum(1 for item in results if item['status'] == 'Answered' and item.get('score', -1) >= 0)
+    total_score = sum(item.get('score', 0) for item in results if item['status'] == 'Answered' and item.get('score', -1) >= 0)
+    average_score = (total_score / answered_count) if answered_count > 0 else 0
+    return {
+        "total_questions": len(unique_question_numbers),
+        "answered_count": answered_count,
+        "average_score": average_score
+    }
+
+
+def generate_text_report(results, summary):
+    report_lines = []
+    report_lines.append("======================================================")
+    report_lines.append("         AUTOMATED ANSWER EVALUATION REPORT")
+    report_lines.append("======================================================")
+    report_lines.append("\n--- FINAL SUMMARY ---\n")
+    report_lines.append(f"Total Questions: {summary['total_questions']}")
+    report_lines.append(f"Items Attempted: {summary['answered_count']}")
+    report_lines.append(f"Average Score on Attempted Items: {summary['average_score']:.2f}%\n")
+    report_lines.append("======================================================")
+
+    for item in results:
+        report_lines.append(f"\n\n--- Question {item.get('question_number', 'N/A')} ---")
+        report_lines.append(f"Status: {item.get('status', 'N/A')}")
+        report_lines.append(f"Score: {item.get('score', 'N/A')}%")
+        report_lines.append(f"Justification: {item.get('justification', 'N/A')}\n")
+        report_lines.append("👤 Student's Answer:")
+        report_lines.append(f"{item.get('student_answer', 'Not Answered')}\n")
+        report_lines.append("📚 Official Answer:")
+        report_lines.append(f"{item.get('official_answer', 'N/A')}")
+        report_lines.append("------------------------------------------------------")
+    return "\n".join(report_lines)
+
+
+def parse_text_report(text):
+    """Read the per-question results back from a report written by ``generate_text_report``.
+
+    Returns dicts with ``question_number``, ``status``, ``score`` (``None``
+    when missing or not a number), ``justification``, ``student_answer`` and
+    ``official_answer``.
+    """
+    items = []
+    for block in re.split(r"\n--- Question ", text)[1:]:
+        header, _, body = block.partition(" ---")
+        fields = dict(re.findall(r"^(Status|Score|Justification): (.*)$", body, re.M))
+        score = re.match(r"-?\d+", fields.get("Score", ""))
+        answers = re.search(r"👤 Student's Answer:\n(.*?)\n📚 Official Answer:\n(.*?)\n-{20,}", body, re.S)
+        items.append({
+            "question_number": header.strip(),
+            "status": fields.get("Status", "").strip(),
+            "score": int(score.group()) if score else None,
+            "justification": fields.get("Justification", "").strip(),
+            "student_answer": answers.group(1).strip() if answers else "",
+            "official_answer": answers.group(2).strip() if answers else "",
+        })
+    return items
+
+
+def grade_student(model, student_pdf_bytes, question_pdf_bytes, official_qna_data, cache=None,
+                  uploads=None, max_workers=4, requests_per_minute=None, batch_size=1, rate_limiter=None,
+                  render_workers=None, render_profile=DEFAULT_RENDER_PROFILE, on_step=None, on_progress=None,
+                  window_pages=DEFAULT_WINDOW_PAGES, window_overlap=DEFAULT_WINDOW_OVERLAP,
+                  memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, prescore=True, tracer=None):
+    """Run Steps 1-2, 4 and 5 for one student against already extracted official answers.
+
+    Answers are merged and graded while the rest of the answer sheet is
+    still being transcribed. With ``prescore``, blank answers and exact or
+    near matches of the official answer are scored locally; the counts are
+    returned as ``prescore_stats`` (``auto_scored`` is the number of
+    per-answer model calls avoided). Every stage is recorded on ``tracer``
+    when one is given.
+    """
+    timings = {}
+    student_qna_data = []
+    prescorer = PreScorer(item.get("official_answer_text", "") for item in official_qna_data) if prescore else None
+
+    def student_answers():
+        for item in iter_student_answers(
+            model, student_pdf_bytes, question_pdf_bytes, cache=cache, uploads=uploads, rate_limiter=rate_limiter,
+            render_workers=render_workers, render_profile=render_profile, on_step=on_step, timings=timings,
+            expected_numbers=[item["question_number"] for item in official_qna_data],
+            window_pages=window_pages, window_overlap=window_overlap, memory_budget_mb=memory_budget_mb, tracer=tracer
+        ):
+            if not student_qna_data:
+                _notify(on_step, "Step 4/5: Evaluating answers as they arrive...")
+            student_qna_data.append(item)
+            yield item
+
+    start = time.perf_counter()
+    results, batch_stats = evaluate_answers(
+        model, iter_merged_answers(student_answers(), official_qna_data, tracer=tracer), max_workers=max_workers,
+        requests_per_minute=requests_per_minute, batch_size=batch_size, cache=cache, rate_limiter=rate_limiter,
+        on_progress=on_progress, tracer=tracer, prescorer=prescorer
+    )
+    # Grading overlaps Step 2, so "evaluate" is the time left after the answers were read.
+    timings["evaluate"] = max(0.0, time.perf_counter() - start - sum(timings.values()))
+    _notify(on_step, "Step 5/5: Compiling the final report...")
+    with span(tracer, "report", items=len(results)):
+        summary = summarize_results(results)
+        report = generate_text_report(results, summary)
+    return {
+        "student_qna_data": student_qna_data,
+        "results": results,
+        "summary": summary,
+        "report": report,
+        "batch_stats": batch_stats,
+        "prescore_stats": dict(prescorer.stats) if prescorer else None,
+        "timings": timings,
+    }
@@ -0,0 +1,228 @@
+"""Local pre-scoring of answers that do not need the model.
+
+Both answers are normalised (case, punctuation, Devanagari digits, nukta,
+chandrabindu and half-nasal spellings, zero-width joiners, British/American
+spellings). ``PreScorer`` then settles the obvious cases locally:
+
+- blank answers score 0;
+- answers equal to the official answer after normalisation score 100, and
+  so do answers that differ from it by spelling alone (word for word, each
+  word close in edit distance, no negation or contrasting prefix such as
+  in-/un-/micro-/macro-) with a character n-gram TF-IDF cosine (or, for
+  short answers, an edit-distance similarity) of at least
+  ``MATCH_THRESHOLD``;
+- a bare option letter (``(c)``, ``स``) or a true/false answer (``True``,
+  ``सत्य``) is compared with the official answer and scores 100 or 0; an
+  option letter followed by text scores 100 only if both the letter and
+  the text match (``A. Smith`` is not ``A. Marshall``, and ``J. Keynes``
+  is not ``A. Keynes``);
+- a plain number scores 100 if its value equals the official number
+  (``1,000`` = ``1000``, ``2.5`` = ``2.50``).
+
+Everything else, including differing numbers and answers in a different
+script than the official answer, is left to the model.
+"""
+import math
+import re
+from decimal import Decimal
+import threading
+import unicodedata
+from collections import Counter
+
+import numpy as np
+
+MATCH_THRESHOLD = 0.9      # similarity at or above which an answer counts as the official answer
+SHORT_ANSWER_WORDS = 4     # answers up to this many words are also compared by edit distance
+NGRAM_SIZE = 3             # characters per n-gram (words are padded with a space on each side)
+LOCAL_JUSTIFICATION_PREFIX = "Auto-scored locally:"
+
+# Hindi option letters in the order they label choices (a), (b), (c), (d).
+OPTION_LETTERS = {"अ": "a", "ब": "b", "स": "c", "द": "d", "क": "a", "ख": "b", "ग": "c", "घ": "d"}
+OPTION_LABEL_RE = re.compile(r"^\s*\(?\s*([a-h]|[अबसदकखगघ])\s*[).:]\s*|^\s*\(?\s*([a-h]|[अबसदकखगघ])\s*\)?\s*$", re.I)
+BOOLEAN_ANSWERS = {
+    "true": True, "correct": True, "right": True, "सत्य": True, "सही": True,
+    "false": False, "incorrect": False, "wrong": False, "असत्य": False, "गलत": False,
+}
+BLANK_ANSWERS = {"", "not answered", "no answer", "unanswered"}
+NUMBER_RE = re.compile(r"[+-]?(?:\d{1,3}(?:,\d{2,3})+|\d+)(?:\.\d+)?|[+-]?\.\d+")  # 1,000 / 1,00,000 / 2.50
+SPELLING_THRESHOLD = 0.75  # edit similarity at or above which two different words count as spelling variants
+NEGATION_WORDS = {"not", "no", "never", "none", "nor", "neither", "cannot", "without", "नहीं", "न", "ना", "मत", "बिना"}
+# Prefixes that turn a word into its opposite or a different concept: elastic/inelastic, micro-/macroeconomics.
+CONTRASTING_PREFIXES = ("micro", "macro", "non", "dis", "in", "im", "il", "ir", "un", "de", "अ", "अन", "गैर")
+
+DEVANAGARI_DIGITS = str.maketrans("०१२३४५६७८९", "0123456789")
+NON_WORD_RE = re.compile(r"[^\w\u0900-\u0963\u0966-\u097F]+")  # keeps Devanagari vowel signs, drops the danda
+HALF_NASAL_RE = re.compile(r"[\u0919\u091E\u0923\u0928\u092E]\u094D(?=[\u0915-\u0939])")  # e.g. सम्बन्ध -> संबंध
+ENGLISH_VARIANTS = [  # British spelling -> American, applied to whole words
+    (re.compile(r"(\w{3,})is(ation|ations|e|es|ed|ing)\b"), r"\1iz\2"),
+    (re.compile(r"(\w{3,})our\b"), r"\1or"),
+    (re.compile(r"(\w{3,})tre\b"), r"\1ter"),
+]
+
+
+def split_option_label(text):
+    """Split a leading option label off an answer: ``"(स) प्रत्यक्ष"`` -> ``("c", "प्रत्यक्ष")``."""
+    match = OPTION_LABEL_RE.match(text or "")
+    if not match:
+        return None, text or ""
+    letter = (match.group(1) or match.group(2)).lower()
+    return OPTION_LETTERS.get(letter, letter), text[match.end():]
+
+
+def normalize_answer(text):
+    """Lower-case ``text`` and reduce punctuation and spelling variants, so equal answers compare equal."""
+    text = unicodedata.normalize("NFC", text or "").lower().translate(DEVANAGARI_DIGITS)
+    # Drop nukta and zero-width (non-)joiners, write chandrabindu and half nasals as anusvara.
+    text = text.replace("\u093C", "").replace("\u200C", "").replace("\u200D", "").replace("\u0901", "\u0902")
+    text = HALF_NASAL_RE.sub("\u0902", text)
+    text = " ".join(NON_WORD_RE.sub(" ", text).split())
+    for pattern, replacement in ENGLISH_VARIANTS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def script_of(text):
+    """``"devanagari"``, ``"latin"`` or ``""`` (no letters), by majority of letters."""
+    devanagari = sum(1 for ch in text if "\u0900" <= ch <= "\u097F")
+    latin = sum(1 for ch in text if "a" <= ch <= "z")
+    if not devanagari and not latin:
+        return ""
+    return "devanagari" if devanagari >= latin else "latin"
+
+
+def char_ngrams(text, n=NGRAM_SIZE):
+    grams = []
+    for word in text.split():
+        padded = f" {word} "
+        grams.extend(padded[i:i + n] for i in range(max(1, len(padded) - n + 1)))
+    return grams
+
+
+def edit_similarity(a, b):
+    """``1 - levenshtein(a, b) / max(len(a), len(b))``."""
+    previous = list(range(len(b) + 1))
+    for i, ch in enumerate(a, 1):
+        current = [i]
+        for j, other in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ch != other)))
+        previous = current
+    return 1.0 - previous[-1] / max(len(a), len(b), 1)
+
+
+def parse_number(text):
+    """The value of a plain number answer (``"1,000"``, ``"2.50"``, ``"१२"``) as a ``Decimal``, else ``None``."""
+    text = unicodedata.normalize("NFC", text or "").translate(DEVANAGARI_DIGITS).strip().rstrip(".")
+    if not NUMBER_RE.fullmatch(text):
+        return None
+    return Decimal(text.replace(",", ""))
+
+
+def split_contrasting_prefix(word):
+    """Split a contrasting prefix off ``word``: ``"inelastic"`` -> ``("in", "elastic")``, else ``("", word)``."""
+    for prefix in CONTRASTING_PREFIXES:
+        if word.startswith(prefix) and len(word) - len(prefix) >= 3:
+            return prefix, word[len(prefix):]
+    return "", word
+
+
+def is_spelling_variant(a, b):
+    """True if the words ``a`` and ``b`` are spellings of the same word rather than different words."""
+    if a == b:
+        return True
+    if a in NEGATION_WORDS or b in NEGATION_WORDS or any(ch.isdigit() for ch in a + b):
+        return False
+    if edit_similarity(a, b) < SPELLING_THRESHOLD:
+        return False
+    (prefix_a, stem_a), (prefix_b, stem_b) = split_contrasting_prefix(a), split_contrasting_prefix(b)
+    # inelastic/elastic, microeconomics/macroeconomics: same stem behind different prefixes.
+    return prefix_a == prefix_b or edit_similarity(stem_a, stem_b) < SPELLING_THRESHOLD
+
+
+def differs_by_spelling_only(a, b):
+    """True if the normalised answers ``a`` and ``b`` have the same words, some of them spelled differently."""
+    words_a, words_b = a.split(), b.split()
+    return len(words_a) == len(words_b) and all(map(is_spelling_variant, words_a, words_b))
+
+
+class PreScorer:
+    """Scores clear-cut answers locally; ``score(item)`` returns ``None`` for the ones the model must grade.
+
+    The n-gram IDF weights are fitted on the exam's official answers, so
+    n-grams common to many answers (case endings, "the", "है") count less.
+    ``stats`` counts the answers checked, scored locally (matched,
+    mismatched, blank) and sent to the model; it is safe to share between
+    threads.
+    """
+
+    def __init__(self, official_answers, match_threshold=MATCH_THRESHOLD):
+        documents = [set(char_ngrams(normalize_answer(split_option_label(text)[1]))) for text in official_answers]
+        document_frequency = Counter(gram for grams in documents for gram in grams)
+        self.idf = {gram: math.log((1 + len(documents)) / (1 + df)) + 1 for gram, df in document_frequency.items()}
+        self.unseen_idf = math.log(1 + len(documents)) + 1
+        self.match_threshold = match_threshold
+        self.lock = threading.Lock()
+        self.stats = {"checked": 0, "auto_scored": 0, "matched": 0, "mismatched": 0, "blank": 0, "sent_to_model": 0}
+
+    def similarity(self, a, b):
+        """Cosine similarity of the TF-IDF weighted character n-grams of two normalised answers."""
+        counts_a, counts_b = Counter(char_ngrams(a)), Counter(char_ngrams(b))
+        vocabulary = list(counts_a.keys() | counts_b.keys())
+        if not vocabulary:
+            return 0.0
+        idf = np.array([self.idf.get(gram, self.unseen_idf) for gram in vocabulary])
+        vector_a = np.array([counts_a[gram] for gram in vocabulary], dtype=float) * idf
+        vector_b = np.array([counts_b[gram] for gram in vocabulary], dtype=float) * idf
+        norm = np.linalg.norm(vector_a) * np.linalg.norm(vector_b)
+        return float(vector_a @ vector_b / norm) if norm else 0.0
+
+    def decide(self, student_answer, official_answer):
+        """Return ``(score, justification, outcome)`` or ``None`` if the answer is ambiguous."""
+        student_label, student_text = split_option_label(student_answer)
+        official_label, official_text = split_option_label(official_answer)
+        student, official = normalize_answer(student_text), normalize_answer(official_text)
+
+        if not student_label and student in BLANK_ANSWERS:
+            return 0, f"{LOCAL_JUSTIFICATION_PREFIX} the answer is blank.", "blank"
+        if student_label and official_label:
+            if not student:
+                if student_label == official_label:
+                    return 100, f"{LOCAL_JUSTIFICATION_PREFIX} the chosen option matches the official answer.", "matched"
+                return 0, f"{LOCAL_JUSTIFICATION_PREFIX} a different option than the official answer was chosen.", "mismatched"
+            if student_label == official_label and student == official:
+                return 100, f"{LOCAL_JUSTIFICATION_PREFIX} the chosen option and its text match the official answer.", "matched"
+            # The label may be an initial ("A. Marshall") rather than an option: let the model compare the text.
+            return None
+        if student in BOOLEAN_ANSWERS and official in BOOLEAN_ANSWERS:
+            if BOOLEAN_ANSWERS[student] == BOOLEAN_ANSWERS[official]:
+                return 100, f"{LOCAL_JUSTIFICATION_PREFIX} the true/false answer matches the official answer.", "matched"
+            return 0, f"{LOCAL_JUSTIFICATION_PREFIX} the true/false answer is the opposite of the official answer.", "mismatched"
+        student_number, official_number = parse_number(student_text), parse_number(official_text)
+        if student_number is not None and official_number is not None:
+            if student_number == official_number:
+                return 100, f"{LOCAL_JUSTIFICATION_PREFIX} the number matches the official answer.", "matched"
+            return None
+        if student and student == official:
+            return 100, f"{LOCAL_JUSTIFICATION_PREFIX} the answer is identical to the official answer.", "matched"
+        if not student or not official or script_of(student) != script_of(official) or not script_of(student):
+            return None
+        if not differs_by_spelling_only(student, official):
+            return None
+
+        similarity = self.similarity(student, official)
+        if len(student.split()) <= SHORT_ANSWER_WORDS and len(official.split()) <= SHORT_ANSWER_WORDS:
+            similarity = max(similarity, edit_similarity(student, official))
+        if similarity >= self.match_threshold:
+            return 100, f"{LOCAL_JUSTIFICATION_PREFIX} the answer matches the official answer (similarity {similarity:.2f}).", "matched"
+        return None
+
+    def score(self, item):
+        """Pre-score a merged item. Returns ``(score, justification)`` or ``None``."""
+        decision = self.decide(item.get("student_answer", ""), item.get("official_answer", ""))
+        with self.lock:
+            self.stats["checked"] += 1
+            if decision is None:
+                self.stats["sent_to_model"] += 1
+                return None
+            self.stats["auto_scored"] += 1
+            self.stats[decision[2]] += 1
+        return decision[0], decision[1]
@@ -0,0 +1,268 @@
+"""Step 1: render PDF pages and preprocess them entirely in memory.
+
+Pages are converted straight from the pixmap sample buffer into NumPy
+arrays (no PNG round-trip, no channel-swap copy), preprocessed across a
+process pool and yielded as encoded image bytes in page order, ready to be
+uploaded without touching the filesystem.
+
+How a page is rendered and encoded is controlled by a render profile (see
+``RENDER_PROFILES``): resolution, colour mode, preprocessing preset,
+cropping of blank margins, skipping of blank pages and the image encoding.
+
+Memory stays bounded regardless of page count: only a few pages per worker
+are in flight at once, and a per-session ``memory_budget_mb`` caps the number
+of render workers based on the size of the largest page.
+"""
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+import cv2
+import numpy as np
+import pymupdf
+
+from preprocessing import binarize, crop_to_content, get_preset, is_blank, preprocess_page
+
+# dpi:           render resolution; max_long_side caps the pixel size of very large (scanned) pages.
+# mode:          "color", "gray" or "binarized" (gray + the preprocessing preset).
+# preprocess:    preprocessing preset; in "color"/"gray" mode it is only used to detect blank pages.
+# format:        "png", "png-bilevel" (1 bit per pixel), "webp", "jpeg", or "auto" (1-bit PNG for binarised images, else
+#                the smallest lossless encoding).
+# crop:          trim blank margins around the ink bounding box.
+# skip_blank:    do not encode (and so never upload) pages without ink.
+RENDER_PROFILES = {
+    "legacy": {"dpi": 72, "max_long_side": None, "mode": "binarized", "preprocess": "legacy",
+               "format": "png", "png_compression": 6, "crop": False, "skip_blank": False},
+    "handwriting": {"dpi": 200, "max_long_side": 2400, "mode": "binarized", "preprocess": "handwriting",
+                    "format": "png-bilevel", "crop": True, "skip_blank": True},
+    "grayscale": {"dpi": 150, "max_long_side": 2000, "mode": "gray", "preprocess": "handwriting",
+                  "format": "webp", "webp_quality": 85, "crop": True, "skip_blank": True},
+    "color": {"dpi": 150, "max_long_side": 2000, "mode": "color", "preprocess": "handwriting",
+              "format": "jpeg", "jpeg_quality": 85, "crop": True, "skip_blank": True},
+    "auto": {"dpi": 200, "max_long_side": 2400, "mode": "binarized", "preprocess": "handwriting",
+             "format": "auto", "crop": True, "skip_blank": True},
+}
+DEFAULT_RENDER_PROFILE = "auto"
+
+MIME_TYPES = {"png": "image/png", "webp": "image/webp", "jpeg": "image/jpeg"}
+
+DEFAULT_MEMORY_BUDGET_MB = int(os.getenv("GRADER_MEMORY_BUDGET_MB", "1024"))  # per grading session
+WORKER_OVERHEAD_BYTES = 150 * 1024 * 1024  # a spawned worker with PyMuPDF, OpenCV and NumPy loaded
+PAGE_BYTES_PER_PIXEL = 8       # RGB render plus the grayscale, blurred, thresholded and rotated copies
+PAGES_IN_FLIGHT_PER_WORKER = 2  # pages submitted ahead of the one being consumed
+COLORSPACE_COMPONENTS = {"DeviceGray": 1, "DeviceRGB": 3, "DeviceCMYK": 4}  # bytes per pixel of decoded images
+
+_worker_doc = None
+_worker_profile = None
+
+
+def get_profile(profile):
+    return RENDER_PROFILES[profile] if isinstance(profile, str) else profile
+
+
+def pixmap_to_array(pix):
+    """View a pixmap's samples as an ``(h, w, n)`` uint8 array without copying.
+
+    The view is only valid while ``pix`` is alive; copy it before the pixmap is freed.
+    """
+    samples = pix.samples_mv if hasattr(pix, "samples_mv") else pix.samples
+    return np.frombuffer(samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+
+
+def render_scale(page, profile):
+    scale = profile["dpi"] / 72.0
+    if profile.get("max_long_side"):
+        long_side = max(page.rect.width, page.rect.height) * scale
+        scale = min(scale, scale * profile["max_long_side"] / long_side)
+    return scale
+
+
+def render_page(page, profile):
+    """Render ``page`` as an RGB (``mode="color"``) or grayscale array."""
+    scale = render_scale(page, profile)
+    pix = page.get_pixmap(matrix=pymupdf.Matrix(scale, scale))
+    image = pixmap_to_array(pix)
+    if pix.n < 3:
+        return image[:, :, 0].copy()
+    if profile["mode"] == "color":
+        return image.copy()  # the view dies with ``pix`` when this function returns
+    # Pixmaps are RGB, so convert with RGB weights instead of reversing channels to BGR first.
+    return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+
+
+def prepare_image(image, profile):
+    """Apply the profile's colour mode, preprocessing and cropping to a rendered RGB or grayscale page.
+
+    Returns ``(image, blank)``.
+    """
+    profile = get_profile(profile)
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    if profile["mode"] == "binarized":
+        result = preprocess_page(gray, profile["preprocess"], crop=profile.get("crop", False))
+        return result["image"], result["blank"]
+
+    blank = is_blank(binarize(gray, get_preset(profile["preprocess"])))
+    if profile["mode"] == "gray":
+        image = gray
+    if profile.get("crop") and not blank:
+        image = crop_to_content(image)
+    return image, blank
+
+
+def _encode(image, extension, params):
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    ok, encoded = cv2.imencode(extension, image, params)
+    if not ok:
+        raise ValueError(f"Could not encode page image as {extension}.")
+    return encoded.tobytes()
+
+
+def _is_bilevel(image):
+    """True if a grayscale image holds only black (0) and white (255) pixels."""
+    histogram = cv2.calcHist([image], [0], None, [256], [0, 256])
+    return histogram[1:255].sum() == 0
+
+
+def encode_image(image, profile):
+    """Encode ``image`` as the profile asks. Returns ``(data, mime_type)``."""
+    profile = get_profile(profile)
+    fmt = profile["format"]
+    if fmt == "auto":
+        # A bilevel image goes straight to 1-bit PNG: lossless WebP is ~20% smaller but takes four times
+        # as long to encode. Other images try the lossless candidates and keep the smallest.
+        if image.ndim == 2 and image.dtype == np.uint8 and _is_bilevel(image):
+            return encode_image(image, {"format": "png-bilevel"})
+        candidates = [encode_image(image, {"format": "png", "png_compression": 9}),
+                      encode_image(image, {"format": "webp", "webp_quality": 101})]
+        return min(candidates, key=lambda candidate: len(candidate[0]))
+    if fmt == "png":
+        return _encode(image, ".png", [cv2.IMWRITE_PNG_COMPRESSION, profile.get("png_compression", 9)]), MIME_TYPES["png"]
+    if fmt == "png-bilevel":
+        return _encode(image, ".png", [cv2.IMWRITE_PNG_BILEVEL, 1, cv2.IMWRITE_PNG_COMPRESSION, 9]), MIME_TYPES["png"]
+    if fmt == "webp":
+        return _encode(image, ".webp", [cv2.IMWRITE_WEBP_QUALITY, profile.get("webp_quality", 85)]), MIME_TYPES["webp"]
+    if fmt == "jpeg":
+        return _encode(image, ".jpg", [cv2.IMWRITE_JPEG_QUALITY, profile.get("jpeg_quality", 85)]), MIME_TYPES["jpeg"]
+    raise ValueError(f"Unknown image format: {fmt}")
+
+
+def process_page(doc, page_index, profile=DEFAULT_RENDER_PROFILE, stage_times=None):
+    """Render, preprocess and encode one page of an open document.
+
+    Returns ``(data, mime_type)``, or ``(None, None)`` for a blank page when
+    the profile skips blank pages. ``(stage, start, end)`` wall-clock times
+    of the render, preprocess and encode stages are appended to
+    ``stage_times`` when a list is given.
+    """
+    profile = get_profile(profile)
+    times = [time.time()]
+    rendered = render_page(doc[page_index], profile)
+    # MuPDF keeps decoded page images in a process-wide store (256 MB by default); empty it after every
+    # page so memory does not grow with the number of pages rendered.
+    pymupdf.TOOLS.store_shrink(100)
+    times.append(time.time())
+    image, blank = prepare_image(rendered, profile)
+    times.append(time.time())
+    if blank and profile.get("skip_blank"):
+        encoded = None, None
+    else:
+        encoded = encode_image(image, profile)
+    times.append(time.time())
+    if stage_times is not None:
+        stage_times.extend((stage, times[i], times[i + 1]) for i, stage in enumerate(("render", "preprocess", "encode")))
+    return encoded
+
+
+def _init_worker(pdf_bytes, profile):
+    global _worker_doc, _worker_profile
+    _worker_doc = pymupdf.open(stream=pdf_bytes, filetype="pdf")
+    _worker_profile = profile
+
+
+def _process_page_in_worker(page_index):
+    stage_times = []
+    data, mime_type = process_page(_worker_doc, page_index, _worker_profile, stage_times)
+    return data, mime_type, stage_times, os.getpid()
+
+
+def _trace_page(tracer, page_index, data, stage_times, pid):
+    if tracer is None:
+        return
+    for stage, start, end in stage_times:
+        attributes = {"page": page_index + 1}
+        if stage == "encode":
+            attributes["bytes_encoded"] = len(data) if data is not None else 0
+        # Worker processes have a single thread, so the pid identifies the lane.
+        tracer.add(stage, start, end, pid=pid, tid=pid, **attributes)
+
+
+def page_count(pdf_bytes):
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return doc.page_count
+
+
+def page_memory_bytes(doc, profile=DEFAULT_RENDER_PROFILE):
+    """Estimated peak memory to render and preprocess the largest page of ``doc``.
+
+    Counts the rendered and preprocessed copies of the page plus its images
+    as decoded into MuPDF's store, which holds them until the page is done.
+    """
+    profile = get_profile(profile)
+    largest = 0
+    for page in doc:
+        scale = render_scale(page, profile)
+        rendered = page.rect.width * scale * page.rect.height * scale * PAGE_BYTES_PER_PIXEL
+        decoded = sum(width * height * COLORSPACE_COMPONENTS.get(colorspace, 3)
+                      for _, _, width, height, _, colorspace, *_ in page.get_images(full=True))
+        largest = max(largest, rendered + decoded)
+    return int(largest)
+
+
+def plan_workers(workers, count, page_bytes, memory_budget_mb=None):
+    """Number of render workers that fits in ``memory_budget_mb`` (at least one; one means in-process)."""
+    workers = min(workers or os.cpu_count() or 1, count)
+    if memory_budget_mb and workers > 1:
+        in_flight = PAGES_IN_FLIGHT_PER_WORKER * page_bytes
+        workers = min(workers, int(memory_budget_mb * 1024 * 1024 // (WORKER_OVERHEAD_BYTES + in_flight)))
+    return max(1, workers)
+
+
+def iter_preprocessed_pages(pdf_bytes, workers=None, profile=DEFAULT_RENDER_PROFILE, tracer=None,
+                            memory_budget_mb=None):
+    """Yield ``(page_index, image_bytes, mime_type)`` for every page, in page order.
+
+    Skipped blank pages are yielded with ``image_bytes`` and ``mime_type`` set to ``None``.
+
+    With ``workers`` > 1 pages are processed in a process pool; each worker
+    opens the document once and at most ``PAGES_IN_FLIGHT_PER_WORKER`` pages
+    per worker are rendered ahead of the consumer. ``workers=None`` uses one
+    worker per CPU core; either way the count is reduced to what fits in
+    ``memory_budget_mb``.
+    Per-page render, preprocess and encode spans are recorded on ``tracer``.
+    """
+    profile = get_profile(profile)
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        count = doc.page_count
+        workers = plan_workers(workers, count, page_memory_bytes(doc, profile), memory_budget_mb)
+        if workers <= 1:
+            for i in range(count):
+                stage_times = []
+                data, mime_type = process_page(doc, i, profile, stage_times)
+                _trace_page(tracer, i, data, stage_times, os.getpid())
+                yield i, data, mime_type
+            return
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(pdf_bytes, profile)) as pool:
+        pending, next_page = deque(), 0
+        for i in range(count):
+            while next_page < count and len(pending) < workers * PAGES_IN_FLIGHT_PER_WORKER:
+                pending.append(pool.submit(_process_page_in_worker, next_page))
+                next_page += 1
+            data, mime_type, stage_times, pid = pending.popleft().result()
+            _trace_page(tracer, i, data, stage_times, pid)
+            yield i, data, mime_type
@@ -0,0 +1,105 @@
+"""Content-addressed on-disk cache for model responses.
+
+Entries live in a single SQLite file keyed by a SHA-256 over the inputs
+that determine a response (PDF bytes, prompt text, model name). The total
+payload size is capped and the least recently used entries are evicted
+first.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_DIR = os.getenv("GRADER_CACHE_DIR", ".grader_cache")
+DEFAULT_MAX_BYTES = int(float(os.getenv("GRADER_CACHE_MAX_MB", "512")) * 1024 * 1024)
+
+
+def make_key(*parts):
+    """Hash ``parts`` (``bytes`` or ``str``) into a hex cache key."""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, bytes) else str(part).encode("utf-8")
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "results.sqlite3")
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def get(self, key, bytes_saved=None):
+        """Return the cached string for ``key`` or ``None``.
+
+        ``bytes_saved`` is what a hit avoids sending to the model; it defaults
+        to the size of the cached response.
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            self.hits += 1
+            self.bytes_saved += len(row[0]) if bytes_saved is None else bytes_saved
+            return row[0].decode("utf-8")
+
+    def put(self, key, value):
+        data = value.encode("utf-8")
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, data, len(data), time.time()),
+            )
+            self._evict()
+            self.conn.commit()
+
+    def get_json(self, key, bytes_saved=None):
+        value = self.get(key, bytes_saved)
+        return json.loads(value) if value is not None else None
+
+    def put_json(self, key, data):
+        self.put(key, json.dumps(data, ensure_ascii=False))
+
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.conn.execute("SELECT key, size FROM entries ORDER BY last_access ASC").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM entries")
+            self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytes_saved": self.bytes_saved,
+            "entries": entries,
+            "size_bytes": size,
+        }
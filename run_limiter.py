@@ -0,0 +1,64 @@
+"""Server-wide limit on simultaneous grading runs.
+
+Every Streamlit session runs in the same process, so without a limit a few
+teachers grading at once each start their own render workers and model
+calls and the server runs out of memory. ``RunLimiter`` hands out a fixed
+number of slots; further runs wait in line (in arrival order) until a slot
+frees up.
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+DEFAULT_MAX_CONCURRENT_RUNS = int(os.getenv("GRADER_MAX_CONCURRENT_RUNS", "2"))
+WAIT_POLL_SECONDS = 1.0  # how often a queued run reports its place in line
+
+
+class RunLimiter:
+    def __init__(self, max_runs=DEFAULT_MAX_CONCURRENT_RUNS):
+        self.max_runs = max(1, max_runs)
+        self.condition = threading.Condition()
+        self.running = 0
+        self.queue = []
+        self.next_ticket = 0
+
+    def status(self):
+        with self.condition:
+            return {"running": self.running, "waiting": len(self.queue), "max_runs": self.max_runs}
+
+    @contextmanager
+    def slot(self, on_wait=None):
+        """Hold a run slot for the duration of the block.
+
+        While queued, ``on_wait(position)`` is called with the number of runs
+        waiting ahead of this one (0 = next in line) whenever it changes.
+        """
+        with self.condition:
+            ticket = self.next_ticket
+            self.next_ticket += 1
+            self.queue.append(ticket)
+        reported = None
+        try:
+            while True:
+                with self.condition:
+                    if self.running < self.max_runs and self.queue[0] == ticket:
+                        self.queue.pop(0)
+                        self.running += 1
+                        break
+                    position = self.queue.index(ticket)
+                if on_wait is not None and position != reported:
+                    reported = position
+                    on_wait(position)
+                with self.condition:
+                    self.condition.wait(WAIT_POLL_SECONDS)
+        except BaseException:
+            with self.condition:
+                self.queue.remove(ticket)
+                self.condition.notify_all()
+            raise
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.running -= 1
+                self.condition.notify_all()
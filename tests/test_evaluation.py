@@ -0,0 +1,190 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import evaluation
+from evaluation import (
+    build_batch_prompt, estimate_tokens, evaluate_items, evaluate_items_batched, grade_item, group_into_batches,
+    parse_evaluation_response,
+)
+from result_cache import ResultCache
+
+PROMPT = "Official: {official_answer}\nStudent: {student_answer}"
+BATCH_PROMPT = "Items:\n{items_json}"
+MISSING = object()
+LATENCY = 0.02
+
+
+class StatusError(Exception):
+    def __init__(self, code):
+        super().__init__(f"{code} simulated error")
+        self.code = code
+
+
+class FakeModel:
+    """Replies ``score|justification`` after a fixed latency; earlier questions take longer, so they finish last.
+
+    ``failures`` maps a student answer to the errors raised by its first calls. Batch prompts
+    (``BATCH_PROMPT``) are answered with a JSON array; ``batch_scores`` maps a question number to
+    the score sent for it there, or to ``MISSING`` to leave it out.
+    """
+
+    model_name = "fake"
+
+    def __init__(self, failures=None, batch_scores=None):
+        self.failures = {answer: list(errors) for answer, errors in (failures or {}).items()}
+        self.batch_scores = batch_scores or {}
+        self.batches = []
+        self.lock = threading.Lock()
+        self.active = self.max_active = 0
+        self.calls = []
+        self.finished = []
+
+    def generate_content(self, prompt):
+        if prompt.startswith("Items:"):
+            return self.grade_batch(json.loads(prompt.split("\n", 1)[1]))
+        student_answer = prompt.split("Student: ", 1)[1]
+        with self.lock:
+            self.calls.append(student_answer)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            errors = self.failures.get(student_answer)
+            error = errors.pop(0) if errors else None
+        try:
+            number = int(student_answer.rsplit(" ", 1)[1])
+            time.sleep(LATENCY * (1 + (10 - number) % 4))
+            if error is not None:
+                raise error
+            with self.lock:
+                self.finished.append(number)
+            return SimpleNamespace(text=f"{10 * number}|Answer {number} graded.", usage_metadata=None)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def grade_batch(self, payload):
+        with self.lock:
+            self.batches.append([entry["question_number"] for entry in payload])
+        time.sleep(LATENCY)
+        replies = []
+        for entry in payload:
+            number = int(entry["question_number"])
+            score = self.batch_scores.get(number, 10 * number)
+            if score is not MISSING:
+                replies.append({"question_number": entry["question_number"], "score": score,
+                                "justification": f"Answer {number} graded in a batch."})
+        return SimpleNamespace(text=json.dumps(replies), usage_metadata=None)
+
+
+def make_items(count=10):
+    return [{"question_number": str(n), "status": "Answered", "official_answer": f"Official answer {n}",
+             "student_answer": f"Student answer {n}"} for n in range(1, count + 1)]
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(evaluation.random, "uniform", lambda low, high: low)  # retry at once
+
+
+def test_results_keep_question_order_when_items_finish_out_of_order():
+    model = FakeModel()
+    results = evaluate_items(model, make_items(), PROMPT, max_workers=4)
+    assert model.finished != sorted(model.finished)
+    assert [result["question_number"] for result in results] == [str(n) for n in range(1, 11)]
+    assert [result["score"] for result in results] == [10 * n for n in range(1, 11)]
+
+
+def test_parallel_results_match_the_serial_path():
+    items = make_items()
+    serial = [grade_item(FakeModel(), item, PROMPT) for item in items]
+    assert evaluate_items(FakeModel(), items, PROMPT, max_workers=1) == serial
+    assert evaluate_items(FakeModel(), iter(items), PROMPT, max_workers=4) == serial
+
+
+@pytest.mark.parametrize("code", [429, 500, 503])
+def test_rate_limit_and_server_errors_are_retried(code):
+    model = FakeModel({"Student answer 3": [StatusError(code), StatusError(code)]})
+    results = evaluate_items(model, make_items(), PROMPT, max_workers=4)
+    assert model.calls.count("Student answer 3") == 3
+    assert results[2]["score"] == 30
+
+
+@pytest.mark.parametrize("error", [StatusError(400), StatusError(403), ValueError("bad prompt")])
+def test_other_errors_are_not_retried(error):
+    model = FakeModel({"Student answer 3": [error]})
+    results = evaluate_items(model, make_items(), PROMPT, max_workers=4)
+    assert model.calls.count("Student answer 3") == 1
+    assert results[2]["score"] == -1 and results[2]["justification"].startswith("AI evaluation failed")
+    assert [result["score"] for i, result in enumerate(results) if i != 2] == [10 * n for n in range(1, 11) if n != 3]
+
+
+def test_retries_give_up_after_max_retries():
+    model = FakeModel({"Student answer 3": [StatusError(503)] * 10})
+    results = evaluate_items(model, make_items(), PROMPT, max_workers=4, max_retries=2)
+    assert model.calls.count("Student answer 3") == 3
+    assert results[2]["score"] == -1
+
+
+@pytest.mark.parametrize("max_workers", [1, 3, 6])
+def test_concurrent_calls_stay_within_max_workers(max_workers):
+    model = FakeModel()
+    evaluate_items(model, make_items(12), PROMPT, max_workers=max_workers)
+    assert model.max_active == max_workers
+
+
+def test_batches_keep_sub_parts_of_a_question_together():
+    numbers = ["1", "2 (i)", "2 (ii)", "2 (iii)", "3", "4 (a)", "4 (b)", "4 (c)", "4 (d)", "4 (e)"]
+    items = [{"question_number": number} for number in numbers]
+    batches = [[item["question_number"] for item in batch] for batch in group_into_batches(items, 3)]
+    assert batches == [["1"], ["2 (i)", "2 (ii)", "2 (iii)"], ["3"], ["4 (a)", "4 (b)", "4 (c)"], ["4 (d)", "4 (e)"]]
+
+
+def test_batched_results_and_call_savings():
+    items = make_items()
+    model = FakeModel()
+    results, stats = evaluate_items_batched(model, items, PROMPT, BATCH_PROMPT, batch_size=4, max_workers=2)
+    assert [result["score"] for result in results] == [10 * n for n in range(1, 11)]
+    assert model.batches == [["1", "2", "3", "4"], ["5", "6", "7", "8"], ["9", "10"]] and not model.calls
+    single_tokens = sum(estimate_tokens(PROMPT.format(**item)) for item in items)
+    batch_tokens = sum(estimate_tokens(build_batch_prompt(batch, BATCH_PROMPT)) for batch in group_into_batches(items, 4))
+    assert stats == {
+        "per_item_calls": 10, "per_item_prompt_tokens": single_tokens, "calls": 3, "prompt_tokens": batch_tokens,
+        "regraded_individually": 0, "calls_saved": 7, "prompt_tokens_saved": single_tokens - batch_tokens,
+    }
+
+
+def test_items_missing_from_a_batch_reply_are_regraded_on_their_own():
+    model = FakeModel(batch_scores={3: MISSING, 7: MISSING})
+    results, stats = evaluate_items_batched(model, make_items(), PROMPT, BATCH_PROMPT, batch_size=5)
+    assert [result["score"] for result in results] == [10 * n for n in range(1, 11)]
+    assert sorted(model.calls) == ["Student answer 3", "Student answer 7"]
+    assert stats["calls"] == 4 and stats["regraded_individually"] == 2 and stats["calls_saved"] == 6
+
+
+@pytest.mark.parametrize("bad_score", [87.5, "8/10", -10, 150, "", None, True])
+def test_invalid_batch_scores_are_regraded_and_not_cached(bad_score, tmp_path):
+    cache = ResultCache(str(tmp_path))
+    model = FakeModel(batch_scores={2: bad_score})
+    results, stats = evaluate_items_batched(model, make_items(4), PROMPT, BATCH_PROMPT, batch_size=4, cache=cache)
+    assert [result["score"] for result in results] == [10, 20, 30, 40]
+    assert model.calls == ["Student answer 2"] and stats["regraded_individually"] == 1
+
+    # Batch grades are cached under the per-item keys, so per-item grading needs no model call.
+    rerun = FakeModel()
+    assert [result["score"] for result in evaluate_items(rerun, make_items(4), PROMPT, cache=cache)] == [10, 20, 30, 40]
+    assert not rerun.calls
+
+
+@pytest.mark.parametrize("reply, expected", [
+    ("95|Good", (95, "Good")),
+    ("Score: 90 | Close", (90, "Close")),
+    ("87.5|Half marks", (-1, evaluation.BAD_FORMAT_JUSTIFICATION)),
+    ("8/10|Out of ten", (-1, evaluation.BAD_FORMAT_JUSTIFICATION)),
+    ("-10|Negative", (-1, evaluation.BAD_FORMAT_JUSTIFICATION)),
+    ("no separator", (-1, evaluation.BAD_FORMAT_JUSTIFICATION)),
+])
+def test_single_replies_are_parsed_strictly(reply, expected):
+    assert parse_evaluation_response(reply) == expected
@@ -0,0 +1,84 @@
+"""Resuming ``grade_class`` runs offline with the replay backend."""
+import json
+import os
+
+import pytest
+
+pymupdf = pytest.importorskip("pymupdf")
+
+import grade_class  # noqa: E402
+from pipeline import load_replay_backend  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUDENTS = ["anita", "bharat", "chetan", "divya"]
+
+
+def make_pdf(path, text):
+    with pymupdf.open() as doc:
+        doc.new_page().insert_text((50, 60), text)
+        doc.save(path)
+
+
+@pytest.fixture
+def run(tmp_path, monkeypatch):
+    """Run ``grade_class.main`` on four one-page sheets; returns the names graded by each call."""
+    monkeypatch.setattr(grade_class, "configure_model", lambda backend: load_replay_backend(latency_scale=0))
+    students = tmp_path / "students"
+    students.mkdir()
+    for name in STUDENTS:
+        make_pdf(str(students / f"{name}.pdf"), f"Answer sheet of {name}")
+    grade_one = grade_class.grade_one
+
+    def main(answer_key=os.path.join(ROOT, "2 - answer.pdf"), crash_after=None):
+        graded = []
+
+        def counting_grade_one(*args):
+            if crash_after is not None and len(graded) >= crash_after:
+                raise RuntimeError("worker crashed")
+            name, timings = grade_one(*args)
+            graded.append(name)
+            return name, timings
+
+        monkeypatch.setattr(grade_class, "grade_one", counting_grade_one)
+        code = grade_class.main([
+            "--students", str(students), "--question-paper", os.path.join(ROOT, "2 - question.pdf"),
+            "--answer-key", answer_key, "--output", str(tmp_path / "out"),
+            "--backend", "replay", "--workers", "1", "--rpm", "0", "--render-workers", "1",
+            "--no-cache", "--no-trace",
+        ])
+        return code, graded
+
+    return main
+
+
+def summary(tmp_path):
+    with open(tmp_path / "out" / "class_summary.jsonl", encoding="utf-8") as f:
+        return {row["student"]: row["status"] for row in map(json.loads, f)}
+
+
+def test_rerun_grades_only_the_students_missing_after_a_crash(run, tmp_path):
+    code, graded = run(crash_after=2)
+    assert code == 1 and graded == STUDENTS[:2]
+    assert summary(tmp_path) == {"anita": "graded", "bharat": "graded", "chetan": "failed", "divya": "failed"}
+
+    code, graded = run()
+    assert code == 0 and graded == STUDENTS[2:]
+    assert set(summary(tmp_path).values()) == {"graded"}
+
+    code, graded = run()
+    assert code == 0 and graded == []
+
+
+def test_changed_answer_key_regrades_everyone(run, tmp_path):
+    code, graded = run(crash_after=2)
+    with open(tmp_path / "out" / "official_answers.key", encoding="utf-8") as f:
+        first_key_id = f.read()
+
+    answer_key = str(tmp_path / "corrected answer.pdf")
+    make_pdf(answer_key, "Corrected answer key")
+    code, graded = run(answer_key=answer_key)
+    assert code == 0 and graded == STUDENTS
+    with open(tmp_path / "out" / "official_answers.key", encoding="utf-8") as f:
+        assert f.read() != first_key_id
+    with open(tmp_path / "out" / "students" / "anita_results.json", encoding="utf-8") as f:
+        assert json.load(f)["answer_key_id"] != first_key_id
@@ -0,0 +1,19 @@
+from json_parsing import JsonArrayStream, parse_json_array_prefix
+
+REPLY = 'Here [is] the json:\n```json\n[{"question_number": "1", "answer": "a [b]"}, {"question_number": "2"}]\n```'
+ITEMS = [{"question_number": "1", "answer": "a [b]"}, {"question_number": "2"}]
+
+
+def test_brackets_in_prose_before_the_array_are_skipped():
+    assert parse_json_array_prefix(REPLY) == (ITEMS, True)
+
+
+def test_reply_streamed_one_character_at_a_time():
+    stream = JsonArrayStream()
+    items = [item for ch in REPLY for item in stream.feed(ch)]
+    assert items == ITEMS and stream.complete
+
+
+def test_empty_and_cut_off_arrays():
+    assert parse_json_array_prefix("[ ]") == ([], True)
+    assert parse_json_array_prefix('[{"question_number": "1"}, {"question_nu') == ([{"question_number": "1"}], False)
@@ -0,0 +1,18 @@
+"""Peak memory of Steps 1-2 must not grow with the length of the answer sheet."""
+import pytest
+
+pytest.importorskip("cv2")
+pytest.importorskip("pymupdf")
+
+import bench_memory  # noqa: E402
+
+MAX_RSS_GROWTH = 0.2
+
+
+@pytest.mark.parametrize("render_workers", [1, 2])
+def test_peak_rss_flat_as_page_count_grows(render_workers):
+    options = ["--render-profile", "handwriting", "--latency-scale", "0.01", "--render-workers", str(render_workers)]
+    results = [bench_memory.measure(pages, options) for pages in (8, 48)]
+    assert [result["uploads"] for result in results] == [9, 49]  # every page (and the question paper) was uploaded
+    growth = bench_memory.rss_growth(results)
+    assert growth <= MAX_RSS_GROWTH, f"peak RSS {results[0]['peak_rss_mb']:.0f} -> {results[1]['peak_rss_mb']:.0f} MB"
@@ -0,0 +1,39 @@
+import pytest
+
+from page_windows import join_overlapping_text, merge_window_answers, page_windows
+
+
+def test_windows_overlap_and_cover_every_page():
+    assert page_windows(25, 12, 1) == [(0, 12), (11, 23), (22, 25)]
+    assert page_windows(5, 12, 1) == [(0, 5)]
+    assert page_windows(25, 0, 1) == [(0, 25)]
+
+
+@pytest.mark.parametrize("overlap", [12, 13, -1])
+def test_invalid_overlap_is_rejected(overlap):
+    with pytest.raises(ValueError):
+        page_windows(25, 12, overlap)
+
+
+def test_halves_are_joined_once_at_the_shared_page():
+    first = "Demand falls when the price of the good rises sharply"
+    second = "the price of the good rises sharply and supply grows"
+    assert join_overlapping_text(first, second) == "Demand falls when the price of the good rises sharply and supply grows"
+    misread = "Demand falls when the prise of the good rises sharply"
+    assert join_overlapping_text(misread, second) == "Demand falls when the prise of the good rises sharply and supply grows"
+
+
+def test_text_without_a_seam_is_kept_in_full():
+    assert join_overlapping_text("The price rises", "when demand rises") == "The price rises\nwhen demand rises"
+    assert join_overlapping_text("a b c d e", "b c d") == "a b c d e"
+
+
+def test_merge_keeps_answers_from_every_window():
+    windows = [
+        [{"question_number": "1", "status": "Answered", "answer_text": "The price rises"},
+         {"question_number": "2", "status": "Not Answered", "answer_text": "Not Answered"}],
+        [{"question_number": "1", "status": "Answered", "answer_text": "when demand rises"},
+         {"question_number": "2", "status": "Answered", "answer_text": "Opportunity cost"}],
+    ]
+    merged = {item["question_number"]: item["answer_text"] for item in merge_window_answers(windows)}
+    assert merged == {"1": "The price rises\nwhen demand rises", "2": "Opportunity cost"}
@@ -0,0 +1,79 @@
+import pytest
+
+from prescoring import LOCAL_JUSTIFICATION_PREFIX, PreScorer, normalize_answer, parse_number
+from validate_prescoring import NEAR_MATCH_CASES
+
+
+def decide(student, official):
+    decision = PreScorer([official]).decide(student, official)
+    return decision[0] if decision else None
+
+
+@pytest.mark.parametrize("student, official, expected", [
+    ("(c)", "(c) Monopoly", 100),
+    ("c", "(c) Monopoly", 100),
+    ("(स)", "(स) प्रत्यक्ष", 100),
+    ("(a)", "(c) Monopoly", 0),
+    ("(c) Monopoly", "(c) Monopoly", 100),
+    ("Monopoly", "(c) Monopoly", 100),
+    ("(a) Monopoly", "(c) Monopoly", None),
+    ("A. Smith", "A. Marshall", None),
+    ("J. Marshall", "A. Marshall", None),
+    ("c. Monopoly market", "C. Both (A and B)", None),
+])
+def test_option_labels(student, official, expected):
+    assert decide(student, official) == expected
+
+
+@pytest.mark.parametrize("student, official, expected", [
+    ("True", "true", 100),
+    ("सत्य", "True", 100),
+    ("गलत", "सही", 0),
+    ("Correct", "False", 0),
+])
+def test_true_false_answers(student, official, expected):
+    assert decide(student, official) == expected
+
+
+@pytest.mark.parametrize("student, official, expected", [
+    ("1,000", "1000", 100),
+    ("2.5", "2.50", 100),
+    ("1,00,000", "100000", 100),
+    ("१२", "12", 100),
+    ("12", "13", None),
+    ("12 units", "12", None),
+])
+def test_numbers_are_compared_by_value(student, official, expected):
+    assert decide(student, official) == expected
+
+
+@pytest.mark.parametrize("student, official, expected", NEAR_MATCH_CASES)
+def test_near_matches(student, official, expected):
+    assert decide(student, official) == expected
+
+
+@pytest.mark.parametrize("student", ["", "Not Answered", "  "])
+def test_blank_answers_score_zero(student):
+    assert decide(student, "Opportunity cost") == 0
+
+
+def test_score_counts_outcomes_and_marks_local_justifications():
+    prescorer = PreScorer(["Opportunity cost", "Macroeconomics"])
+    items = [
+        {"student_answer": "Oportunity cost", "official_answer": "Opportunity cost"},
+        {"student_answer": "Microeconomics", "official_answer": "Macroeconomics"},
+        {"student_answer": "", "official_answer": "Macroeconomics"},
+    ]
+    decisions = [prescorer.score(item) for item in items]
+    assert decisions[0][0] == 100 and decisions[0][1].startswith(LOCAL_JUSTIFICATION_PREFIX)
+    assert decisions[1] is None
+    assert decisions[2][0] == 0
+    assert prescorer.stats == {"checked": 3, "auto_scored": 2, "matched": 1, "mismatched": 0, "blank": 1,
+                               "sent_to_model": 1}
+
+
+def test_normalisation():
+    assert normalize_answer("Organisation, Colour!") == normalize_answer("organization colour") == "organization color"
+    assert normalize_answer("सम्बन्ध") == normalize_answer("संबंध")
+    assert parse_number("1,000.50") == parse_number("1000.5")
+    assert parse_number("twelve") is None
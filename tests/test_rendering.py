@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("cv2")
+pymupdf = pytest.importorskip("pymupdf")
+
+from rendering import DEFAULT_RENDER_PROFILE, RENDER_PROFILES, get_profile, process_page, render_page  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAGIC = {"image/png": b"\x89PNG", "image/webp": b"RIFF", "image/jpeg": b"\xff\xd8"}
+
+
+@pytest.mark.parametrize("profile", list(RENDER_PROFILES))
+def test_every_profile_renders_a_page(profile):
+    with pymupdf.open(os.path.join(ROOT, "2.pdf")) as doc:
+        rendered = render_page(doc[0], get_profile(profile))
+        data, mime_type = process_page(doc, 0, profile)
+    # The pixmap is freed when render_page returns, so the array must not be a view of its samples.
+    assert rendered.flags.owndata
+    assert data.startswith(MAGIC[mime_type])
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+@pytest.mark.parametrize("profile", ["color", DEFAULT_RENDER_PROFILE])
+def test_streaming_pipeline_renders_every_page(profile, workers):
+    # In a subprocess, so a crash in native code fails the test instead of the test run.
+    script = (
+        "from rendering import iter_preprocessed_pages\n"
+        f"pdf = open({os.path.join(ROOT, '2.pdf')!r}, 'rb').read()\n"
+        f"print(sum(1 for _ in iter_preprocessed_pages(pdf, workers={workers}, profile={profile!r})))\n"
+    )
+    completed = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True)
+    assert completed.returncode == 0, completed.stderr[-2000:]
+    with pymupdf.open(os.path.join(ROOT, "2.pdf")) as doc:
+        assert int(completed.stdout) == doc.page_count
@@ -0,0 +1,69 @@
+import hashlib
+import itertools
+
+import pytest
+
+import result_cache
+from result_cache import ResultCache, make_key
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    # A strictly increasing clock, so the least recently used entry is unambiguous.
+    clock = itertools.count(1)
+    monkeypatch.setattr(result_cache.time, "time", lambda: next(clock))
+    cache = ResultCache(str(tmp_path), max_bytes=30)
+    yield cache
+    cache.conn.close()
+
+
+def test_keys_are_stable_and_depend_on_every_part():
+    key = make_key(b"%PDF-1.7 question paper", "prompt", "gemini-2.5-flash")
+    assert key == make_key(b"%PDF-1.7 question paper", "prompt", "gemini-2.5-flash")
+    # The format is fixed so cached entries stay valid across versions: each part is length-prefixed, then hashed.
+    assert make_key(b"ab", "c") == hashlib.sha256(b"\0" * 7 + b"\2ab" + b"\0" * 7 + b"\1c").hexdigest()
+    assert make_key("abc") == make_key(b"abc")
+    assert make_key(3) == make_key("3")
+    # Part boundaries matter: the same bytes split differently give another key.
+    assert make_key("ab", "c") != make_key("a", "bc") != make_key("abc")
+    assert make_key("prompt", "gemini-2.5-flash") != make_key("prompt", "gemini-2.5-pro")
+
+
+def test_entries_survive_reopening(tmp_path):
+    with_entry = ResultCache(str(tmp_path))
+    with_entry.put_json("k", {"score": 80, "text": "संसाधन"})
+    with_entry.conn.close()
+    reopened = ResultCache(str(tmp_path))
+    assert reopened.get_json("k") == {"score": 80, "text": "संसाधन"}
+    reopened.conn.close()
+
+
+def test_least_recently_used_entries_are_evicted_over_max_bytes(cache):
+    for key in "abc":
+        cache.put(key, key * 10)
+    assert cache.stats()["size_bytes"] == 30
+
+    cache.get("a")  # "b" is now the least recently used
+    cache.put("d", "d" * 10)
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in "acd"] == ["a" * 10, "c" * 10, "d" * 10]
+
+    cache.put("e", "e" * 25)  # evicts until the total fits again
+    assert cache.stats()["entries"] == 1 and cache.get("e") == "e" * 25
+
+    cache.put("f", "f" * 40)  # larger than the cap: nothing is kept
+    assert cache.stats()["entries"] == 0 and cache.stats()["size_bytes"] == 0
+
+
+def test_hits_misses_and_bytes_saved_are_counted(cache):
+    assert cache.get("missing") is None
+    cache.put("answer", "uttar")
+    assert cache.get("answer") == "uttar"
+    assert cache.get_json("missing") is None
+    cache.put_json("grade", [80, "ok"])
+    assert cache.get_json("grade", bytes_saved=1000) == [80, "ok"]
+    assert cache.stats() == {"hits": 2, "misses": 2, "bytes_saved": 5 + 1000, "entries": 2, "size_bytes": 5 + 10}
+
+    cache.clear()
+    assert cache.get("answer") is None
+    assert cache.stats() == {"hits": 2, "misses": 3, "bytes_saved": 1005, "entries": 0, "size_bytes": 0}
@@ -0,0 +1,137 @@
+"""The text-layer fast path on synthetic born-digital papers and on the bundled ``2 - question.pdf``."""
+import json
+import os
+
+import pytest
+
+pymupdf = pytest.importorskip("pymupdf")
+
+from text_layer import (  # noqa: E402
+    QUESTION_RE, extract_official_answers_locally, is_legacy_encoded, read_pages, segment_questions,
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Bilingual like the board papers: each question in Kruti-encoded Hindi, then in English.
+QUESTION_PAPER = [
+    [
+        "Total No. of Questions: 3",
+        "Instructions :-",
+        "1. All questions are compulsory.",
+        "Question No. 01 to 02 are objective type questions.",
+        "iz-1",
+        "lgh mÙkj&pqudj fyf[k;s &",
+        "(i)",
+        ",d QeZ] ,d m|ksx] ,d oLrq ds ewY; dk v/;;u {ks= gS &",
+        "(ii) lhekar vkxe de gksus ij ekax dh yksp gksrh gS &",
+        "Choose and write the correct alternative -",
+        "(i)",
+        "Study of a firm is done under -",
+        "(A) Macro economics",
+        "(B) Micro economics",
+        "(ii) When marginal revenue diminishes, elasticity of demand is -",
+        "(A) Less than 1",
+    ],
+    [
+        "iz-2 mi;ksfxrk dks ifjHkkf\"kr dhft;sA",
+        "Define Utility.",
+        "iz-3",
+        "What is meant by Production Cost?",
+        "vFkok@OR",
+        "What is Barter System?",
+    ],
+]
+ANSWER_KEY = [
+    [
+        "Q.1",
+        "(i) (B) Micro economics",
+        "(ii) (A) Less than 1",
+        "Q.2 Utility is the want-satisfying power of a commodity.",
+    ],
+    [
+        "Q.3 Production cost is the expenditure incurred on the factors of production.",
+        "OR",
+        "Barter is the direct exchange of goods for goods.",
+    ],
+]
+
+
+def make_pdf(pages, footer=True):
+    with pymupdf.open() as doc:
+        for number, lines in enumerate(pages, 1):
+            page = doc.new_page()
+            for row, text in enumerate(lines):
+                page.insert_text((50, 60 + 18 * row), text, fontsize=10)
+            if footer:
+                page.insert_text((50, 800), f"Page {number} of {len(pages)}", fontsize=8)
+        return doc.tobytes()
+
+
+def test_instruction_ranges_are_not_questions():
+    assert not QUESTION_RE.match("Question No. 01 to 05 are 32 objective type questions.")
+    assert not QUESTION_RE.match("01 से 05 तक वस्तुनिष्ठ प्रश्न हैं।")
+    assert not QUESTION_RE.match("iz-01 ls 05 rd oLrqfu\"B iz'u gSaA")
+    assert QUESTION_RE.match("Q.4 Define demand.").group(1) == "4"
+    assert QUESTION_RE.match("iz-12 oLrq fofue; iz.kkyh D;k gS").group(1) == "12"
+
+
+def test_legacy_hindi_is_recognised_from_the_text():
+    assert is_legacy_encoded(",d QeZ] ,d m|ksx] ,d oLrq ds ewY; dk v/;;u {ks= gS &")
+    assert is_legacy_encoded('¼n½ jk"Vªh; vk;')
+    assert not is_legacy_encoded("Study of a firm is done under - (A) Macro economics")
+
+
+def test_segment_questions_keeps_the_english_version():
+    questions = segment_questions(read_pages(make_pdf(QUESTION_PAPER)), keep_hindi=False)
+    assert list(questions) == ["1 (i)", "1 (ii)", "2", "3"]
+    assert questions["1 (i)"]["text"] == "Study of a firm is done under -\n(A) Macro economics\n(B) Micro economics"
+    assert questions["1 (ii)"]["text"] == "When marginal revenue diminishes, elasticity of demand is -\n(A) Less than 1"
+    assert questions["2"]["text"] == "Define Utility."
+    assert questions["3"]["text"] == "What is meant by Production Cost?\nOR\nWhat is Barter System?"
+    assert questions["3"]["pages"] == [1]
+
+
+def test_typed_answer_key_is_read_without_the_model():
+    local = extract_official_answers_locally(make_pdf(QUESTION_PAPER), make_pdf(ANSWER_KEY))
+    assert local["question_paper_ok"] and local["total_questions"] == 3
+    assert local["missing"] == [] and local["low_confidence_pages"] == []
+    answers = {item["question_number"]: item["official_answer_text"] for item in local["qna"]}
+    assert answers == {
+        "1 (i)": "(B) Micro economics",
+        "1 (ii)": "(A) Less than 1",
+        "2": "Utility is the want-satisfying power of a commodity.",
+        "3": "Production cost is the expenditure incurred on the factors of production.\nOR\n"
+             "Barter is the direct exchange of goods for goods.",
+    }
+
+
+def test_legacy_answers_and_pages_without_text_go_to_the_model():
+    answer_key = [ANSWER_KEY[0][:3] + ["Q.2 mi;ksfxrk fdlh oLrq dh vko’;drk larq\"V djus dh {kerk gSA"], ANSWER_KEY[1]]
+    local = extract_official_answers_locally(make_pdf(QUESTION_PAPER), make_pdf(answer_key))
+    assert local["missing"] == ["2"] and local["low_confidence_pages"] == [0]
+    assert [item["question_number"] for item in local["qna"]] == ["1 (i)", "1 (ii)", "3"]
+
+    scanned = make_pdf([ANSWER_KEY[0], []], footer=False)
+    local = extract_official_answers_locally(make_pdf(QUESTION_PAPER), scanned)
+    assert local["missing"] == ["3"] and local["low_confidence_pages"] == [0, 1]
+
+
+def test_question_paper_must_cover_the_printed_total():
+    paper = [["Total No. of Questions: 4"] + QUESTION_PAPER[0][1:], QUESTION_PAPER[1]]
+    local = extract_official_answers_locally(make_pdf(paper), make_pdf(ANSWER_KEY))
+    assert not local["question_paper_ok"] and local["qna"] == []
+    assert local["missing"] == ["1 (i)", "1 (ii)", "2", "3"]
+
+
+def test_bundled_question_paper_is_segmented_like_the_reference():
+    with open(os.path.join(ROOT, "2 - question.pdf"), "rb") as f:
+        question_pdf_bytes = f.read()
+    with open(os.path.join(ROOT, "2 - answer.pdf"), "rb") as f:
+        answer_key_pdf_bytes = f.read()
+    with open(os.path.join(ROOT, "Original_Answer", "original_answer.json"), encoding="utf-8") as f:
+        reference = [item["question_number"] for item in json.load(f)]
+    local = extract_official_answers_locally(question_pdf_bytes, answer_key_pdf_bytes)
+    assert local["question_paper_ok"] and local["total_questions"] == 23
+    assert local["question_numbers"] == reference
+    # The answer key is Kruti-encoded Hindi: only answers without legacy text (a year) are read locally.
+    assert [(item["question_number"], item["official_answer_text"]) for item in local["qna"]] == [("2 (ii)", "1949")]
@@ -0,0 +1,94 @@
+import gc
+import threading
+from types import SimpleNamespace
+
+from uploads import UploadManager
+
+
+class LocalFiles:
+    """Stands in for the model's file API: keeps uploads in a dict."""
+
+    def __init__(self):
+        self.files = {}
+        self.uploaded = []
+        self.deleted = []
+        self.lock = threading.Lock()
+
+    def upload_file(self, path, mime_type, display_name):
+        with self.lock:
+            name = f"files/{len(self.uploaded)}"
+            self.uploaded.append(display_name)
+            self.files[name] = path.read()
+        return SimpleNamespace(name=name, display_name=display_name)
+
+    def delete_file(self, name):
+        with self.lock:
+            del self.files[name]
+            self.deleted.append(name)
+
+
+def make_manager(files):
+    return UploadManager(upload_file=files.upload_file, delete_file=files.delete_file, max_workers=2)
+
+
+def test_same_bytes_are_uploaded_once():
+    files = LocalFiles()
+    with make_manager(files) as uploads:
+        first, handle = uploads.upload(b"question paper", "application/pdf", "question_paper.pdf", keep=True)
+        second, again = uploads.upload(b"question paper", "application/pdf", "question_paper.pdf", keep=True)
+        other, _ = uploads.upload(b"page 1", "image/png", "page_1.png")
+        assert first == second and handle is again
+        assert files.uploaded == ["question_paper.pdf", "page_1.png"]
+        assert uploads.stats["uploads"] == 2 and uploads.stats["reused"] == 1
+    assert files.files == {}
+
+
+def test_release_deletes_unkept_files_after_the_last_reference():
+    files = LocalFiles()
+    with make_manager(files) as uploads:
+        page, _ = uploads.upload(b"page 1", "image/png", "page_1.png")
+        uploads.submit(b"page 1", "image/png", "page_1.png")
+        paper, _ = uploads.upload(b"question paper", "application/pdf", "question_paper.pdf", keep=True)
+        uploads.release([page])
+        assert len(files.files) == 2
+        uploads.release([page, paper])
+        assert list(files.files.values()) == [b"question paper"]
+        assert uploads.stats["deleted"] == 1
+
+
+def test_release_kept_deletes_the_previous_exam_once_unused():
+    files = LocalFiles()
+    with make_manager(files) as uploads:
+        paper, _ = uploads.upload(b"question paper", "application/pdf", "question_paper.pdf", keep=True)
+        key, _ = uploads.upload(b"answer key", "application/pdf", "official_answer_key.pdf", keep=True)
+        uploads.release([paper])
+        uploads.release_kept()
+        assert list(files.files.values()) == [b"answer key"]  # still held by a caller
+        uploads.release([key])
+        assert files.files == {}
+        # A later exam uploads its paper again instead of reusing a deleted file.
+        uploads.upload(b"question paper", "application/pdf", "question_paper.pdf", keep=True)
+        assert files.uploaded.count("question_paper.pdf") == 2
+
+
+def test_cleanup_ages_out_idle_files_only():
+    files = LocalFiles()
+    with make_manager(files) as uploads:
+        idle, _ = uploads.upload(b"question paper", "application/pdf", "question_paper.pdf", keep=True)
+        uploads.release([idle])
+        uploads.upload(b"page 1", "image/png", "page_1.png")
+        uploads.cleanup(idle_seconds=3600)
+        assert len(files.files) == 2
+        uploads.cleanup(idle_seconds=-1)
+        assert list(files.files.values()) == [b"page 1"]
+
+
+def test_abandoned_manager_deletes_its_files_and_stops_its_threads():
+    files = LocalFiles()
+    uploads = make_manager(files)
+    uploads.upload(b"question paper", "application/pdf", "question_paper.pdf", keep=True)
+    pool = uploads.pool
+    del uploads
+    gc.collect()
+    assert files.files == {}
+    assert pool._shutdown
@@ -0,0 +1,313 @@
+"""Step 3 fast path: read typed (born-digital) question papers and answer keys locally.
+
+The PDF text layer is read with PyMuPDF and segmented by question numbering
+("1.", "Q.4", "प्रश्न 5", sub-parts "(i)", "(ii)", and "OR"/"अथवा"
+alternatives) into the same ``question_number`` / ``question_text`` /
+``official_answer_text`` schema that ``MASTER_QNA_PROMPT_OFFICIAL`` produces.
+
+Hindi set in legacy non-Unicode fonts such as DevLys or Kruti Dev extracts
+as Latin gibberish. It is recognised by font name and, since such fonts are
+often embedded under generic names (``TT280E6t00``), by the tell-tale
+characters and words of the Kruti/DevLys encoding: a font most of whose
+text looks legacy-encoded is treated as a legacy font for the whole
+document. Legacy lines are dropped from the (bilingual) question paper,
+and answers containing them, like answers on pages without a text layer,
+are left for the model. The question paper is only trusted if its
+questions run from 1 to the paper's "Total No. of Questions" without gaps;
+numbered instructions ("Question No. 01 to 05 are ...") are not questions.
+"""
+import re
+from collections import Counter
+
+import pymupdf
+
+LEGACY_INDIC_FONT = re.compile(r"devlys|kruti|chanakya|walkman|shusha|agra|kundli|aps-dv|shivaji", re.I)
+# Kruti Dev / DevLys encode Hindi as Latin-1 text: brackets and conjuncts become these characters,
+# and matras and half letters put punctuation inside words (la[;k, iz’u, ijh{kk) ...
+LEGACY_INDIC_CHARS = re.compile(
+    r"[\u00aa\u00bc\u00bd\u00be\u00d8\u00d9\u00b1\u00f7\u00df\u00de\u00c6\u00e6\u00a1\u00b6]"
+    r"|[A-Za-z][;\[{\u2019\"`][A-Za-z]"
+)
+# ... and the most common Hindi words become these tokens (है, का, की, के, में, और, से, को, कि, पर, तक, एक, प्रश्न).
+LEGACY_INDIC_WORDS = {"gS", "gSa", "gSA", "dk", "dh", "ds", "esa", "vkSj", "ls", "dks", "fd", "ij", "rd", ",d", "iz'u", "iz\u2019u"}
+MIN_LEGACY_WORD_SHARE = 0.25   # share of legacy-encoded words above which a span is legacy Hindi
+MIN_LEGACY_FONT_WORDS = 20     # words a font needs before its text decides whether it is a legacy font
+MIN_LEGACY_FONT_SHARE = 0.5    # share of a font's words in legacy-encoded spans above which all its text is legacy
+DEVANAGARI = re.compile(r"[\u0900-\u097F]")
+TOTAL_QUESTIONS_RE = re.compile(r"(?:Total\s+No\.?\s+of\s+Questions|कुल\s+प्रश्नों\s+की\s+संख्या)\s*[:%\-]?\s*(\d{1,3})", re.I)
+# Group 1: number after a "Q." / "प्रश्न" / "उत्तर" label (Kruti "iz-" / "m-" for "प्र." / "उ."), group 2: a bare
+# "4." or "4)". A number followed by "to 05" / "से 05" is a range in the instructions, not a question.
+QUESTION_RE = re.compile(
+    r"^\s*(?:(?:Q(?:uestion)?\.?\s*(?:No\.?)?|प्रश्न(?:\s*क्र(?:मांक)?\.?)?|प्र\.|उ(?:त्तर)?\.|iz\s*-|m\s*-)\s*(\d{1,2})(?!\d)"
+    r"|(\d{1,2})(?=\s*[\.\):।]))(?!\s*(?:to|से|ls|[-–&])\s*\d)\s*[\.\):।-]?\s*(.*)$",
+    re.I,
+)
+SUBPART_RE = re.compile(r"^\s*\(\s*([ivx]{1,5})\s*\)\s*(.*)$", re.I)
+OR_RE = re.compile(r"^\s*(?:OR|Or|अथवा|vFkok)\s*[:/@]?\s*(?:OR|Or|अथवा|vFkok)?\s*$")
+ROMAN = ["i", "ii", "iii", "iv", "v", "vi", "vii", "viii", "ix", "x",
+         "xi", "xii", "xiii", "xiv", "xv", "xvi", "xvii", "xviii", "xix", "xx"]
+
+MIN_PAGE_CHARS = 20            # fewer extractable characters than this means no text layer
+MAX_LEGACY_FONT_SHARE = 0.2    # share of characters in legacy Indic fonts above which a page is unreliable
+MAX_BAD_CHAR_SHARE = 0.05      # share of replacement/private-use characters above which a page is unreliable
+HEADER_PAGE_SHARE = 0.5        # lines repeated on more than this share of pages are headers/footers
+
+
+def is_legacy_encoded(text):
+    """Whether ``text`` looks like Hindi typed in a Kruti Dev / DevLys style font (Latin gibberish)."""
+    words = text.split()
+    if not words:
+        return False
+    legacy = sum(1 for word in words if word in LEGACY_INDIC_WORDS or LEGACY_INDIC_CHARS.search(word))
+    return legacy >= 2 or legacy / len(words) >= MIN_LEGACY_WORD_SHARE
+
+
+def _spans(page_dict):
+    for block in page_dict["blocks"]:
+        for line in block.get("lines", []):
+            yield from line["spans"]
+
+
+def legacy_fonts(page_dicts):
+    """Names of the fonts that hold legacy-encoded Hindi in a document, by font name or by their text."""
+    words, legacy_words = Counter(), Counter()
+    for page_dict in page_dicts:
+        for span in _spans(page_dict):
+            count = len(span["text"].split())
+            words[span["font"]] += count
+            if is_legacy_encoded(span["text"]):
+                legacy_words[span["font"]] += count
+    return {
+        font for font, count in words.items()
+        if LEGACY_INDIC_FONT.search(font)
+        or (count >= MIN_LEGACY_FONT_WORDS and legacy_words[font] / count >= MIN_LEGACY_FONT_SHARE)
+    }
+
+
+def _line_records(page_dict, legacy_font_names=()):
+    """Return ``(text, hindi, legacy)`` for each text line of a page plus the page's character statistics."""
+    records, total_chars, legacy_chars, bad_chars = [], 0, 0, 0
+    for block in page_dict["blocks"]:
+        for line in block.get("lines", []):
+            parts, line_legacy, line_chars = [], 0, 0
+            for span in line["spans"]:
+                text = span["text"]
+                chars = len(text.strip())
+                line_chars += chars
+                font = span.get("font", "")
+                if font in legacy_font_names or LEGACY_INDIC_FONT.search(font) or is_legacy_encoded(text):
+                    line_legacy += chars
+                bad_chars += sum(1 for ch in text if ch == "\ufffd" or "\ue000" <= ch <= "\uf8ff")
+                parts.append(text)
+            text = "".join(parts).strip()
+            if not text:
+                continue
+            total_chars += line_chars
+            legacy_chars += line_legacy
+            devanagari = len(DEVANAGARI.findall(text))
+            # Any legacy span makes the line untrustworthy; mostly Hindi lines are dropped from question papers.
+            legacy = line_legacy > 0 or is_legacy_encoded(text)
+            hindi = line_legacy > line_chars / 2 or is_legacy_encoded(text) or devanagari > len(text.replace(" ", "")) / 2
+            records.append((text, hindi, legacy))
+    return records, {"chars": total_chars, "legacy_chars": legacy_chars, "bad_chars": bad_chars}
+
+
+def page_confidence(stats, ignore_legacy=False):
+    """1.0 for a clean Unicode text layer, 0.0 when the page must go to the model.
+
+    With ``ignore_legacy``, legacy-encoded Hindi does not count against the
+    page, for callers that drop those lines anyway.
+    """
+    chars = stats["chars"] - stats["legacy_chars"] if ignore_legacy else stats["chars"]
+    if chars < MIN_PAGE_CHARS:
+        return 0.0
+    if not ignore_legacy and stats["legacy_chars"] / chars > MAX_LEGACY_FONT_SHARE:
+        return 0.0
+    bad_share = stats["bad_chars"] / chars
+    return 0.0 if bad_share > MAX_BAD_CHAR_SHARE else 1.0 - bad_share
+
+
+def read_pages(pdf_bytes):
+    """Read every page's lines and confidence, dropping repeated headers and footers.
+
+    ``confidence`` rates the whole page, ``text_confidence`` only its
+    Unicode text (legacy-encoded Hindi lines ignored).
+    """
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        page_dicts = [page.get_text("dict") for page in doc]
+    fonts = legacy_fonts(page_dicts)
+    pages = [_line_records(page_dict, fonts) for page_dict in page_dicts]
+
+    def normalise(text):
+        return re.sub(r"\d+", "#", text)
+
+    def is_numbering(text):
+        return bool(QUESTION_RE.match(text) or SUBPART_RE.match(text) or OR_RE.match(text))
+
+    # Question labels ("Q.#", "(i)") recur on most pages too, but they are content, not headers.
+    counts = Counter(
+        normalise(text) for records, _ in pages for text in {t for t, _, _ in records if not is_numbering(t)}
+    )
+    repeated = {text for text, count in counts.items() if len(pages) > 1 and count > HEADER_PAGE_SHARE * len(pages)}
+    return [
+        {
+            "lines": [record for record in records if normalise(record[0]) not in repeated],
+            "confidence": page_confidence(stats),
+            "text_confidence": page_confidence(stats, ignore_legacy=True),
+        }
+        for records, stats in pages
+    ]
+
+
+def segment_questions(pages, keep_hindi):
+    """Split page lines into ``{question_number: {"text", "page", "pages", "legacy"}}`` in document order.
+
+    Question numbers must increase by one and sub-parts must follow i, ii,
+    iii, ... so numbers inside answers are not mistaken for new questions.
+    If any question carries a label ("Q.1", "प्रश्न 1"), bare "1." lines are
+    not questions (they are numbered instructions). A sub-part list that
+    restarts at (i) is another language version of the same sub-parts; the
+    version with the most text over all sub-parts is kept. Parents that have sub-parts are
+    dropped, matching the model's output. ``page`` is the page where an
+    entry starts, ``pages`` every page it spans, and ``legacy`` whether any
+    of its lines was legacy-encoded Hindi.
+    """
+    labelled = any(
+        (match := QUESTION_RE.match(text)) and match.group(1) for page in pages for text, _, _ in page["lines"]
+    )
+    versions, current_q, current_sub, current, version = {}, 0, 0, None, 0
+
+    def start(key, text, page_index, legacy):
+        entry = {"lines": [text] if text else [], "page": page_index, "pages": {page_index},
+                 "legacy": legacy and bool(text), "version": version}
+        versions.setdefault(key, []).append(entry)
+        return entry
+
+    for page_index, page in enumerate(pages):
+        for text, hindi, legacy in page["lines"]:
+            keep = keep_hindi or not hindi
+            question = QUESTION_RE.match(text)
+            number = question and (question.group(1) if labelled else question.group(2))
+            subpart = SUBPART_RE.match(text)
+            if number and int(number) == current_q + 1:
+                current_q, current_sub, version = current_q + 1, 0, 0
+                rest = question.group(3) if keep else ""
+                inline_subpart = SUBPART_RE.match(rest)
+                if inline_subpart and inline_subpart.group(1).lower() == ROMAN[0]:
+                    start(str(current_q), "", page_index, False)
+                    current_sub = 1
+                    current = start(f"{current_q} (i)", inline_subpart.group(2), page_index, legacy)
+                else:
+                    current = start(str(current_q), rest, page_index, legacy)
+            elif number and int(number) == current_q and current is not None:
+                # The label repeated, e.g. before the alternative after "OR".
+                if keep and question.group(3):
+                    current["lines"].append(question.group(3))
+                    current["legacy"] = current["legacy"] or legacy
+            elif (subpart and current_q and current_sub < len(ROMAN)
+                  and subpart.group(1).lower() in (ROMAN[current_sub], ROMAN[0])):
+                if subpart.group(1).lower() == ROMAN[current_sub]:
+                    current_sub += 1
+                else:
+                    current_sub, version = 1, version + 1
+                current = start(f"{current_q} ({ROMAN[current_sub - 1]})", subpart.group(2) if keep else "",
+                                page_index, legacy)
+            elif current is not None:
+                current["pages"].add(page_index)
+                if OR_RE.match(text):
+                    current["lines"].append("OR")
+                elif keep:
+                    current["lines"].append(text)
+                    current["legacy"] = current["legacy"] or legacy
+
+    version_sizes = Counter()
+    for key, candidates in versions.items():
+        for entry in candidates:
+            version_sizes[key.split(" ")[0], entry["version"]] += len("".join(entry["lines"]))
+    entries = {}
+    for key, candidates in versions.items():
+        best = max(candidates, key=lambda entry: version_sizes[key.split(" ")[0], entry["version"]])
+        entries[key] = {"text": "\n".join(best["lines"]).strip(), "page": best["page"],
+                        "pages": sorted(best["pages"]), "legacy": best["legacy"]}
+    parents = {key.split(" ")[0] for key in entries if " " in key}
+    return {key: entry for key, entry in entries.items() if key not in parents}
+
+
+def total_questions(pages):
+    """The "Total No. of Questions" printed on the question paper, or ``None``."""
+    for page in pages:
+        for text, _, _ in page["lines"]:
+            match = TOTAL_QUESTIONS_RE.search(text)
+            if match:
+                return int(match.group(1))
+    return None
+
+
+def covers_all_questions(question_numbers, total):
+    """Whether the top-level numbers are exactly 1..``total`` (``False`` if ``total`` is unknown)."""
+    top_level = {int(q_num.split(" ")[0]) for q_num in question_numbers}
+    return bool(total) and top_level == set(range(1, total + 1))
+
+
+def extract_official_answers_locally(question_pdf_bytes, answer_key_pdf_bytes):
+    """Build the official Q&A list from the PDFs' text layers.
+
+    Returns a dict with:
+    - ``qna``: confidently extracted items in question-paper order;
+    - ``missing``: question numbers the model still has to answer;
+    - ``question_numbers``: every question number found in the question paper, in order;
+    - ``total_questions``: the paper's "Total No. of Questions", if printed;
+    - ``question_paper_ok``: whether the question paper was readable (legacy
+      Hindi lines aside) and its questions cover 1..``total_questions``
+      without gaps;
+    - ``low_confidence_pages``: 0-based answer-key pages to send to the model:
+      those holding an answer that could not be read locally (legacy Hindi,
+      no text layer), or every page if such an answer cannot be located.
+    """
+    question_pages = read_pages(question_pdf_bytes)
+    answer_pages = read_pages(answer_key_pdf_bytes)
+    questions = segment_questions(question_pages, keep_hindi=False)
+    answers = segment_questions(answer_pages, keep_hindi=True)
+
+    total = total_questions(question_pages)
+    question_paper_ok = (
+        all(page["text_confidence"] > 0 for page in question_pages) and covers_all_questions(questions, total)
+    )
+
+    def readable(answer):
+        return (answer and answer["text"] and not answer["legacy"]
+                and all(answer_pages[i]["text_confidence"] > 0 for i in answer["pages"]))
+
+    qna, missing, unread_pages = [], [], set()
+    for q_num, question in questions.items():
+        answer = answers.get(q_num)
+        if question_paper_ok and readable(answer):
+            qna.append({
+                "question_number": q_num,
+                "question_text": question["text"],
+                "official_answer_text": answer["text"],
+            })
+        else:
+            missing.append(q_num)
+            unread_pages.update(answer["pages"] if answer else range(len(answer_pages)))
+    unread_pages.update(i for i, page in enumerate(answer_pages) if page["text_confidence"] == 0)
+    return {
+        "qna": qna,
+        "missing": missing,
+        "question_numbers": list(questions),
+        "total_questions": total,
+        "question_paper_ok": question_paper_ok,
+        "low_confidence_pages": sorted(unread_pages),
+    }
+
+
+def extract_pages(pdf_bytes, page_indices):
+    """Return a new PDF containing only ``page_indices`` of ``pdf_bytes``.
+
+    The output is byte-for-byte reproducible (no fresh document ID), so the
+    same pages are de-duplicated by the ``UploadManager``.
+    """
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc, pymupdf.open() as subset:
+        for i in page_indices:
+            subset.insert_pdf(doc, from_page=i, to_page=i)
+        return subset.tobytes(no_new_id=True)
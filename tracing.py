@@ -0,0 +1,122 @@
+"""Lightweight tracing of pipeline stages.
+
+A ``Tracer`` collects spans (name, start, duration, thread/process and free
+attributes such as ``bytes_sent``, ``prompt_tokens``, ``retries`` or
+``cache_hit``) from any thread. Spans can be exported as JSON Lines or as a
+Chrome trace (open it in ``chrome://tracing`` or https://ui.perfetto.dev),
+and ``summarize`` gives the per-stage breakdown shown by the app.
+
+Functions take an optional ``tracer`` and use the module-level ``span``
+helper, which does nothing when no tracer is given.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Numeric span attributes that are summed per stage by ``Tracer.summarize``.
+SUMMED_ATTRIBUTES = (
+    "bytes_sent", "bytes_encoded", "prompt_tokens", "response_tokens", "retries", "cache_hit", "items", "auto_scored"
+)
+
+
+class Tracer:
+    def __init__(self, name="run"):
+        self.name = name
+        self.origin = time.time()
+        self.lock = threading.Lock()
+        self.spans = []
+
+    def add(self, name, start, end, pid=None, tid=None, **attributes):
+        """Record a span measured elsewhere; ``start`` and ``end`` are ``time.time()`` values."""
+        record = {
+            "name": name,
+            "start": start - self.origin,
+            "duration": max(0.0, end - start),
+            "pid": pid or os.getpid(),
+            "tid": tid or threading.get_ident(),
+            "attributes": attributes,
+        }
+        with self.lock:
+            self.spans.append(record)
+        return record
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Time the block; the yielded dict can be filled with attributes while it runs."""
+        start = time.time()
+        try:
+            yield attributes
+        except BaseException as e:
+            attributes["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.add(name, start, time.time(), **attributes)
+
+    def summarize(self):
+        """Per-stage totals in first-seen order: ``count``, ``seconds`` and the summed attributes."""
+        stages = {}
+        with self.lock:
+            spans = list(self.spans)
+        for record in spans:
+            stage = stages.setdefault(record["name"], {"count": 0, "seconds": 0.0})
+            stage["count"] += 1
+            stage["seconds"] += record["duration"]
+            for attribute in SUMMED_ATTRIBUTES:
+                value = record["attributes"].get(attribute)
+                if isinstance(value, (bool, int, float)):
+                    stage[attribute] = stage.get(attribute, 0) + value
+        return stages
+
+    def to_jsonl(self):
+        with self.lock:
+            return "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in self.spans)
+
+    def to_chrome_trace(self):
+        """The spans as Chrome trace-event JSON (complete ``"X"`` events, microseconds)."""
+        with self.lock:
+            events = [
+                {
+                    "name": record["name"],
+                    "cat": self.name,
+                    "ph": "X",
+                    "ts": round(record["start"] * 1e6),
+                    "dur": round(record["duration"] * 1e6),
+                    "pid": record["pid"],
+                    "tid": record["tid"],
+                    "args": record["attributes"],
+                }
+                for record in self.spans
+            ]
+        return json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}, ensure_ascii=False, default=str)
+
+    def write(self, path_prefix):
+        """Write ``<path_prefix>.jsonl`` and ``<path_prefix>.trace.json``."""
+        with open(f"{path_prefix}.jsonl", "w", encoding="utf-8") as f:
+            f.write(self.to_jsonl())
+        with open(f"{path_prefix}.trace.json", "w", encoding="utf-8") as f:
+            f.write(self.to_chrome_trace())
+
+
+@contextmanager
+def span(tracer, name, **attributes):
+    """``tracer.span(...)`` that only collects attributes when ``tracer`` is ``None``."""
+    if tracer is None:
+        yield attributes
+        return
+    with tracer.span(name, **attributes) as recorded:
+        yield recorded
+
+
+def record_usage(attributes, response):
+    """Copy Gemini token counts from ``response.usage_metadata`` into span ``attributes``, if present."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    response_tokens = getattr(usage, "candidates_token_count", None)
+    if prompt_tokens:
+        attributes["prompt_tokens"] = prompt_tokens
+    if response_tokens:
+        attributes["response_tokens"] = response_tokens
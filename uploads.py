@@ -0,0 +1,188 @@
+"""Concurrent, de-duplicated file uploads for model requests.
+
+``UploadManager`` starts each upload on a thread pool as soon as it is
+submitted, so page uploads overlap with preprocessing of later pages. Files
+are keyed by the SHA-256 of their bytes: a file already uploaded in this
+session (e.g. the question paper, used by Step 2 and Step 3 and by every
+student) is reused instead of being uploaded again.
+
+Handles are reference counted. ``release`` deletes a remote file once no
+caller needs it (unless it was submitted with ``keep=True``),
+``release_kept`` gives up files kept for an exam that is no longer graded,
+and ``cleanup`` deletes everything that is left (or only the files nobody
+has used for a while). A manager that is garbage collected without being
+closed deletes its files and shuts down its thread pool.
+"""
+import hashlib
+import io
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from evaluation import call_with_retry
+from tracing import span
+
+# Uploaded Gemini files expire after 48 hours; re-upload well before that.
+DEFAULT_MAX_AGE_SECONDS = 46 * 3600
+
+
+def _delete_entry(entry, delete_file):
+    """Delete the remote file of ``entry``; returns whether a file was deleted."""
+    try:
+        handle = entry["future"].result()
+        delete_file(handle.name)
+        return True
+    except Exception:
+        # Files that failed to upload, or were already removed, need no clean-up.
+        return False
+
+
+def _close_abandoned(entries, delete_file, pool):
+    for entry in list(entries.values()):
+        _delete_entry(entry, delete_file)
+    entries.clear()
+    pool.shutdown(wait=False)
+
+
+class UploadManager:
+    def __init__(self, upload_file=None, delete_file=None, max_workers=4, max_age_seconds=DEFAULT_MAX_AGE_SECONDS):
+        if upload_file is None or delete_file is None:
+            import google.generativeai as genai
+            upload_file = upload_file or genai.upload_file
+            delete_file = delete_file or genai.delete_file
+        self.upload_file = upload_file
+        self.delete_file = delete_file
+        self.max_age_seconds = max_age_seconds
+        self.pool = ThreadPoolExecutor(max_workers=max(1, max_workers))
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.stats = {"uploads": 0, "reused": 0, "bytes_uploaded": 0, "upload_seconds": 0.0, "deleted": 0}
+        # Runs if the manager is garbage collected without close(), e.g. when a Streamlit session ends.
+        self._finalizer = weakref.finalize(self, _close_abandoned, self.entries, delete_file, self.pool)
+
+    def _upload(self, data, mime_type, display_name, tracer=None):
+        start = time.perf_counter()
+        with span(tracer, "upload", file=display_name, bytes_sent=len(data), cache_hit=False) as trace:
+            handle = call_with_retry(
+                lambda: self.upload_file(path=io.BytesIO(data), mime_type=mime_type, display_name=display_name),
+                trace=trace
+            )
+        with self.lock:
+            self.stats["uploads"] += 1
+            self.stats["bytes_uploaded"] += len(data)
+            self.stats["upload_seconds"] += time.perf_counter() - start
+        return handle
+
+    def submit(self, data, mime_type, display_name, keep=False, tracer=None):
+        """Start uploading ``data`` (or reuse an earlier upload) and return its key.
+
+        Call ``result(key)`` for the file handle and ``release(key)`` when the
+        caller no longer needs it. Uploads (and reuses, as cache hits) are
+        recorded on ``tracer``.
+        """
+        key = hashlib.sha256(data).hexdigest()
+        stale = None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry["refs"] == 0 and time.time() - entry["created"] > self.max_age_seconds:
+                stale = self.entries.pop(key)
+                entry = None
+            if entry is None:
+                entry = {
+                    "future": self.pool.submit(self._upload, data, mime_type, display_name, tracer),
+                    "refs": 0,
+                    "keep": keep,
+                    "created": time.time(),
+                    "last_used": time.time(),
+                }
+                self.entries[key] = entry
+            else:
+                self.stats["reused"] += 1
+                if tracer is not None:
+                    now = time.time()
+                    tracer.add("upload", now, now, file=display_name, bytes_sent=0, cache_hit=True)
+            entry["refs"] += 1
+            entry["keep"] = entry["keep"] or keep
+            entry["last_used"] = time.time()
+        if stale is not None:
+            self._delete(stale)
+        return key
+
+    def result(self, key):
+        """Block until the upload for ``key`` finishes and return its handle."""
+        with self.lock:
+            future = self.entries[key]["future"]
+        try:
+            return future.result()
+        except Exception:
+            with self.lock:
+                if self.entries.get(key, {}).get("future") is future:
+                    del self.entries[key]
+            raise
+
+    def upload(self, data, mime_type, display_name, keep=False, tracer=None):
+        key = self.submit(data, mime_type, display_name, keep=keep, tracer=tracer)
+        return key, self.result(key)
+
+    def release(self, keys):
+        """Drop one reference to each key, deleting files nobody needs any more."""
+        to_delete = []
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry is None:
+                    continue
+                entry["refs"] -= 1
+                if entry["refs"] <= 0 and not entry["keep"]:
+                    to_delete.append(self.entries.pop(key))
+        for entry in to_delete:
+            self._delete(entry)
+
+    def release_kept(self, keys=None):
+        """Stop keeping ``keys`` (default: every kept file); files no caller still holds are deleted."""
+        to_delete = []
+        with self.lock:
+            for key in list(self.entries) if keys is None else keys:
+                entry = self.entries.get(key)
+                if entry is None or not entry["keep"]:
+                    continue
+                entry["keep"] = False
+                if entry["refs"] <= 0:
+                    to_delete.append(self.entries.pop(key))
+        for entry in to_delete:
+            self._delete(entry)
+
+    def _delete(self, entry):
+        if _delete_entry(entry, self.delete_file):
+            with self.lock:
+                self.stats["deleted"] += 1
+
+    def cleanup(self, idle_seconds=None):
+        """Delete every remaining uploaded file.
+
+        With ``idle_seconds``, only files that no caller holds and that were
+        last submitted more than ``idle_seconds`` ago are deleted (kept ones
+        included); they are uploaded again if they are needed later.
+        """
+        now = time.time()
+        with self.lock:
+            if idle_seconds is None:
+                keys = list(self.entries)
+            else:
+                keys = [key for key, entry in self.entries.items()
+                        if entry["refs"] <= 0 and now - entry["last_used"] > idle_seconds]
+            entries = [self.entries.pop(key) for key in keys]
+        for entry in entries:
+            self._delete(entry)
+
+    def close(self):
+        self._finalizer.detach()
+        self.cleanup()
+        self.pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()